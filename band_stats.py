@@ -0,0 +1,166 @@
+#!/usr/bin/env python
+# -*- encoding: utf-8 -*-
+'''
+@File    :   band_stats.py
+@Time    :   2026/10/19 21:12:05
+@Author  :   StrideH
+@Desc    :   mergeable per-band mean/std/min/max/histogram accumulated while cropping
+'''
+
+import json
+import numpy as np
+
+# 统计文件后缀, 与坐标文件同目录
+STATS_SUFFIX = '_stats.json'
+
+
+# 按波段累计像元数、均值、离差平方和(Welford/Chan并行方差)、最值和直方图, 可跨切片、进程和文件合并
+class BandStats:
+    def __init__(self, bins=256, hist_range=None, nodata=None):
+        '''
+        :param bins: 直方图分箱数(uint8固定为256)
+        :param hist_range: 直方图范围 (min, max), 默认整型按数据类型取值范围, 浮点型不统计直方图
+        :param nodata: 不参与统计的值, 可为NaN; 浮点数据中的NaN和无穷值总是不参与统计
+        '''
+        self.bins = bins
+        self.hist_range = hist_range
+        self.nodata = nodata
+        self.count = None
+        self.mean = None
+        self.m2 = None
+        self.min = None
+        self.max = None
+        self.hist = None
+
+    def _init(self, bands, dtype):
+        self.count = np.zeros(bands, dtype=np.int64)
+        self.mean = np.zeros(bands, dtype=np.float64)
+        self.m2 = np.zeros(bands, dtype=np.float64)
+        self.min = np.full(bands, np.inf)
+        self.max = np.full(bands, -np.inf)
+        if self.hist_range is None and np.issubdtype(dtype, np.integer):
+            if dtype == np.uint8:
+                self.bins = 256
+            info = np.iinfo(dtype)
+            self.hist_range = (float(info.min), float(info.max) + 1)
+        if self.hist_range is not None:
+            self.hist = np.zeros((bands, self.bins), dtype=np.int64)
+
+    # 合并一组(n, mean, m2)
+    def _combine(self, b, n, mean, m2):
+        total = self.count[b] + n
+        delta = mean - self.mean[b]
+        self.mean[b] += delta * n / total
+        self.m2[b] += m2 + delta * delta * self.count[b] * n / total
+        self.count[b] = total
+
+    def update(self, tile):
+        '''
+        :param tile: 切片数组 (波段, 高, 宽), 二维数组视为单波段
+        '''
+        tile = np.asarray(tile)
+        if tile.ndim == 2:
+            tile = tile[np.newaxis]
+        if self.count is None:
+            self._init(tile.shape[0], tile.dtype)
+        elif tile.shape[0] != len(self.count):
+            raise ValueError('tile has {} bands, stats has {}'.format(tile.shape[0], len(self.count)))
+        for b in range(tile.shape[0]):
+            x = tile[b].ravel()
+            if np.issubdtype(x.dtype, np.floating):
+                # NaN != NaN, NaN nodata 同样由此剔除
+                x = x[np.isfinite(x)]
+            if self.nodata is not None and not np.isnan(self.nodata):
+                x = x[x != self.nodata]
+            if x.size == 0:
+                continue
+            xf = x.astype(np.float64)
+            mean = xf.mean()
+            self._combine(b, x.size, mean, np.square(xf - mean).sum())
+            self.min[b] = min(self.min[b], xf.min())
+            self.max[b] = max(self.max[b], xf.max())
+            if self.hist is not None:
+                if x.dtype == np.uint8 and self.bins == 256 and self.hist_range == (0.0, 256.0):
+                    self.hist[b] += np.bincount(x, minlength=256)
+                else:
+                    self.hist[b] += np.histogram(x, bins=self.bins, range=self.hist_range)[0]
+
+    def merge(self, other):
+        if other.count is None:
+            return self
+        if self.count is None:
+            self.bins, self.hist_range = other.bins, other.hist_range
+            self._init(len(other.count), np.float64)
+            self.hist = None if other.hist is None else np.zeros_like(other.hist)
+        if len(other.count) != len(self.count):
+            raise ValueError('cannot merge stats of {} and {} bands'.format(len(self.count), len(other.count)))
+        for b in range(len(self.count)):
+            if other.count[b] > 0:
+                self._combine(b, other.count[b], other.mean[b], other.m2[b])
+        self.min = np.minimum(self.min, other.min)
+        self.max = np.maximum(self.max, other.max)
+        if self.hist is not None and other.hist is not None and self.bins == other.bins and \
+                tuple(self.hist_range) == tuple(other.hist_range):
+            self.hist += other.hist
+        else:
+            # 分箱不一致时直方图无法合并
+            self.hist = None
+        return self
+
+    @property
+    def std(self):
+        return np.sqrt(np.divide(self.m2, self.count, out=np.zeros_like(self.m2), where=self.count > 0))
+
+    def to_dict(self):
+        if self.count is None:
+            return {'bands': 0}
+        return {
+            'bands': len(self.count),
+            'count': self.count.tolist(),
+            'mean': self.mean.tolist(),
+            'std': self.std.tolist(),
+            'm2': self.m2.tolist(),
+            'min': self.min.tolist(),
+            'max': self.max.tolist(),
+            'nodata': self.nodata,
+            'bins': self.bins,
+            'hist_range': None if self.hist is None else list(self.hist_range),
+            'hist': None if self.hist is None else self.hist.tolist(),
+        }
+
+    @classmethod
+    def from_dict(cls, d):
+        stats = cls(d.get('bins', 256), d.get('hist_range'), d.get('nodata'))
+        if d['bands'] == 0:
+            return stats
+        stats.count = np.array(d['count'], dtype=np.int64)
+        stats.mean = np.array(d['mean'], dtype=np.float64)
+        stats.m2 = np.array(d['m2'], dtype=np.float64)
+        stats.min = np.array(d['min'], dtype=np.float64)
+        stats.max = np.array(d['max'], dtype=np.float64)
+        stats.hist = None if d.get('hist') is None else np.array(d['hist'], dtype=np.int64)
+        return stats
+
+    def save(self, path):
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(self.to_dict(), f)
+
+    @classmethod
+    def load(cls, path):
+        with open(path, 'r', encoding='utf-8') as f:
+            return cls.from_dict(json.load(f))
+
+
+# 合并多个统计文件, 波段数不同的分组合并, 返回 {波段数: BandStats}
+def merge_files(paths):
+    groups = {}
+    for path in paths:
+        stats = BandStats.load(path)
+        if stats.count is None:
+            continue
+        bands = len(stats.count)
+        if bands in groups:
+            groups[bands].merge(stats)
+        else:
+            groups[bands] = stats
+    return groups
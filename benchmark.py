@@ -0,0 +1,406 @@
+#!/usr/bin/env python
+# -*- encoding: utf-8 -*-
+'''
+@File    :   benchmark.py
+@Time    :   2026/10/19 10:12:30
+@Author  :   StrideH
+@Desc    :   reproducible benchmark of crop, merge, polygonize and rasterize on synthetic rasters
+'''
+
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import platform
+import subprocess
+import multiprocessing
+from queue import Empty
+import numpy as np
+from osgeo import gdal, osr, ogr
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+REPO_DIR = os.path.dirname(os.path.abspath(__file__))
+if REPO_DIR not in sys.path:
+    sys.path.insert(0, REPO_DIR)
+
+GDAL_TYPES = {'uint8': gdal.GDT_Byte, 'uint16': gdal.GDT_UInt16, 'float32': gdal.GDT_Float32}
+# 合成影像使用的坐标系与分辨率
+EPSG = 32650
+ORIGIN = (500000.0, 3500000.0)
+PIXEL_SIZE = 0.5
+
+
+# 生成合成tif: 低分辨率随机类别图块放大得到的图斑 + 噪声
+def make_tif(path, size, bands=1, dtype='uint8', density=64, seed=0):
+    '''
+    :param path: 输出tif路径
+    :param size: 宽高(像素)
+    :param bands: 波段数
+    :param dtype: 数据类型 uint8/uint16/float32
+    :param density: 每行图斑数, 越大要素越密集
+    :param seed: 随机种子
+    '''
+    rng = np.random.default_rng(seed)
+    cell = max(1, size // density)
+    blocks = rng.integers(0, 4, size=(size // cell + 1, size // cell + 1), dtype=np.uint8)
+    labels = np.kron(blocks, np.ones((cell, cell), dtype=np.uint8))[:size, :size]
+    driver = gdal.GetDriverByName('GTiff')
+    ds = driver.Create(path, size, size, bands, GDAL_TYPES[dtype], options=['TILED=YES'])
+    ds.SetGeoTransform((ORIGIN[0], PIXEL_SIZE, 0, ORIGIN[1], 0, -PIXEL_SIZE))
+    srs = osr.SpatialReference()
+    srs.ImportFromEPSG(EPSG)
+    ds.SetProjection(srs.ExportToWkt())
+    scale = {'uint8': 60, 'uint16': 15000, 'float32': 0.25}[dtype]
+    for b in range(bands):
+        if bands == 1:
+            arr = labels
+        else:
+            arr = labels * scale + rng.integers(0, 10, size=labels.shape)
+        ds.GetRasterBand(b + 1).WriteArray(arr.astype(dtype))
+    ds.FlushCache()
+    ds = None
+    return path
+
+
+# 生成合成png(经由MEM驱动, 支持16位)
+def make_png(path, size, bands=3, dtype='uint8', density=64, seed=0):
+    tmp = '/vsimem/bench_{}.tif'.format(seed)
+    make_tif(tmp, size, bands, dtype, density, seed)
+    gdal.Translate(path, tmp, format='PNG')
+    gdal.Unlink(tmp)
+    return path
+
+
+# 生成与tif范围一致的随机矩形矢量
+def make_shp(path, tif_path, n_features, seed=0):
+    rng = np.random.default_rng(seed)
+    ds = gdal.Open(tif_path)
+    gt = ds.GetGeoTransform()
+    xmin, ymax = gt[0], gt[3]
+    xmax = xmin + ds.RasterXSize * gt[1]
+    ymin = ymax + ds.RasterYSize * gt[5]
+    srs = osr.SpatialReference()
+    srs.ImportFromWkt(ds.GetProjection())
+    ds = None
+    driver = ogr.GetDriverByName('ESRI Shapefile')
+    if os.path.exists(path):
+        driver.DeleteDataSource(path)
+    shp = driver.CreateDataSource(path)
+    layer = shp.CreateLayer(os.path.splitext(os.path.basename(path))[0], srs, ogr.wkbPolygon)
+    span = min(xmax - xmin, ymax - ymin) / 50
+    for _ in range(n_features):
+        x = rng.uniform(xmin, xmax - span)
+        y = rng.uniform(ymin, ymax - span)
+        w, h = rng.uniform(span / 10, span, size=2)
+        ring = ogr.Geometry(ogr.wkbLinearRing)
+        for px, py in ((x, y), (x + w, y), (x + w, y + h), (x, y + h), (x, y)):
+            ring.AddPoint_2D(px, py)
+        poly = ogr.Geometry(ogr.wkbPolygon)
+        poly.AddGeometry(ring)
+        feature = ogr.Feature(layer.GetLayerDefn())
+        feature.SetGeometry(poly)
+        layer.CreateFeature(feature)
+    shp.SyncToDisk()
+    shp = None
+    return path
+
+
+# ---------------------------------------------------------------- 被测函数
+# 每个函数在独立子进程中运行, 参数 inputs 由 prepare 阶段生成
+
+def run_crop_tif(inputs, out_dir, crop_size):
+    from crop_merge_image import GRID
+    GRID.crop_tif(inputs['tif'], out_dir, crop_size, is_supplement=True)
+
+
+def run_crop_image(inputs, out_dir, crop_size):
+    from crop_merge_image import GRID
+    GRID.crop_image(inputs['png'], out_dir, crop_size, is_supplement=True)
+
+
+def run_merge_tif(inputs, out_dir):
+    from crop_merge_image import GRID
+    GRID.merge_tif(inputs['tiles'], os.path.join(out_dir, 'merged.tif'))
+
+
+def run_vector_to_raster(inputs, out_dir):
+    from crop_merge_image import GRID
+    GRID.vector_to_raster(inputs['shp'], os.path.join(out_dir, 'burned.tif'), inputs['tif'], 'single')
+
+
+def run_raster2vector(inputs, out_dir):
+    from crop_merge_image import GRID
+    GRID.raster2vector(inputs['tif'], os.path.join(out_dir, 'polygons.shp'), ignore_values=[0])
+
+
+def run_fast_polygonize(inputs, out_dir, mode, chunks):
+    from fast_polygonize import usage
+    raster = os.path.join(out_dir, 'temp.vrt')
+    gdal.Translate(raster, inputs['tif'], format='VRT', noData=255)
+    usage(mode, chunks, chunks, out_dir, raster).get_opts()
+
+
+TARGETS = {
+    'crop_tif': run_crop_tif,
+    'crop_image': run_crop_image,
+    'merge_tif': run_merge_tif,
+    'vector_to_raster': run_vector_to_raster,
+    'raster2vector': run_raster2vector,
+    'fast_polygonize': run_fast_polygonize,
+}
+
+
+# 冷启动: 在全新解释器中导入模块或运行命令行的耗时
+COLD_START = {
+    'import_crop_merge_image': ['-c', 'import crop_merge_image'],
+    'import_fast_polygonize': ['-c', 'import fast_polygonize'],
+    'cli_help': ['crop_or_mosaic.py', '--help'],
+    'cli_crop_help': ['crop_or_mosaic.py', 'crop', '--help'],
+}
+
+
+def cold_start(repeat=3):
+    results = {}
+    for name, argv in COLD_START.items():
+        times = []
+        code = 0
+        for _ in range(repeat):
+            start = time.perf_counter()
+            code = subprocess.call([sys.executable] + argv, cwd=REPO_DIR, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+            times.append(time.perf_counter() - start)
+        # 取中位数
+        results[name] = {'seconds': sorted(times)[len(times) // 2], 'error': None if code == 0 else 'exit code {}'.format(code)}
+    return results
+
+
+# 峰值内存(MB), 包含子进程
+def peak_rss_mb():
+    if resource is None:
+        return None
+    # linux 单位为KB, macOS 为字节
+    unit = 1024 * 1024 if sys.platform == 'darwin' else 1024
+    self_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    child_rss = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss
+    return max(self_rss, child_rss) / unit
+
+
+def count_files(path):
+    count = 0
+    for _, _, files in os.walk(path):
+        count += len(files)
+    return count
+
+
+def _child(target, inputs, out_dir, kwargs, queue, quiet):
+    if quiet:
+        devnull = open(os.devnull, 'w')
+        sys.stdout = devnull
+        os.dup2(devnull.fileno(), 1)
+    import instrument
+    start = time.perf_counter()
+    error = None
+    try:
+        TARGETS[target](inputs, out_dir, **kwargs)
+    except Exception as e:
+        error = repr(e)
+    seconds = time.perf_counter() - start
+    queue.put({'seconds': seconds, 'peak_rss_mb': peak_rss_mb(), 'error': error, 'stages': instrument.counters()})
+
+
+# 在全新的子进程中运行一个用例, 保证峰值内存互不影响
+# 子进程崩溃(如内存不足被杀)或超时时记为错误, 不会一直等待
+def run_case(case, work_dir, quiet=True, timeout=3600):
+    out_dir = os.path.join(work_dir, 'out', case['name'])
+    if os.path.exists(out_dir):
+        shutil.rmtree(out_dir)
+    os.makedirs(out_dir)
+    ctx = multiprocessing.get_context('spawn')
+    queue = ctx.Queue()
+    proc = ctx.Process(target=_child, args=(case['target'], case['inputs'], out_dir, case['kwargs'], queue, quiet))
+    proc.start()
+    start = time.perf_counter()
+    result = None
+    while result is None:
+        try:
+            result = queue.get(timeout=1)
+        except Empty:
+            if not proc.is_alive():
+                # 退出前写入的结果可能仍在管道中
+                try:
+                    result = queue.get(timeout=1)
+                except Empty:
+                    result = {'error': 'child exited with code {}'.format(proc.exitcode)}
+            elif time.perf_counter() - start > timeout:
+                proc.terminate()
+                result = {'error': 'timeout after {}s'.format(timeout)}
+    proc.join()
+    if result['error'] is None and proc.exitcode != 0:
+        result['error'] = 'child exited with code {}'.format(proc.exitcode)
+    if 'seconds' not in result:
+        result.update({'seconds': time.perf_counter() - start, 'peak_rss_mb': None, 'stages': {}})
+    result.update({
+        'name': case['name'],
+        'target': case['target'],
+        'params': case['params'],
+        'mpix': case['mpix'],
+        'mpix_per_s': case['mpix'] / result['seconds'] if result['seconds'] > 0 else None,
+        'files': count_files(out_dir),
+    })
+    shutil.rmtree(out_dir, ignore_errors=True)
+    return result
+
+
+# 生成用例矩阵及输入数据
+def build_cases(data_dir, sizes, dtypes, bands_list, densities, crop_size, chunks, features):
+    from crop_merge_image import GRID
+    cases = []
+    for size in sizes:
+        mpix = size * size / 1e6
+        for dtype in dtypes:
+            for bands in bands_list:
+                tag = '{}px_{}_{}b'.format(size, dtype, bands)
+                tif = make_tif(os.path.join(data_dir, tag + '.tif'), size, bands, dtype)
+                params = {'size': size, 'dtype': dtype, 'bands': bands, 'crop_size': crop_size}
+                cases.append({'name': 'crop_tif_' + tag, 'target': 'crop_tif', 'inputs': {'tif': tif},
+                              'kwargs': {'crop_size': crop_size}, 'params': params, 'mpix': mpix})
+                # 合并的输入为裁剪结果, 按裁剪尺寸分别缓存
+                tiles = os.path.join(data_dir, '{}_tiles_{}'.format(tag, crop_size))
+                if not os.path.exists(tiles):
+                    GRID.crop_tif(tif, tiles, crop_size, is_supplement=False)
+                    for name in os.listdir(tiles):
+                        if name.endswith('.txt'):
+                            os.remove(os.path.join(tiles, name))
+                cases.append({'name': 'merge_tif_' + tag, 'target': 'merge_tif', 'inputs': {'tiles': tiles},
+                              'kwargs': {}, 'params': params, 'mpix': mpix})
+                if bands in (3, 4) and dtype in ('uint8', 'uint16'):
+                    png = make_png(os.path.join(data_dir, tag + '.png'), size, bands, dtype)
+                    cases.append({'name': 'crop_image_' + tag, 'target': 'crop_image', 'inputs': {'png': png},
+                                  'kwargs': {'crop_size': crop_size}, 'params': params, 'mpix': mpix})
+        for density in densities:
+            tag = '{}px_d{}'.format(size, density)
+            mask = make_tif(os.path.join(data_dir, tag + '_mask.tif'), size, 1, 'uint8', density)
+            params = {'size': size, 'density': density}
+            cases.append({'name': 'raster2vector_' + tag, 'target': 'raster2vector', 'inputs': {'tif': mask},
+                          'kwargs': {}, 'params': params, 'mpix': mpix})
+            for mode in ('single', 'serial', 'parallel'):
+                cases.append({'name': 'fast_polygonize_{}_{}'.format(mode, tag), 'target': 'fast_polygonize',
+                              'inputs': {'tif': mask}, 'kwargs': {'mode': mode, 'chunks': chunks},
+                              'params': dict(params, mode=mode, chunks=chunks), 'mpix': mpix})
+        for n in features:
+            tag = '{}px_f{}'.format(size, n)
+            tif = os.path.join(data_dir, '{}px_d{}_mask.tif'.format(size, densities[0]))
+            if not os.path.exists(tif):
+                make_tif(tif, size, 1, 'uint8', densities[0])
+            shp = make_shp(os.path.join(data_dir, tag + '.shp'), tif, n)
+            cases.append({'name': 'vector_to_raster_' + tag, 'target': 'vector_to_raster',
+                          'inputs': {'shp': shp, 'tif': tif}, 'kwargs': {},
+                          'params': {'size': size, 'features': n}, 'mpix': mpix})
+    return cases
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], cwd=REPO_DIR,
+                                       stderr=subprocess.DEVNULL).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+# 对比两次结果, 输出耗时比值(>1 表示变慢)
+def compare(old_path, new_path, threshold=1.1):
+    with open(old_path, 'r') as f:
+        old_report = json.load(f)
+    old = {r['name']: r for r in old_report['results']}
+    with open(new_path, 'r') as f:
+        new = json.load(f)
+    regressions = 0
+    print('{:<50}{:>10}{:>10}{:>8}'.format('case', 'old(s)', 'new(s)', 'ratio'))
+    for r in new['results']:
+        if r['name'] not in old or r['error'] or old[r['name']]['error']:
+            continue
+        ratio = r['seconds'] / old[r['name']]['seconds']
+        flag = '  <-' if ratio > threshold else ''
+        regressions += ratio > threshold
+        print('{:<50}{:>10.3f}{:>10.3f}{:>8.2f}{}'.format(r['name'], old[r['name']]['seconds'], r['seconds'], ratio, flag))
+    old_cold = old_report.get('cold_start', {})
+    for name, r in new.get('cold_start', {}).items():
+        if name not in old_cold or r['error'] or old_cold[name]['error']:
+            continue
+        ratio = r['seconds'] / old_cold[name]['seconds']
+        flag = '  <-' if ratio > threshold else ''
+        regressions += ratio > threshold
+        print('{:<50}{:>10.3f}{:>10.3f}{:>8.2f}{}'.format('cold_start_' + name, old_cold[name]['seconds'], r['seconds'], ratio, flag))
+    print('{} regressions (> {:.0%} slower).'.format(regressions, threshold - 1))
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmark crop, merge, polygonize and rasterize.')
+    parser.add_argument('--work-dir', default='bench_data', help='synthetic input and scratch directory')
+    parser.add_argument('--output', default='bench_result.json', help='json result file')
+    parser.add_argument('--sizes', type=int, nargs='+', default=[1024, 4096])
+    parser.add_argument('--dtypes', nargs='+', default=['uint8', 'uint16'], choices=list(GDAL_TYPES))
+    parser.add_argument('--bands', type=int, nargs='+', default=[1, 3, 4])
+    parser.add_argument('--densities', type=int, nargs='+', default=[16, 256], help='features per row of mask')
+    parser.add_argument('--features', type=int, nargs='+', default=[100, 10000], help='polygons for rasterize')
+    parser.add_argument('--crop-size', type=int, default=256)
+    parser.add_argument('--chunks', type=int, default=3, help='fast_polygonize x/y chunks')
+    parser.add_argument('--filter', default=None, help='only run cases whose name contains this string')
+    parser.add_argument('--compare', default=None, help='previous json result to compare against')
+    parser.add_argument('--verbose', action='store_true', help='show output of benchmarked functions')
+    parser.add_argument('--timeout', type=int, default=3600, help='seconds before a case is killed and recorded as an error')
+    parser.add_argument('--cold-start-repeat', type=int, default=3, help='runs per cold-start case, 0 to skip')
+    args = parser.parse_args(argv)
+
+    work_dir = os.path.abspath(args.work_dir)
+    data_dir = os.path.join(work_dir, 'data')
+    os.makedirs(data_dir, exist_ok=True)
+    cases = build_cases(data_dir, args.sizes, args.dtypes, args.bands, args.densities,
+                        args.crop_size, args.chunks, args.features)
+    if args.filter:
+        cases = [c for c in cases if args.filter in c['name']]
+
+    results = []
+    for case in cases:
+        result = run_case(case, work_dir, quiet=not args.verbose, timeout=args.timeout)
+        results.append(result)
+        if result['error']:
+            print('{:<50} error: {}'.format(case['name'], result['error']))
+        else:
+            print('{:<50}{:>9.3f}s{:>10.2f} MPix/s{:>10} files{:>9} MB'.format(
+                case['name'], result['seconds'], result['mpix_per_s'], result['files'],
+                '-' if result['peak_rss_mb'] is None else '{:.0f}'.format(result['peak_rss_mb'])))
+
+    cold = cold_start(args.cold_start_repeat) if args.cold_start_repeat > 0 else {}
+    for name, result in cold.items():
+        if result['error']:
+            print('{:<50} error: {}'.format('cold_start_' + name, result['error']))
+        else:
+            print('{:<50}{:>9.3f}s'.format('cold_start_' + name, result['seconds']))
+
+    report = {
+        'commit': git_commit(),
+        'time': time.strftime('%Y-%m-%d %H:%M:%S'),
+        'python': platform.python_version(),
+        'gdal': gdal.__version__,
+        'numpy': np.__version__,
+        'platform': platform.platform(),
+        'cpu_count': os.cpu_count(),
+        'results': results,
+        'cold_start': cold,
+    }
+    with open(args.output, 'w') as f:
+        json.dump(report, f, indent=2)
+    print('Success benchmark {} cases. save path: {}'.format(len(results), args.output))
+    if args.compare:
+        compare(args.compare, args.output)
+
+
+if __name__ == '__main__':
+    main()
@@ -7,21 +7,162 @@
 @Desc    :   crop .tif file with different channels
 '''
 import os
-from osgeo import gdal, osr
+import re
+import ast
+import time
+from osgeo import gdal, osr, gdal_array
 import numpy as np
+import instrument
 
-def crop_tif(file_path, save_path, crop_size, is_supplement=False, crop_channel = 'all'):
+# 预设通道组合, 波段号从1开始
+CHANNEL_PRESETS = {
+    'RGB': [1, 2, 3],
+    'R': [1],
+    'G': [2],
+    'B': [3],
+    'NIR': [4],
+}
+
+# 波段表达式中允许使用的函数
+EXPR_FUNCS = {
+    'abs': np.abs,
+    'sqrt': np.sqrt,
+    'log': np.log,
+    'exp': np.exp,
+    'minimum': np.minimum,
+    'maximum': np.maximum,
+    'clip': np.clip,
+    'where': np.where,
+}
+
+_BIN_OPS = {
+    ast.Add: np.add,
+    ast.Sub: np.subtract,
+    ast.Mult: np.multiply,
+    ast.Div: np.true_divide,
+    ast.Pow: np.power,
+    ast.Gt: np.greater,
+    ast.GtE: np.greater_equal,
+    ast.Lt: np.less,
+    ast.LtE: np.less_equal,
+    ast.Eq: np.equal,
+    ast.NotEq: np.not_equal,
+}
+
+
+# 解析波段表达式, 如 '(b4-b3)/(b4+b3)', 返回 (用到的波段号, 计算函数)
+def compile_expression(expr):
+    '''
+    :param expr: 波段表达式, bN 表示第N波段, 支持 + - * / ** 比较运算及 EXPR_FUNCS 中的函数
+    :return: (sorted band numbers, func(bands: dict{N: ndarray}) -> ndarray)
+    '''
+    tree = ast.parse(expr, mode='eval')
+    bands = set()
+
+    def build(node):
+        if isinstance(node, ast.Expression):
+            return build(node.body)
+        if isinstance(node, ast.Constant) and isinstance(node.value, (int, float)):
+            value = node.value
+            return lambda b: value
+        if isinstance(node, ast.Name):
+            m = re.fullmatch(r'b(\d+)', node.id)
+            if m is None:
+                raise ValueError('unknown name {} in expression {}'.format(node.id, expr))
+            n = int(m.group(1))
+            bands.add(n)
+            return lambda b: b[n]
+        if isinstance(node, ast.UnaryOp) and isinstance(node.op, (ast.USub, ast.UAdd)):
+            operand = build(node.operand)
+            sign = -1 if isinstance(node.op, ast.USub) else 1
+            return lambda b: sign * operand(b)
+        if isinstance(node, ast.BinOp) and type(node.op) in _BIN_OPS:
+            op, left, right = _BIN_OPS[type(node.op)], build(node.left), build(node.right)
+            return lambda b: op(left(b), right(b))
+        if isinstance(node, ast.Compare) and len(node.ops) == 1 and type(node.ops[0]) in _BIN_OPS:
+            op, left, right = _BIN_OPS[type(node.ops[0])], build(node.left), build(node.comparators[0])
+            return lambda b: op(left(b), right(b))
+        if isinstance(node, ast.Call) and isinstance(node.func, ast.Name) and node.func.id in EXPR_FUNCS and not node.keywords:
+            func, args = EXPR_FUNCS[node.func.id], [build(arg) for arg in node.args]
+            return lambda b: func(*[arg(b) for arg in args])
+        raise ValueError('unsupported syntax in expression {}'.format(expr))
+
+    func = build(tree)
+    return sorted(bands), func
+
+
+# 解析crop_channel, 返回需要读取的波段列表及每个输出通道的计算方式
+def parse_channels(crop_channel, channel):
+    '''
+    :param crop_channel: 预设名称 / 波段号 / 表达式 / 以上组成的列表
+    :param channel: 原图波段数
+    :return: (read_bands, outputs), outputs 中每项为 ('band', N) 或 ('expr', func)
+    '''
+    if crop_channel == 'all':
+        items = list(range(1, channel + 1))
+    elif isinstance(crop_channel, str) and crop_channel in CHANNEL_PRESETS:
+        items = CHANNEL_PRESETS[crop_channel]
+    elif isinstance(crop_channel, (str, int)):
+        items = [crop_channel]
+    else:
+        items = list(crop_channel)
+    read_bands = set()
+    outputs = []
+    for item in items:
+        if isinstance(item, str) and item.isdigit():
+            item = int(item)
+        if isinstance(item, str):
+            bands, func = compile_expression(item)
+            read_bands.update(bands)
+            outputs.append(('expr', func))
+        else:
+            read_bands.add(int(item))
+            outputs.append(('band', int(item)))
+    for n in read_bands:
+        if n < 1 or n > channel:
+            raise ValueError('band {} out of range, image has {} bands'.format(n, channel))
+    return sorted(read_bands), outputs
+
+
+# 获取(必要时构建)影像金字塔, 返回 {缩放倍数: 金字塔序号}
+def build_overviews(dataset, factors, resampling='AVERAGE'):
+    '''
+    :param dataset: gdal数据集(只读打开时金字塔写入外部.ovr文件)
+    :param factors: 需要的缩放倍数, 如[2, 4]
+    :param resampling: 金字塔重采样方式
+    :return: {factor: overview index}
+    '''
+    def existing():
+        band = dataset.GetRasterBand(1)
+        levels = {}
+        for k in range(band.GetOverviewCount()):
+            levels[int(round(dataset.RasterXSize / band.GetOverview(k).XSize))] = k
+        return levels
+
+    levels = existing()
+    missing = sorted(set(f for f in factors if f > 1 and f not in levels))
+    if missing:
+        print('Build overviews {} for {}'.format(missing, dataset.GetDescription()))
+        with instrument.timer('crop_different_channels', 'compute'):
+            dataset.BuildOverviews(resampling, missing)
+        levels = existing()
+    return levels
+
+
+def crop_tif(file_path, save_path, crop_size, is_supplement=False, crop_channel = 'all', out_dtype=None,
+             pyramid_levels=None, resampling='AVERAGE'):
     '''
     :param file_path: 待切割tif文件路径
     :param save_path: 切割后保存路径
     :param crop_size: 切割尺寸
     :param is_supplement: 是否补全切割
-    :param crop_model: 切割模式, all为全部通道切割, RGB为RGB通道切割, R为R通道切割, G为G通道切割, B为B通道切割, NIR为NIR通道切割
+    :param crop_channel: 切割通道, 可为预设(all为全部通道, RGB, R, G, B, NIR)、波段号列表如[4, 3, 2]、
+                         波段表达式如'(b4-b3)/(b4+b3)', 或波段号与表达式混合的列表, 每一项输出一个通道
+    :param out_dtype: 输出数据类型, 如'uint8', 'float32'; 默认只有波段时与原图一致, 含表达式时为float32
+    :param pyramid_levels: 金字塔模式, 缩放倍数列表如[1, 2, 4], 每一级从影像金字塔读取并裁剪到 save_path/level_倍数
+    :param resampling: 构建缺失金字塔时的重采样方式
     :return: 切割结果, 文件名: 原始文件名_行号_列号.tif
     '''
-    # 获取文件名
-    file_dir, file_name_ex = os.path.split(file_path)
-    file_name, extension = os.path.splitext(file_name_ex)
     # 保存路径存在
     if not os.path.exists(save_path):
         os.makedirs(save_path)
@@ -31,6 +172,36 @@ def crop_tif(file_path, save_path, crop_size, is_supplement=False, crop_channel
     except:
         print('Error: {} not exist or image format is wrong.'.format(file_path))
         return
+    if dataset is None:
+        print('Error: {} not exist or image format is wrong.'.format(file_path))
+        return
+    if not pyramid_levels:
+        crop_dataset(dataset, file_path, save_path, crop_size, is_supplement, crop_channel, out_dtype)
+        return
+
+    # 金字塔模式: 只构建一次金字塔, 各级直接读取金字塔而非对原图降采样
+    overviews = build_overviews(dataset, pyramid_levels, resampling)
+    for factor in sorted(set(pyramid_levels)):
+        level_path = os.path.join(save_path, 'level_{}'.format(factor))
+        if factor == 1:
+            level_ds = dataset
+        elif factor in overviews:
+            # 以独立数据集方式打开某一级金字塔, 其地理参考已按倍数缩放
+            level_ds = gdal.OpenEx(file_path, gdal.OF_RASTER, open_options=['OVERVIEW_LEVEL={}'.format(overviews[factor])])
+        else:
+            print('Error: overview x{} not available for {}'.format(factor, file_path))
+            continue
+        if not os.path.exists(level_path):
+            os.makedirs(level_path)
+        crop_dataset(level_ds, file_path, level_path, crop_size, is_supplement, crop_channel, out_dtype)
+        level_ds = None
+
+
+# 裁剪已打开的数据集(原图或某一级金字塔)
+def crop_dataset(dataset, file_path, save_path, crop_size, is_supplement=False, crop_channel='all', out_dtype=None):
+    # 获取文件名
+    file_dir, file_name_ex = os.path.split(file_path)
+    file_name, extension = os.path.splitext(file_name_ex)
     # 获取tif的基本信息
     width = dataset.RasterXSize
     height = dataset.RasterYSize
@@ -40,7 +211,7 @@ def crop_tif(file_path, save_path, crop_size, is_supplement=False, crop_channel
         print('Error: width or height < crop_size.')
         return
     if channel == 1:
-        crop_channel == 'all'
+        crop_channel = 'all'
     ori_transform = dataset.GetGeoTransform()
     proj = dataset.GetProjection()
     top_left_x = ori_transform[0]  # 左上角x坐标
@@ -50,33 +221,26 @@ def crop_tif(file_path, save_path, crop_size, is_supplement=False, crop_channel
     pcs = osr.SpatialReference()
     pcs.ImportFromWkt(proj)
 
-    # 读取原图中的每个波段，通道数从1开始
-    in_band = []
     # 单波段Tif需要先进行色域转换，位深转为1位
     if channel == 1:
-        img = dataset.GetRasterBand(1).ReadAsArray()
+        with instrument.timer('crop_different_channels', 'read'):
+            img = dataset.GetRasterBand(1).ReadAsArray()
         img = np.array(img, dtype=np.uint8)
         max_color = np.max(img)
-        img = np.where(img == max_color, 0, 255)
-        in_band.append(img)
+        img = np.where(img == max_color, 0, 255).astype(np.uint8)
+        out_type = gdal.GDT_Byte
     else:
-        if crop_channel == 'all':
-            for i in range(channel):
-                in_band.append(dataset.GetRasterBand(i + 1))
-        elif crop_channel == 'RGB':
-            for i in range(3):
-                in_band.append(dataset.GetRasterBand(i + 1))
-        elif crop_channel == 'R':
-            in_band.append(dataset.GetRasterBand(1))
-        elif crop_channel == 'G':
-            in_band.append(dataset.GetRasterBand(2))
-        elif crop_channel == 'B':
-            in_band.append(dataset.GetRasterBand(3))
-        elif crop_channel == 'NIR' and channel == 4:
-            in_band.append(dataset.GetRasterBand(4))
-        else:
-            print('Error: crop_channel is wrong.')
+        # 解析需要读取的波段(通道数从1开始)及输出通道
+        try:
+            read_bands, outputs = parse_channels(crop_channel, channel)
+        except (ValueError, SyntaxError) as e:
+            print('Error: crop_channel is wrong. {}'.format(e))
             return
+        if out_dtype is None:
+            has_expr = any(kind == 'expr' for kind, _ in outputs)
+            out_dtype = np.float32 if has_expr else gdal_array.GDALTypeCodeToNumericTypeCode(dataset.GetRasterBand(1).DataType)
+        out_dtype = np.dtype(out_dtype)
+        out_type = gdal_array.NumericTypeCodeToGDALTypeCode(out_dtype)
     # 是否需要最后不足补充，进行反向裁剪
     wb = False
     hb = False
@@ -109,52 +273,60 @@ def crop_tif(file_path, save_path, crop_size, is_supplement=False, crop_channel
             offset_y = crop_size * j
             if j == num_height - 1 and hb:
                 offset_y = height - crop_size
+            tile_start = time.perf_counter()
             # 读取裁剪区域
             out_band = []
             # 单波段Tif单独处理
             if channel == 1:
-                out_band.append(in_band[0][offset_y: offset_y + crop_size, offset_x: offset_x + crop_size])
+                out_band.append(img[offset_y: offset_y + crop_size, offset_x: offset_x + crop_size])
             else:
-                for k in range(len(in_band)):
-                    out_band.append(in_band[k].ReadAsArray(offset_x, offset_y, crop_size, crop_size))
+                # 一次读取所有需要的波段
+                with instrument.timer('crop_different_channels', 'read'):
+                    window = dataset.ReadAsArray(offset_x, offset_y, crop_size, crop_size, band_list=read_bands)
+                window = window.reshape(len(read_bands), crop_size, crop_size)
+                with instrument.timer('crop_different_channels', 'compute'):
+                    bands = dict(zip(read_bands, window))
+                    with np.errstate(divide='ignore', invalid='ignore'):
+                        for kind, item in outputs:
+                            if kind == 'band':
+                                out_band.append(bands[item].astype(out_dtype, copy=False))
+                            else:
+                                value = item({n: b.astype(np.float32) for n, b in bands.items()})
+                                out_band.append(np.broadcast_to(value, (crop_size, crop_size)).astype(out_dtype))
+            tile_bytes = sum(band.nbytes for band in out_band)
             # 保存为 save_path/原文件名_裁剪行号_裁剪列号.tif
-            gtif_driver = gdal.GetDriverByName('GTiff')
             output_name = os.path.join(save_path, '{}_{}_{}'.format(file_name, j, i) + extension)
-            if channel == 1:
-                out_data = gtif_driver.Create(output_name, crop_size, crop_size, 1, gdal.GDT_Byte)
-            else:
-                out_data = gtif_driver.Create(output_name, crop_size, crop_size, len(out_band), in_band[0].DataType)
-            print("create new tif file succeed, file name is {}".format(output_name))
             # 设置裁剪区域的地理参考
             top_left_x1 = top_left_x + offset_x * w_e_pixel_resolution
             top_left_y1 = top_left_y + offset_y * n_s_pixel_resolution
             new_transform = (top_left_x1, ori_transform[1], ori_transform[2], top_left_y1, ori_transform[4], ori_transform[5])
-            out_data.SetGeoTransform(new_transform)
-            # 设置SRS属性（投影信息）
-            out_data.SetProjection(proj)
-            # 构建金字塔
-            # out_data.BuildOverviews("NEAREST", [2, 4, 8, 16, 32, 64])
-            # 将投影信息和坐标信息写入到txt文件中, 格式为“文件名_投影信息_地理参考六参数”
-            f.write('{}*_&{}*_&{}*_&{}*_&{}*_&{}*_&{}*_&{}'.format(output_name, proj, top_left_x1, ori_transform[1], ori_transform[2], top_left_y1, ori_transform[4], ori_transform[5]))
-            f.write('\n')
-            # 写入裁剪区域
-            for k in range(len(out_band)):
-                out_data.GetRasterBand(k + 1).WriteArray(out_band[k])
-            # 将缓存写入磁盘，直接保存
-            out_data.FlushCache()
-            del out_data
+            with instrument.timer('crop_different_channels', 'write', tile_bytes):
+                gtif_driver = gdal.GetDriverByName('GTiff')
+                out_data = gtif_driver.Create(output_name, crop_size, crop_size, len(out_band), out_type)
+                out_data.SetGeoTransform(new_transform)
+                # 设置SRS属性（投影信息）
+                out_data.SetProjection(proj)
+                # 将投影信息和坐标信息写入到txt文件中, 格式为“文件名_投影信息_地理参考六参数”
+                f.write('{}*_&{}*_&{}*_&{}*_&{}*_&{}*_&{}*_&{}'.format(output_name, proj, top_left_x1, ori_transform[1], ori_transform[2], top_left_y1, ori_transform[4], ori_transform[5]))
+                f.write('\n')
+                # 写入裁剪区域
+                for k in range(len(out_band)):
+                    out_data.GetRasterBand(k + 1).WriteArray(out_band[k])
+                # 将缓存写入磁盘，直接保存
+                out_data.FlushCache()
+                del out_data
+            instrument.emit('crop_different_channels', tile=output_name, bytes=tile_bytes, duration=time.perf_counter() - tile_start)
     f.close()
     print('Success crop {} images.'.format(count))
 
 if __name__ == '__main__':
-    # 文件路径
-    file_path = r'C:\Users\69452\Desktop\mon\10.7日任务\裁剪测试数据\band3.tif'
-    # 保存路径
-    save_path = r'C:\Users\69452\Desktop\mon\10.7日任务\裁剪结果'
-    # 裁剪大小
-    crop_size = 512
+    import argparse
+    parser = argparse.ArgumentParser(description='Crop tif by channel preset, band list or band expression.')
+    parser.add_argument('file_path', help='文件路径')
+    parser.add_argument('save_path', help='保存路径')
+    parser.add_argument('--size', type=int, default=512, help='裁剪大小')
     # 是否需要最后不足补充，进行反向裁剪
-    is_supplement = True
+    parser.add_argument('--supplement', action='store_true', help='是否需要最后不足补充，进行反向裁剪')
     # crop_channel 六种裁剪通道方式
     # all 裁剪全部通道
     # RGB 裁剪RGB三通道
@@ -162,4 +334,13 @@ if __name__ == '__main__':
     # G 裁剪G通道
     # B 裁剪B通道
     # NIR 裁剪NIR通道
-    crop_tif(file_path, save_path, crop_size, is_supplement, crop_channel='all')
\ No newline at end of file
+    # 也可以是波段号列表及波段表达式, 如 4 3 2 "(b4-b3)/(b4+b3)"
+    parser.add_argument('--channel', nargs='+', default=['all'], help='裁剪通道方式')
+    parser.add_argument('--dtype', default=None, help='输出数据类型')
+    # 金字塔模式, 如0.5m影像同时输出0.5m, 1m, 2m三级切片: --pyramid 1 2 4
+    parser.add_argument('--pyramid', type=int, nargs='+', default=None, help='金字塔级别')
+    args = parser.parse_args()
+    channel = args.channel[0] if len(args.channel) == 1 and not args.channel[0].isdigit() else \
+        [int(v) if v.isdigit() else v for v in args.channel]
+    crop_tif(args.file_path, args.save_path, args.size, args.supplement, crop_channel=channel,
+             out_dtype=args.dtype, pyramid_levels=args.pyramid)
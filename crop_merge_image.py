@@ -8,87 +8,248 @@
 '''
 
 import os
-from skimage import io
-import geopandas as gpd
-from osgeo import gdal, osr, ogr
-from affine import Affine
+import zlib
+import struct
+import hashlib
+from io import StringIO
+from osgeo import gdal, osr, ogr, gdal_array
 import numpy as np
-from PIL import Image
-import rasterio as rio
-from rasterio import features
 import time
+import math
+import threading
+from bisect import bisect_right
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+import instrument
+import tile_store
+import tile_index
+import band_stats
+# skimage, PIL, geopandas, rasterio, affine 在用到的方法内导入, 减少启动时间
+
+# crop_image 可选的快速无损切片格式
+TILE_FORMATS = ('png', 'tif', 'npy')
 
 class GRID:
-    # 裁剪jpg或png图片
+    # 裁剪jpg或png图片(保持数据类型和波段数, 支持16位和多波段)
     @staticmethod
-    def crop_image(file_path, save_path, crop_size, is_supplement = False):
+    def crop_image(file_path, save_path, crop_size, is_supplement = False, container=None, shard_size=1000, stats=False,
+                   fast_format=None, png_compression=None):
         """
         :param file_path: 图片路径
         :param save_path: 保存路径
         :param crop_size: 裁剪尺寸
         :param is_supplement: 是否补全
-        :return: 裁剪结果, 文件名: 原始文件名_行号_列号.jpg or png
+        :param container: 容器输出, None为每个切片一个文件, 'tar'为定长tar分片, 'h5'为HDF5数组, 索引为 原始文件名_index.txt
+        :param shard_size: tar分片的切片数
+        :param stats: 是否在裁剪时累计各波段均值、标准差、最值和直方图(补全切片的重叠部分只统计一次),
+                      保存为 原始文件名_stats.json; 为字符串时作为统计文件名
+        :param fast_format: 切片格式, None为与原图相同; 中间数据集可选快速无损格式:
+                            'png'(压缩级别png_compression), 'tif'(不压缩), 'npy'(原始数组)
+        :param png_compression: png压缩级别(0-9), 越小编码越快; 默认使用编码器默认级别, fast_format='png'时默认为1
+        :return: 裁剪结果, 文件名: 原始文件名_行号_列号 + 原图或fast_format后缀
         """
         # 获取文件名
         file_dir, file_name_ex = os.path.split(file_path)
         file_name, extension = os.path.splitext(file_name_ex)
-
-        '''测试'''
-        extension = '.jpg'
+        if fast_format is not None:
+            if fast_format not in TILE_FORMATS:
+                print('Error: fast_format must be one of {}.'.format(', '.join(TILE_FORMATS)))
+                return
+            extension = '.' + fast_format
+            if fast_format == 'png' and png_compression is None:
+                png_compression = 1
 
         # 保存路径存在
         if not os.path.exists(save_path):
             os.makedirs(save_path)
-        # 读取图片
+        # 读取图片, png经read_png16读取以保留16位多波段
         try:
-            img = io.imread(file_path)
+            with instrument.timer('crop_image', 'read'):
+                img = GRID.read_tile(file_path)
         except:
             print('Error: {} not exist or image format is wrong.'.format(file_path))
             return
-        # 图片必须大于裁剪尺寸，必须为3通道
-        if len(img.shape) == 3:
-            width, height, channel= img.shape
-            print(img.shape)
-            if width < crop_size or height < crop_size:
-                print('Error: width or height < crop_size.')
-                return
-            # 是否补全裁剪
-            wb = False
-            hb = False
-            num_width = width // crop_size
-            num_height = height // crop_size
-            if is_supplement:
-                if width % crop_size != 0:
-                    num_width += 1
-                    wb = True
-                if height % crop_size != 0:
-                    num_height += 1
-                    hb = True
+        # 单波段(行, 列)或多波段(行, 列, 波段), 保持原数据类型
+        if img.ndim not in (2, 3):
+            print('Error: img.shape = {}'.format(img.shape))
+            return
+        rows, cols = img.shape[:2]
+        channel = 1 if img.ndim == 2 else img.shape[2]
+        if rows < crop_size or cols < crop_size:
+            print('Error: width or height < crop_size.')
+            return
+        if fast_format == 'png' and not GRID.png_supported(img.dtype, channel):
+            print('Error: png cannot store {} channel {} tiles, use fast_format="tif" or "npy".'.format(channel, img.dtype))
+            return
+        # 是否补全裁剪
+        rb = False
+        cb = False
+        num_rows = rows // crop_size
+        num_cols = cols // crop_size
+        if is_supplement:
+            if rows % crop_size != 0:
+                num_rows += 1
+                rb = True
+            if cols % crop_size != 0:
+                num_cols += 1
+                cb = True
 
-            # 裁剪
-            print('---------------------------------------------------------------------')
-            print('Start crop file: {}'.format(file_path))
-            print('width: {}, height: {}, channel: {}'.format(width, height, channel))
-            print('---------------------------------------------------------------------')
-            p = 0
-            for i in range(num_width):
-                offset_width = i * crop_size
-                if wb and i == num_width - 1:
-                    offset_width = width - crop_size
-                for j in range(num_height):
-                    offset_height = j * crop_size
-                    if hb and j == num_height - 1:
-                        offset_height = height - crop_size
-                    # 裁成三通道
-                    cropped = img[offset_width: offset_width + crop_size, offset_height: offset_height + crop_size, :3]
-                    # 保存为 原文件名_裁剪行号_裁剪列号.tif
-                    io.imsave(os.path.join(save_path, '{}_{}_{}'.format(file_name, i, j) + extension), cropped)
-                    p += 1
-                    print('Crop {} image: {}_{}_{}'.format(p, file_name, i, j) + extension)
-            print('Success crop {} images.'.format(p))
+        # 裁剪
+        print('---------------------------------------------------------------------')
+        print('Start crop file: {}'.format(file_path))
+        print('width: {}, height: {}, channel: {}, dtype: {}'.format(cols, rows, channel, img.dtype))
+        print('---------------------------------------------------------------------')
+        store = tile_store.create_writer(container, save_path, file_name, shard_size) if container else None
+        accumulator = band_stats.BandStats() if stats else None
+        p = 0
+        for i in range(num_rows):
+            offset_row = i * crop_size
+            if rb and i == num_rows - 1:
+                offset_row = rows - crop_size
+            for j in range(num_cols):
+                offset_col = j * crop_size
+                if cb and j == num_cols - 1:
+                    offset_col = cols - crop_size
+                tile_start = time.perf_counter()
+                # 保留全部波段
+                cropped = img[offset_row: offset_row + crop_size, offset_col: offset_col + crop_size]
+                if accumulator is not None:
+                    with instrument.timer('crop_image', 'compute'):
+                        # 补全切片与前一切片重叠, 只统计不重叠的部分, 原图每个像元只计一次
+                        part = cropped[i * crop_size - offset_row:, j * crop_size - offset_col:]
+                        accumulator.update(part if part.ndim == 2 else np.moveaxis(part, -1, 0))
+                # 保存为 原文件名_裁剪行号_裁剪列号 (编码与写入)
+                tile_name = '{}_{}_{}'.format(file_name, i, j) + extension
+                if store is not None:
+                    tile_name = '{}_{}_{}'.format(file_name, i, j)
+                    with instrument.timer('crop_image', 'write', cropped.nbytes):
+                        store.add(tile_name, cropped)
+                else:
+                    with instrument.timer('crop_image', 'encode', cropped.nbytes):
+                        GRID.save_tile(os.path.join(save_path, tile_name), cropped, png_compression)
+                p += 1
+                instrument.emit('crop_image', tile=tile_name, bytes=cropped.nbytes, duration=time.perf_counter() - tile_start)
+        if store is not None:
+            store.close()
+        if accumulator is not None:
+            accumulator.save(os.path.join(save_path, stats if isinstance(stats, str) else file_name + band_stats.STATS_SUFFIX))
+        print('Success crop {} images.'.format(p))
+
+    # png可保存的切片: 8位或16位, 1-4波段(灰度、灰度+透明、RGB、RGBA)
+    @staticmethod
+    def png_supported(dtype, channel):
+        return dtype in (np.uint8, np.uint16) and channel in (1, 2, 3, 4)
+
+    # 16位png编码(PIL不支持16位多波段): 每行前加过滤类型0, 大端序, zlib压缩
+    @staticmethod
+    def write_png16(path, tile, level=None):
+        if tile.ndim == 2:
+            tile = tile[..., np.newaxis]
+        height, width, channel = tile.shape
+        color_type = {1: 0, 2: 4, 3: 2, 4: 6}[channel]
+        rows = np.ascontiguousarray(tile, dtype='>u2').view(np.uint8).reshape(height, width * channel * 2)
+        raw = np.concatenate([np.zeros((height, 1), dtype=np.uint8), rows], axis=1).tobytes()
+
+        def chunk(kind, data):
+            return struct.pack('>I', len(data)) + kind + data + struct.pack('>I', zlib.crc32(kind + data) & 0xffffffff)
+
+        with open(path, 'wb') as f:
+            f.write(b'\x89PNG\r\n\x1a\n')
+            f.write(chunk(b'IHDR', struct.pack('>IIBBBBB', width, height, 16, color_type, 0, 0, 0)))
+            f.write(chunk(b'IDAT', zlib.compress(raw, -1 if level is None else level)))
+            f.write(chunk(b'IEND', b''))
+
+    # 读取16位多波段png(skimage/PIL会转为8位), 非16位或隔行扫描的png返回None
+    @staticmethod
+    def read_png16(path):
+        with open(path, 'rb') as f:
+            data = f.read()
+        if data[:8] != b'\x89PNG\r\n\x1a\n':
+            return None
+        pos = 8
+        header = None
+        idat = []
+        while pos < len(data):
+            length, kind = struct.unpack('>I4s', data[pos: pos + 8])
+            if kind == b'IHDR':
+                header = struct.unpack('>IIBBBBB', data[pos + 8: pos + 21])
+            elif kind == b'IDAT':
+                idat.append(data[pos + 8: pos + 8 + length])
+            elif kind == b'IEND':
+                break
+            pos += 12 + length
+        width, height, depth, color_type, _, _, interlace = header
+        channel = {0: 1, 4: 2, 2: 3, 6: 4}.get(color_type)
+        if depth != 16 or channel is None or interlace:
+            return None
+        bpp = channel * 2
+        stride = width * bpp
+        raw = np.frombuffer(zlib.decompress(b''.join(idat)), dtype=np.uint8).reshape(height, stride + 1)
+        out = np.zeros((height, stride), dtype=np.uint8)
+        prev = np.zeros(stride, dtype=np.int32)
+        # 逐行反过滤: 0无, 1左, 2上, 3平均, 4Paeth
+        for r in range(height):
+            kind = raw[r, 0]
+            line = raw[r, 1:].astype(np.int32)
+            if kind == 1:
+                line = np.cumsum(line.reshape(width, bpp), axis=0).ravel() % 256
+            elif kind == 2:
+                line = (line + prev) % 256
+            elif kind in (3, 4):
+                line = line.copy()
+                for x in range(0, stride, bpp):
+                    a = line[x - bpp: x] if x else np.zeros(bpp, dtype=np.int32)
+                    b = prev[x: x + bpp]
+                    if kind == 3:
+                        line[x: x + bpp] = (line[x: x + bpp] + (a + b) // 2) % 256
+                    else:
+                        c = prev[x - bpp: x] if x else np.zeros(bpp, dtype=np.int32)
+                        pa, pb, pc = np.abs(b - c), np.abs(a - c), np.abs(a + b - 2 * c)
+                        pred = np.where((pa <= pb) & (pa <= pc), a, np.where(pb <= pc, b, c))
+                        line[x: x + bpp] = (line[x: x + bpp] + pred) % 256
+            out[r] = line
+            prev = line
+        tile = out.view('>u2').reshape(height, width, channel).astype(np.uint16)
+        return tile[..., 0] if channel == 1 else tile
+
+    # 按后缀保存切片, 不改变数据类型和波段数
+    @staticmethod
+    def save_tile(path, tile, png_compression=None):
+        extension = os.path.splitext(path)[1].lower()
+        channel = 1 if tile.ndim == 2 else tile.shape[2]
+        if extension == '.npy':
+            np.save(path, tile)
+        elif extension in ('.tif', '.tiff'):
+            # 不压缩, 波段交叉存储
+            import tifffile
+            photometric = 'rgb' if tile.ndim == 3 and tile.shape[2] == 3 and tile.dtype == np.uint8 else 'minisblack'
+            tifffile.imwrite(path, tile, photometric=photometric, planarconfig='contig' if tile.ndim == 3 else None)
+        elif extension == '.png' and GRID.png_supported(tile.dtype, channel):
+            if tile.dtype == np.uint16:
+                GRID.write_png16(path, tile, png_compression)
+                return
+            from PIL import Image
+            if tile.ndim == 3 and tile.shape[2] == 1:
+                tile = tile[..., 0]
+            # 未指定压缩级别时保持PIL默认
+            options = {} if png_compression is None else {'compress_level': png_compression}
+            Image.fromarray(tile).save(path, **options)
         else:
-            print('Error: img.shape = {}'.format(img.shape))
-    
+            from skimage import io
+            io.imsave(path, tile, check_contrast=False)
+
+    # 按后缀读取切片
+    @staticmethod
+    def read_tile(path):
+        if path.lower().endswith('.npy'):
+            return np.load(path)
+        if path.lower().endswith('.png'):
+            tile = GRID.read_png16(path)
+            if tile is not None:
+                return tile
+        from skimage import io
+        return io.imread(path)
+
     # 重叠裁剪jpg或png图片(带重叠率)
     @staticmethod
     def crop_image_overlap(file_path, save_path, crop_size, overlap_rate):
@@ -106,8 +267,10 @@ class GRID:
         if not os.path.exists(save_path):
             os.makedirs(save_path)
         # 读取图片
+        from skimage import io
         try:
-            img = io.imread(file_path)
+            with instrument.timer('crop_image_overlap', 'read'):
+                img = io.imread(file_path)
         except:
             print('Error: {} not exist or image format is wrong.'.format(file_path))
             return
@@ -120,7 +283,6 @@ class GRID:
         # 图片必须大于裁剪尺寸，必须为3通道
         if len(img.shape) == 3:
             width, height, channel= img.shape
-            print(img.shape)
             if width < crop_size or height < crop_size:
                 print('Error: width or height < crop_size.')
                 return
@@ -133,25 +295,63 @@ class GRID:
                     # 裁剪区域
                     cropped = img[int(i*crop_size): int((i + 1)*crop_size), int(j*crop_size): int((j + 1)*crop_size), :]
                     # 保存为 原文件名_裁剪行号_裁剪列号.tif
-                    io.imsave(os.path.join(save_path, '{}_{}_{}_r{}'.format(file_name, i, j, overlap_rate) + extension), cropped)
+                    tile_name = '{}_{}_{}_r{}'.format(file_name, i, j, overlap_rate) + extension
+                    with instrument.timer('crop_image_overlap', 'encode', cropped.nbytes):
+                        io.imsave(os.path.join(save_path, tile_name), cropped)
                     p += 1
+                    instrument.emit('crop_image_overlap', tile=tile_name, bytes=cropped.nbytes)
             print('Success crop {} images.'.format(p))
         else:
             print('Error: img.shape = {}'.format(img.shape))
     
     # 裁剪tif图片, 参数is_supplement表示是否补充切割
     @staticmethod
-    def crop_tif(file_path, save_path, crop_size, is_supplement=False):
+    def crop_tif(file_path, save_path, crop_size, is_supplement=False, empty_tiles=None, background=None, empty_check='exact',
+                 container=None, shard_size=1000, dst_srs=None, dst_res=None, resampling='near', stats=False, incremental=False,
+                 tile_range=None, mask_path=None, class_rules=None):
         '''
         :param file_path: 待切割tif文件路径
         :param save_path: 切割后保存路径
         :param crop_size: 切割尺寸
         :param is_supplement: 是否补全切割
+        :param empty_tiles: 空白切片处理方式, None为不检测, 'skip'为不写出, 'record'为照常写出;
+                            两种方式均记录到 原始文件名_empty.txt, 合并时可用常数填充
+        :param background: 背景值, 默认使用波段nodata值, 没有nodata时为0
+        :param empty_check: 'exact'为读取全分辨率像素确认, 'overview'为金字塔低分辨率预扫描即判定(更快, 可能漏掉小于金字塔像元的目标)
+        :param container: 容器输出, None为每个切片一个tif, 'tar'为定长tar分片, 'h5'为HDF5数组;
+                          索引为 原始文件名_index.txt, 坐标文件中的文件名为切片名(原始文件名_行号_列号)
+        :param shard_size: tar分片的切片数
+        :param dst_srs: 目标坐标系(如'EPSG:32650'), 设置后按目标坐标系格网裁剪, 每个切片从原图窗口实时重投影, 不生成整景中间文件
+        :param dst_res: 目标分辨率, 设置后格网对齐到分辨率的整数倍, 不同影像的切片可直接拼接
+        :param resampling: 重投影重采样方式
+        :param stats: 是否在裁剪时累计各波段均值、标准差、最值和直方图(与写出的切片数值一致, 单波段为二值化后的0/1,
+                      不含跳过的空白切片, 补全切片与相邻切片重叠的部分只统计一次),
+                      保存为 原始文件名_stats.json, 无需再读取一遍切片; 为字符串时作为统计文件名
+        :param incremental: 增量裁剪, 按原图存储块计算每个切片窗口的哈希并记录到 原始文件名_hash.txt;
+                            再次运行时只重新生成哈希变化或缺失的切片, 未变化的切片文件不改动, 坐标文件内容不变时不重写
+        :param tile_range: (起始序号, 结束序号), 只裁剪按列优先顺序编号在该范围内的窗口, 用于多机分片;
+                           坐标等记录文件命名为 原始文件名_part起始序号_info.txt, 由 work_queue 合并
+        :param mask_path: 与影像对齐的标签栅格(整型单波段), 设置后同步裁剪标签切片到 save_path/mask/, 文件名与影像切片相同;
+                          每个切片的类别直方图和权重记录到 原始文件名_hist.txt, 格式为“文件名_权重_类别:像元数,...”
+        :param class_rules: 切片筛选和加权规则(需设置mask_path), 不满足的切片不读取影像、不写出, 可选键:
+                            'background': 背景类别列表, 默认[0], 标签nodata也视为背景
+                            'min_foreground': 前景(非背景)像元占比下限, 默认0
+                            'require_any': 切片至少包含其中一个类别才保留
+                            'class_weights': {类别: 权重}, 切片权重为所含类别权重的最大值(默认1), 用于类别均衡采样
         :return: 切割结果, 文件名: 原始文件名_行号_列号.tif
         '''
         # 获取文件名
         file_dir, file_name_ex = os.path.split(file_path)
         file_name, extension = os.path.splitext(file_name_ex)
+        if incremental and container:
+            print('Error: incremental crop only supports one file per tile, not container.')
+            return
+        if incremental and mask_path is not None:
+            print('Error: incremental crop does not track mask changes, run without incremental.')
+            return
+        if class_rules is not None and mask_path is None:
+            print('Error: class_rules need mask_path.')
+            return
         # 保存路径存在
         if not os.path.exists(save_path):
             os.makedirs(save_path)
@@ -161,6 +361,11 @@ class GRID:
         except:
             print('Error: {} not exist or image format is wrong.'.format(file_path))
             return
+        # 实时重投影: 构建一次warped vrt, 坐标转换器在所有窗口读取间复用
+        if dst_srs is not None:
+            # 保留原数据集引用, 避免vrt使用期间被释放
+            src_dataset = dataset
+            dataset = GRID.warped_vrt(src_dataset, dst_srs, dst_res, resampling)
         # 获取tif的基本信息
         width = dataset.RasterXSize
         height = dataset.RasterYSize
@@ -177,19 +382,52 @@ class GRID:
         n_s_pixel_resolution = ori_transform[5]  # 南北方向像素分辨率
         pcs = osr.SpatialReference()
         pcs.ImportFromWkt(proj)
+        # 标签栅格, 与影像同一格网
+        mask_band = None
+        if mask_path is not None:
+            mask_dataset = gdal.Open(mask_path)
+            if mask_dataset is None:
+                print('Error: {} not exist or image format is wrong.'.format(mask_path))
+                return
+            if dst_srs is not None:
+                src_mask_dataset = mask_dataset
+                mask_dataset = GRID.warped_vrt(src_mask_dataset, dst_srs, dst_res, 'near')
+            if (mask_dataset.RasterXSize, mask_dataset.RasterYSize) != (width, height):
+                print('Error: mask size {}x{} != image size {}x{}.'.format(mask_dataset.RasterXSize, mask_dataset.RasterYSize, width, height))
+                return
+            mask_band = mask_dataset.GetRasterBand(1)
+            if not np.issubdtype(gdal_array.GDALTypeCodeToNumericTypeCode(mask_band.DataType), np.integer):
+                print('Error: mask must be an integer raster.')
+                return
+            class_rules = dict(class_rules or {})
+            label_background = list(class_rules.get('background', [0]))
+            if mask_band.GetNoDataValue() is not None:
+                label_background.append(int(mask_band.GetNoDataValue()))
+            class_rules['background'] = label_background
+            mask_dir = os.path.join(save_path, 'mask')
+            if not os.path.exists(mask_dir):
+                os.makedirs(mask_dir)
 
         # 读取原图中的每个波段，通道数从1开始
         in_band = []
+        max_color = None
         # 单波段TIF
         if channel == 1:
-            img = dataset.GetRasterBand(1).ReadAsArray()
-            img = np.array(img, dtype=np.uint8)
-            max_color = np.max(img)
-            img = np.where(img == max_color, 255, 0)
+            with instrument.timer('crop_tif', 'read'):
+                img = dataset.GetRasterBand(1).ReadAsArray()
+            with instrument.timer('crop_tif', 'compute'):
+                img = np.array(img, dtype=np.uint8)
+                max_color = np.max(img)
+                img = np.where(img == max_color, 255, 0)
             in_band.append(img)
+            # 二值化后背景为0
+            background = 0
         else:
             for i in range(channel):
                 in_band.append(dataset.GetRasterBand(i + 1))
+            if background is None:
+                nodata = in_band[0].GetNoDataValue()
+                background = 0 if nodata is None else nodata
         # 是否需要最后不足补充，进行反向裁剪
         wb = False
         hb = False
@@ -211,80 +449,520 @@ class GRID:
         print('Geospatial coordinate system: ', pcs.GetAttrValue('geogcs'))
         print('---------------------------------------------------------------------')
         # 创建用于记录坐标投影的txt文件中
-        f = open(os.path.join(save_path, '{}_info.txt'.format(file_name)), 'w')
+        # 分片裁剪时记录文件按分片命名, 切片名不变
+        manifest_name = file_name if tile_range is None else '{}_part{:08d}'.format(file_name, tile_range[0])
+        info_path = os.path.join(save_path, '{}_info.txt'.format(manifest_name))
+        empty_path = os.path.join(save_path, '{}_empty.txt'.format(manifest_name))
+        # 增量模式先写入内存, 结束时内容有变化才写文件
+        f = StringIO() if incremental else open(info_path, 'w')
+        # 空白切片记录, 格式为“文件名_投影信息_地理参考六参数_宽_高_填充值”
+        f_empty = (StringIO() if incremental else open(empty_path, 'w')) if empty_tiles else None
+        # 增量模式: 读取上次的切片哈希, 格式为“文件名_哈希_状态(tile/empty/skipped)”
+        hash_path = os.path.join(save_path, '{}_hash.txt'.format(manifest_name))
+        old_hashes = {}
+        hash_lines = []
+        block_cache = {}
+        unchanged = 0
+        if incremental:
+            # 分片裁剪时先读合并后的哈希文件(work_queue 合并后删除分片文件), 再读本分片的
+            hash_sources = [hash_path]
+            if tile_range is not None:
+                hash_sources.insert(0, os.path.join(save_path, '{}_hash.txt'.format(file_name)))
+            for source in hash_sources:
+                if not os.path.exists(source):
+                    continue
+                with open(source, 'r') as fh:
+                    for line in fh:
+                        if line.strip():
+                            name, digest, state = line.strip().split('*_&')
+                            old_hashes[name] = (digest, state)
+            hash_bands = [dataset.GetRasterBand(k + 1) for k in range(channel)]
+            # 裁剪参数不同时哈希不同, 全部重新生成
+            salt = '|'.join(str(v) for v in (crop_size, is_supplement, channel, hash_bands[0].DataType, ori_transform, proj, dst_srs, dst_res,
+                                             resampling, max_color, empty_tiles, background, empty_check, extension)).encode()
+        store = tile_store.create_writer(container, save_path, manifest_name, shard_size) if container else None
+        mask_store = None
+        f_hist = None
+        if mask_band is not None:
+            mask_store = tile_store.create_writer(container, mask_dir, manifest_name, shard_size) if container else None
+            f_hist = open(os.path.join(save_path, '{}_hist.txt'.format(manifest_name)), 'w')
+        accumulator = None
+        if stats:
+            accumulator = band_stats.BandStats(nodata=None if channel == 1 else in_band[0].GetNoDataValue())
         count = 0
+        skipped = 0
+        rejected = 0
         for i in range(num_width):
             offset_x = crop_size * i
             if i == num_width - 1 and wb:
                 offset_x = width - crop_size
             for j in range(num_height):
+                if tile_range is not None and not tile_range[0] <= i * num_height + j < tile_range[1]:
+                    continue
                 count += 1
                 offset_y = crop_size * j
                 if j == num_height - 1 and hb:
                     offset_y = height - crop_size
-                # 读取裁剪区域
-                out_band = []
-                # 单波段Tif单独处理
-                if channel == 1:
-                    out_band.append(in_band[0][offset_y: offset_y + crop_size, offset_x: offset_x + crop_size])
-                else:
-                    for k in range(channel):
-                        out_band.append(in_band[k].ReadAsArray(offset_x, offset_y, crop_size, crop_size))
+                tile_start = time.perf_counter()
+                # 补全切片与前一切片重叠, 统计时只取不重叠的部分
+                stats_x, stats_y = crop_size * i - offset_x, crop_size * j - offset_y
                 # 保存为 save_path/原文件名_裁剪行号_裁剪列号.tif
-                gtif_driver = gdal.GetDriverByName('GTiff')
                 output_name = os.path.join(save_path, '{}_{}_{}'.format(file_name, j, i) + extension)
-                if channel == 1:
-                    out_data = gtif_driver.Create(output_name, crop_size, crop_size, 1, gdal.GDT_Byte)
-                else:
-                    out_data = gtif_driver.Create(output_name, crop_size, crop_size, channel, in_band[0].DataType)
-                print("create new tif file succeed, file name is {}".format(output_name))
                 # 设置裁剪区域的地理参考
                 top_left_x1 = top_left_x + offset_x * w_e_pixel_resolution
                 top_left_y1 = top_left_y + offset_y * n_s_pixel_resolution
                 new_transform = (top_left_x1, ori_transform[1], ori_transform[2], top_left_y1, ori_transform[4], ori_transform[5])
-                out_data.SetGeoTransform(new_transform)
-                # 设置SRS属性（投影信息）
-                out_data.SetProjection(proj)
+                info_line = '{}*_&{}*_&{}*_&{}*_&{}*_&{}*_&{}*_&{}\n'.format(output_name, proj, *new_transform)
+                empty_line = '{}*_&{}*_&{}*_&{}*_&{}*_&{}*_&{}*_&{}*_&{}*_&{}*_&{}\n'.format(output_name, proj, *new_transform, crop_size, crop_size, background)
+                # 标签窗口的类别直方图, 不满足规则的切片不读取影像、不写出
+                if mask_band is not None:
+                    with instrument.timer('crop_tif', 'read'):
+                        label = mask_band.ReadAsArray(offset_x, offset_y, crop_size, crop_size)
+                    with instrument.timer('crop_tif', 'compute'):
+                        hist = GRID.class_histogram(label)
+                        accept, weight = GRID.apply_class_rules(hist, label.size, class_rules)
+                    if not accept:
+                        rejected += 1
+                        instrument.emit('crop_tif', tile=output_name, rejected=True, duration=time.perf_counter() - tile_start)
+                        continue
+                # 增量模式: 窗口哈希与上次一致且切片存在时不重新生成
+                if incremental:
+                    with instrument.timer('crop_tif', 'read'):
+                        tile_hash = GRID.window_hash(hash_bands, offset_x, offset_y, crop_size, crop_size, block_cache, salt)
+                    old = old_hashes.get(output_name)
+                    if old is not None and old[0] == tile_hash and (old[1] == 'skipped' or os.path.exists(output_name)):
+                        unchanged += 1
+                        hash_lines.append('{}*_&{}*_&{}\n'.format(output_name, tile_hash, old[1]))
+                        if old[1] != 'tile':
+                            f_empty.write(empty_line)
+                        if old[1] == 'skipped':
+                            skipped += 1
+                            continue
+                        f.write(info_line)
+                        if accumulator is not None:
+                            with instrument.timer('crop_tif', 'read'):
+                                if channel == 1:
+                                    tile = (in_band[0][offset_y: offset_y + crop_size, offset_x: offset_x + crop_size] >= 1).astype(np.uint8)[np.newaxis]
+                                else:
+                                    tile = np.stack([band.ReadAsArray(offset_x, offset_y, crop_size, crop_size) for band in in_band])
+                            with instrument.timer('crop_tif', 'compute'):
+                                accumulator.update(tile[:, stats_y:, stats_x:])
+                        continue
+                # 先用稀疏块信息/金字塔判断空白窗口, 避免读取全分辨率像素
+                is_empty = False
+                if empty_tiles and channel != 1:
+                    with instrument.timer('crop_tif', 'read'):
+                        is_empty = GRID.is_empty_window(in_band, offset_x, offset_y, crop_size, crop_size, background, empty_check)
+                out_band = []
+                if not (is_empty and empty_tiles == 'skip'):
+                    # 读取裁剪区域
+                    with instrument.timer('crop_tif', 'read'):
+                        # 单波段Tif单独处理
+                        if channel == 1:
+                            out_band.append(in_band[0][offset_y: offset_y + crop_size, offset_x: offset_x + crop_size])
+                        else:
+                            for k in range(channel):
+                                out_band.append(in_band[k].ReadAsArray(offset_x, offset_y, crop_size, crop_size))
+                    if empty_tiles and not is_empty:
+                        with instrument.timer('crop_tif', 'compute'):
+                            is_empty = all(GRID.is_background(band, background) for band in out_band)
+                tile_bytes = sum(band.nbytes for band in out_band)
+                if incremental:
+                    state = 'tile' if not is_empty else ('skipped' if empty_tiles == 'skip' else 'empty')
+                    hash_lines.append('{}*_&{}*_&{}\n'.format(output_name, tile_hash, state))
+                if is_empty:
+                    skipped += 1
+                    f_empty.write(empty_line)
+                    if empty_tiles == 'skip':
+                        # 增量模式: 上次生成的切片已变为空白, 删除旧文件, 避免合并时覆盖填充值
+                        if incremental and os.path.exists(output_name):
+                            os.remove(output_name)
+                        instrument.emit('crop_tif', tile=output_name, empty=True, skipped=True, duration=time.perf_counter() - tile_start)
+                        continue
+                # 写出标签切片和直方图记录
+                if mask_band is not None:
+                    with instrument.timer('crop_tif', 'write', label.nbytes):
+                        # 容器输出时记录切片名, 与坐标文件一致
+                        hist_name = output_name
+                        if mask_store is not None:
+                            hist_name = '{}_{}_{}'.format(file_name, j, i)
+                            mask_store.add(hist_name, label)
+                        else:
+                            GRID.write_label_tile(os.path.join(mask_dir, os.path.basename(output_name)), label, mask_band.DataType, new_transform, proj)
+                        f_hist.write('{}*_&{}*_&{}\n'.format(hist_name, weight, ','.join('{}:{}'.format(c, n) for c, n in sorted(hist.items()))))
+                if accumulator is not None:
+                    with instrument.timer('crop_tif', 'compute'):
+                        # 单波段写出为1位二值图
+                        tile = (np.stack(out_band) >= 1).astype(np.uint8) if channel == 1 else np.stack(out_band)
+                        accumulator.update(tile[:, stats_y:, stats_x:])
+                # 写入容器, 不生成单独文件
+                if store is not None:
+                    key = '{}_{}_{}'.format(file_name, j, i)
+                    with instrument.timer('crop_tif', 'write', tile_bytes):
+                        tile = np.stack(out_band)
+                        if channel == 1:
+                            # 与文件输出的1位二值图一致
+                            tile = (tile >= 1).astype(np.uint8)
+                        store.add(key, tile)
+                    f.write('{}*_&{}*_&{}*_&{}*_&{}*_&{}*_&{}*_&{}'.format(key, proj, top_left_x1, ori_transform[1], ori_transform[2], top_left_y1, ori_transform[4], ori_transform[5]))
+                    f.write('\n')
+                    instrument.emit('crop_tif', tile=key, bytes=tile_bytes, empty=is_empty, duration=time.perf_counter() - tile_start)
+                    continue
+                with instrument.timer('crop_tif', 'write', tile_bytes):
+                    gtif_driver = gdal.GetDriverByName('GTiff')
+                    if channel == 1:
+                        out_data = gtif_driver.Create(output_name, crop_size, crop_size, 1, gdal.GDT_Byte)
+                    else:
+                        out_data = gtif_driver.Create(output_name, crop_size, crop_size, channel, in_band[0].DataType)
+                    out_data.SetGeoTransform(new_transform)
+                    # 设置SRS属性（投影信息）
+                    out_data.SetProjection(proj)
+                    # 写入裁剪区域
+                    for k in range(channel):
+                        out_data.GetRasterBand(k + 1).WriteArray(out_band[k])
+                    # 将缓存写入磁盘，直接保存
+                    out_data.FlushCache()
+                    del out_data
                 # 将投影信息和坐标信息写入到txt文件中, 格式为“文件名_投影信息_地理参考六参数”
-                f.write('{}*_&{}*_&{}*_&{}*_&{}*_&{}*_&{}*_&{}'.format(output_name, proj, top_left_x1, ori_transform[1], ori_transform[2], top_left_y1, ori_transform[4], ori_transform[5]))
-                f.write('\n')
-                # 写入裁剪区域
-                for k in range(channel):
-                    out_data.GetRasterBand(k + 1).WriteArray(out_band[k])
-                # 将缓存写入磁盘，直接保存
-                out_data.FlushCache()
-                del out_data
+                f.write(info_line)
         
-                # 单通道处理
-                # 设置tif文件位深度为1位
-                # 先转灰度图
-                img_l = Image.open(output_name).convert('L')
-                # 再转二值图
-                img_b = img_l.point(lambda x: 0 if x < 1 else 1, '1')
-                # 保存
-                img_b.save(output_name)
-                
-                # 如果为保存为tif，转位深会丢失投影信息和地理坐标，所以需要重新设置
-                # 设置投影信息和地理坐标
-                ds = gdal.Open(output_name, gdal.GA_Update)
-                ds.SetProjection(proj)
-                ds.SetGeoTransform(new_transform)
-                # 释放资源
-                ds = None
+                # 单通道(掩膜)切片转为1位二值图, 多波段切片保持原值
+                if channel == 1:
+                    # 重新打开、转位深并覆盖写出, 单独计时, 不计入编码
+                    with instrument.timer('crop_tif', 'binarize'):
+                        from PIL import Image
+                        # 设置tif文件位深度为1位
+                        # 先转灰度图
+                        img_l = Image.open(output_name).convert('L')
+                        # 再转二值图
+                        img_b = img_l.point(lambda x: 0 if x < 1 else 1, '1')
+                        # 保存
+                        img_b.save(output_name)
+                    
+                        # 如果为保存为tif，转位深会丢失投影信息和地理坐标，所以需要重新设置
+                        # 设置投影信息和地理坐标
+                        ds = gdal.Open(output_name, gdal.GA_Update)
+                        ds.SetProjection(proj)
+                        ds.SetGeoTransform(new_transform)
+                        # 释放资源
+                        ds = None
+                instrument.emit('crop_tif', tile=output_name, bytes=tile_bytes, empty=is_empty, duration=time.perf_counter() - tile_start)
 
+        if incremental:
+            # 内容不变的文件不重写, 保持修改时间
+            for path, content in ((info_path, f.getvalue()), (empty_path, f_empty.getvalue() if f_empty is not None else None),
+                                  (hash_path, ''.join(hash_lines))):
+                if content is None:
+                    continue
+                if os.path.exists(path):
+                    with open(path, 'r') as fr:
+                        if fr.read() == content:
+                            continue
+                with open(path, 'w') as fw:
+                    fw.write(content)
+            print('Incremental crop: {} unchanged, {} regenerated.'.format(unchanged, count - unchanged))
         f.close()
-        print('Success crop {} images.'.format(count))
+        if store is not None:
+            store.close()
+        if accumulator is not None:
+            accumulator.save(os.path.join(save_path, stats if isinstance(stats, str) else manifest_name + band_stats.STATS_SUFFIX))
+        if f_empty is not None:
+            f_empty.close()
+            print('Found {} empty windows ({}).'.format(skipped, empty_tiles))
+        if f_hist is not None:
+            f_hist.close()
+            if mask_store is not None:
+                mask_store.close()
+            print('Rejected {} tiles by class rules.'.format(rejected))
+        print('Success crop {} images.'.format(count - rejected - (skipped if empty_tiles == 'skip' else 0)))
+
+    # 标签窗口的类别直方图 {类别: 像元数}
+    @staticmethod
+    def class_histogram(label):
+        if label.size and label.min() >= 0:
+            counts = np.bincount(label.ravel())
+            classes = np.nonzero(counts)[0]
+            return {c.item(): counts[c].item() for c in classes}
+        classes, counts = np.unique(label, return_counts=True)
+        return {c.item(): n.item() for c, n in zip(classes, counts)}
+
+    # 按规则判断切片是否保留, 返回 (是否保留, 权重)
+    @staticmethod
+    def apply_class_rules(hist, total, rules):
+        background = rules.get('background', [0])
+        foreground = sum(n for c, n in hist.items() if c not in background)
+        if foreground < rules.get('min_foreground', 0) * total:
+            return False, 0
+        require_any = rules.get('require_any')
+        if require_any is not None and not any(hist.get(c, 0) > 0 for c in require_any):
+            return False, 0
+        weights = rules.get('class_weights') or {}
+        weight = max(weights.get(c, 1.0) for c in hist) if hist else 1.0
+        return True, weight
+
+    # 写出标签切片, 保持原数据类型
+    @staticmethod
+    def write_label_tile(output_name, label, data_type, geo_transform, proj):
+        out_data = gdal.GetDriverByName('GTiff').Create(output_name, label.shape[1], label.shape[0], 1, data_type)
+        out_data.SetGeoTransform(geo_transform)
+        out_data.SetProjection(proj)
+        out_data.GetRasterBand(1).WriteArray(label)
+        out_data.FlushCache()
+        out_data = None
+
+    # 窗口哈希: 由窗口覆盖的各存储块的blake2b哈希组合而成, 块哈希缓存在cache中, 每个块只读取一次
+    @staticmethod
+    def window_hash(bands, offset_x, offset_y, width, height, cache, salt=b''):
+        '''
+        :param bands: 参与哈希的波段
+        :param cache: {(块列号, 块行号): 块哈希}
+        :param salt: 裁剪参数, 参数不同时哈希不同
+        :return: 十六进制哈希
+        '''
+        block_w, block_h = bands[0].GetBlockSize()
+        x_size, y_size = bands[0].XSize, bands[0].YSize
+        digest = hashlib.blake2b(salt, digest_size=16)
+        digest.update('{},{},{},{}'.format(offset_x, offset_y, width, height).encode())
+        for by in range(offset_y // block_h, (min(offset_y + height, y_size) - 1) // block_h + 1):
+            for bx in range(offset_x // block_w, (min(offset_x + width, x_size) - 1) // block_w + 1):
+                if (bx, by) not in cache:
+                    x, y = bx * block_w, by * block_h
+                    w, h = min(block_w, x_size - x), min(block_h, y_size - y)
+                    block = hashlib.blake2b(digest_size=16)
+                    for band in bands:
+                        block.update(band.ReadRaster(x, y, w, h))
+                    cache[(bx, by)] = block.digest()
+                digest.update(cache[(bx, by)])
+        return digest.hexdigest()
+
+    # 构建重投影到目标坐标系的虚拟数据集, 只在读取窗口时才重投影对应像素
+    @staticmethod
+    def warped_vrt(dataset, dst_srs, dst_res=None, resampling='near'):
+        '''
+        :param dataset: 原始数据集
+        :param dst_srs: 目标坐标系
+        :param dst_res: 目标分辨率, None为自动估计
+        :param resampling: 重采样方式
+        :return: warped vrt数据集
+        '''
+        options = {
+            'format': 'VRT',
+            'dstSRS': dst_srs,
+            'resampleAlg': resampling,
+            'multithread': True,
+            'warpOptions': ['NUM_THREADS=ALL_CPUS'],
+        }
+        if dst_res is not None:
+            options.update(xRes=dst_res, yRes=dst_res, targetAlignedPixels=True)
+        nodata = dataset.GetRasterBand(1).GetNoDataValue()
+        if nodata is not None:
+            options.update(srcNodata=nodata, dstNodata=nodata)
+        with instrument.timer('crop_tif', 'compute'):
+            return gdal.Warp('', dataset, **options)
+
+    # 数组是否全为背景值, 背景值为NaN时按isnan判断
+    @staticmethod
+    def is_background(array, background):
+        if isinstance(background, float) and math.isnan(background):
+            return bool(np.all(np.isnan(array)))
+        return bool(np.all(np.asarray(array) == background))
+
+    # 判断窗口是否全为背景值, 只使用稀疏块信息和金字塔, 不读取全分辨率像素
+    @staticmethod
+    def is_empty_window(bands, offset_x, offset_y, width, height, background=0, check='exact'):
+        '''
+        :param bands: gdal波段列表
+        :param offset_x, offset_y, width, height: 窗口
+        :param background: 背景值
+        :param check: 'exact' 只信任稀疏块信息(确定为空), 'overview' 额外使用金字塔低分辨率预扫描
+        :return: True 表示确定(或按金字塔判定)为空, False 表示需要读取像素确认
+        '''
+        # 稀疏tif中未写入的块读取时为nodata(或0), 与背景值一致时可直接判定为空
+        for band in bands:
+            nodata = band.GetNoDataValue()
+            fill = 0 if nodata is None else nodata
+            if not GRID.is_background(fill, background):
+                break
+            flags, _ = band.GetDataCoverageStatus(offset_x, offset_y, width, height)
+            # 部分覆盖时同时返回EMPTY和DATA, 只有不含DATA且驱动支持查询时才确定为空
+            if flags & gdal.GDAL_DATA_COVERAGE_STATUS_DATA or flags & gdal.GDAL_DATA_COVERAGE_STATUS_UNIMPLEMENTED:
+                break
+        else:
+            return True
+        # 金字塔低分辨率预扫描
+        if check == 'overview' and bands[0].GetOverviewCount() > 0:
+            size = max(1, min(width, height) // 16)
+            for band in bands:
+                # 降采样读取时gdal自动使用金字塔
+                low = band.ReadAsArray(offset_x, offset_y, width, height, buf_xsize=size, buf_ysize=size)
+                if not GRID.is_background(low, background):
+                    return False
+            return True
+        return False
+
+    # 按矢量要素裁剪tif, 只读取每个要素所在的窗口
+    @staticmethod
+    def crop_by_vector(file_path, shp_path, save_path, buffer=0, crop_size=None, is_mask=False, workers=4, id_field=None):
+        '''
+        :param file_path: 待切割tif文件路径
+        :param shp_path: 矢量文件(AOI), 坐标系不同时自动转换到tif坐标系
+        :param save_path: 切割后保存路径
+        :param buffer: 要素缓冲距离(地图单位)
+        :param crop_size: 窗口对齐尺寸, 窗口宽高扩展为crop_size的整数倍并以要素为中心, None为要素外包矩形
+        :param is_mask: 是否用要素多边形掩膜, 多边形外像素置为nodata(无nodata时为0)
+        :param workers: 并行读取线程数
+        :param id_field: 用于命名的属性字段, 默认为要素FID
+        :return: 切割结果, 文件名: 原始文件名_要素id.tif, 坐标文件: 原始文件名_info.txt
+        '''
+        file_dir, file_name_ex = os.path.split(file_path)
+        file_name, extension = os.path.splitext(file_name_ex)
+        if not os.path.exists(save_path):
+            os.makedirs(save_path)
+        dataset = gdal.Open(file_path)
+        if dataset is None:
+            print('Error: {} not exist or image format is wrong.'.format(file_path))
+            return
+        width = dataset.RasterXSize
+        height = dataset.RasterYSize
+        ori_transform = dataset.GetGeoTransform()
+        proj = dataset.GetProjection()
+        inv_transform = gdal.InvGeoTransform(ori_transform)
+        shp = ogr.Open(shp_path)
+        if shp is None:
+            print('Error: {} is not shp file.'.format(shp_path))
+            return
+        layer = shp.GetLayer(0)
+        # 矢量与栅格坐标系不同时转换坐标
+        transform = None
+        layer_srs = layer.GetSpatialRef()
+        raster_srs = osr.SpatialReference()
+        raster_srs.ImportFromWkt(proj)
+        if layer_srs is not None and proj and not layer_srs.IsSame(raster_srs):
+            if hasattr(osr, 'OAMS_TRADITIONAL_GIS_ORDER'):
+                layer_srs.SetAxisMappingStrategy(osr.OAMS_TRADITIONAL_GIS_ORDER)
+                raster_srs.SetAxisMappingStrategy(osr.OAMS_TRADITIONAL_GIS_ORDER)
+            transform = osr.CoordinateTransformation(layer_srs, raster_srs)
+
+        # 计算每个要素的像素窗口
+        jobs = []
+        for feature in layer:
+            geom = feature.GetGeometryRef()
+            if geom is None:
+                continue
+            geom = geom.Clone()
+            if transform is not None:
+                geom.Transform(transform)
+            if buffer:
+                geom = geom.Buffer(buffer)
+            xmin, xmax, ymin, ymax = geom.GetEnvelope()
+            cols = []
+            rows = []
+            for x, y in ((xmin, ymin), (xmin, ymax), (xmax, ymin), (xmax, ymax)):
+                px, py = gdal.ApplyGeoTransform(inv_transform, x, y)
+                cols.append(px)
+                rows.append(py)
+            x0, x1 = int(math.floor(min(cols))), int(math.ceil(max(cols)))
+            y0, y1 = int(math.floor(min(rows))), int(math.ceil(max(rows)))
+            if crop_size:
+                # 以要素为中心扩展为crop_size的整数倍
+                w = max(crop_size, int(math.ceil((x1 - x0) / crop_size)) * crop_size)
+                h = max(crop_size, int(math.ceil((y1 - y0) / crop_size)) * crop_size)
+                x0 = (x0 + x1) // 2 - w // 2
+                y0 = (y0 + y1) // 2 - h // 2
+                # 窗口尽量平移到图像内部
+                x0 = max(0, min(x0, width - w))
+                y0 = max(0, min(y0, height - h))
+                x1, y1 = x0 + w, y0 + h
+            x0, y0 = max(0, x0), max(0, y0)
+            x1, y1 = min(width, x1), min(height, y1)
+            if x1 <= x0 or y1 <= y0:
+                continue
+            name = feature.GetField(id_field) if id_field else feature.GetFID()
+            jobs.append((name, x0, y0, x1 - x0, y1 - y0, geom.ExportToWkt() if is_mask else None))
+        shp = None
+        dataset = None
+
+        print('---------------------------------------------------------------------')
+        print('Start crop file: {} by {}'.format(file_path, shp_path))
+        print('features: {}, workers: {}'.format(len(jobs), workers))
+        print('---------------------------------------------------------------------')
+        # gdal数据集不能跨线程共享, 每个线程单独打开
+        local = threading.local()
+
+        def crop_window(job):
+            name, x0, y0, w, h, wkt = job
+            if not hasattr(local, 'dataset'):
+                local.dataset = gdal.Open(file_path)
+            ds = local.dataset
+            tile_start = time.perf_counter()
+            with instrument.timer('crop_by_vector', 'read'):
+                data = ds.ReadAsArray(x0, y0, w, h).reshape(ds.RasterCount, h, w)
+            new_transform = (ori_transform[0] + x0 * ori_transform[1] + y0 * ori_transform[2], ori_transform[1], ori_transform[2],
+                             ori_transform[3] + x0 * ori_transform[4] + y0 * ori_transform[5], ori_transform[4], ori_transform[5])
+            nodata = ds.GetRasterBand(1).GetNoDataValue()
+            if wkt is not None:
+                with instrument.timer('crop_by_vector', 'compute'):
+                    mask = GRID.rasterize_geometry(wkt, w, h, new_transform, proj)
+                    data[:, mask == 0] = 0 if nodata is None else nodata
+            output_name = os.path.join(save_path, '{}_{}'.format(file_name, name) + extension)
+            with instrument.timer('crop_by_vector', 'write', data.nbytes):
+                out_data = gdal.GetDriverByName('GTiff').Create(output_name, w, h, ds.RasterCount, ds.GetRasterBand(1).DataType)
+                out_data.SetGeoTransform(new_transform)
+                out_data.SetProjection(proj)
+                for k in range(ds.RasterCount):
+                    band = out_data.GetRasterBand(k + 1)
+                    if nodata is not None:
+                        band.SetNoDataValue(nodata)
+                    band.WriteArray(data[k])
+                out_data.FlushCache()
+                out_data = None
+            instrument.emit('crop_by_vector', tile=output_name, bytes=data.nbytes, duration=time.perf_counter() - tile_start)
+            return '{}*_&{}*_&{}*_&{}*_&{}*_&{}*_&{}*_&{}'.format(output_name, proj, *new_transform)
+
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            lines = list(pool.map(crop_window, jobs))
+        with open(os.path.join(save_path, '{}_info.txt'.format(file_name)), 'w') as f:
+            for line in lines:
+                f.write(line)
+                f.write('\n')
+        print('Success crop {} images.'.format(len(lines)))
+
+    # 将多边形栅格化为窗口大小的掩膜, 多边形内为1
+    @staticmethod
+    def rasterize_geometry(wkt, width, height, geo_transform, proj):
+        mem = gdal.GetDriverByName('MEM').Create('', width, height, 1, gdal.GDT_Byte)
+        mem.SetGeoTransform(geo_transform)
+        mem.SetProjection(proj)
+        vector = ogr.GetDriverByName('Memory').CreateDataSource('')
+        layer = vector.CreateLayer('mask', None, ogr.wkbUnknown)
+        feature = ogr.Feature(layer.GetLayerDefn())
+        feature.SetGeometry(ogr.CreateGeometryFromWkt(wkt))
+        layer.CreateFeature(feature)
+        gdal.RasterizeLayer(mem, [1], layer, burn_values=[1])
+        mask = mem.GetRasterBand(1).ReadAsArray()
+        mem = None
+        vector = None
+        return mask
 
     # 合并图片jpg或png(只能用于没有重叠切割的图片，经过补全切割或重叠率的图片不可用)
     @staticmethod
     def merge_image(file_path, save_path):
         '''
-        :param file_path: 待合并图片所在文件夹(文件名格式: 原文件名_裁剪行号_裁剪列号.jpg)
+        :param file_path: 待合并图片所在文件夹(文件名格式: 原文件名_裁剪行号_裁剪列号.jpg/.png/.tif/.npy), 或crop_image生成的容器索引(原始文件名_index.txt)
         :param save_path: 合并后图片保存路径
         :return: merge image
         '''
-        # 获取文件夹下所有图片
-        file_list = [os.path.join(file_path, file) for file in os.listdir(file_path) if file.endswith('.jpg') or file.endswith('.png')] 
+        if tile_store.is_store(file_path):
+            GRID.merge_image_store(file_path, save_path)
+            return
+        # 获取文件夹下所有图片, 切片后缀以第一张为准
+        file_list = [os.path.join(file_path, file) for file in sorted(os.listdir(file_path))
+                     if os.path.splitext(file)[1].lower() in ('.jpg', '.jpeg', '.png', '.tif', '.tiff', '.npy')]
+        if len(file_list) == 0:
+            print('Error: No image in {}'.format(file_path))
+            return
+        extension = os.path.splitext(file_list[0])[1]
+        file_list = [file for file in file_list if file.endswith(extension)]
         # 文件名按从左到右从上到下排序
         file_list.sort(key=lambda x: int(x.split('_')[-1].split('.')[0]))
         file_list.sort(key=lambda x: int(x.split('_')[-2]))
@@ -295,6 +973,11 @@ class GRID:
                 file_name_list.append(file.split('/')[-1].split('.')[0])
             else:
                 file_name_list.append(file.split('\\')[-1].split('.')[0])
+        # 16位、多波段或npy切片按数组合并, 保持数据类型和波段数
+        if extension.lower() not in ('.jpg', '.jpeg', '.png') or GRID.read_tile(file_list[0]).dtype != np.uint8:
+            GRID.merge_image_array(file_path, file_name_list, extension, save_path)
+            return
+        from PIL import Image
         # 获取图片的宽高及原文件名
         img = Image.open(os.path.join(file_path, file_list[0]))
         width, height = img.size
@@ -314,37 +997,188 @@ class GRID:
         for i in range(height_num + 1):
             for j in range(width_num + 1):
                 try:
-                    img = Image.open(os.path.join(file_path, '{}_{}_{}.jpg'.format(ori_name, i, j)))
+                    img = Image.open(os.path.join(file_path, '{}_{}_{}{}'.format(ori_name, i, j, extension)))
                 except:
-                    print('No image: {}_{}_{}.jpg'.format(ori_name, i, j))
+                    print('No image: {}_{}_{}{}'.format(ori_name, i, j, extension))
                     continue
-                new_img.paste(img, (j * width, i * height))
+                # paste时才真正解码
+                with instrument.timer('merge_image', 'read'):
+                    new_img.paste(img, (j * width, i * height))
+                instrument.emit('merge_image', tile='{}_{}_{}{}'.format(ori_name, i, j, extension))
         # 保存图片
-        new_img.save(save_path)
+        with instrument.timer('merge_image', 'encode'):
+            new_img.save(save_path)
+        print('Success merge image. save path is {}'.format(save_path))
+
+    # 按数组合并切片(16位、多波段、tif或npy)
+    @staticmethod
+    def merge_image_array(file_path, file_name_list, extension, save_path):
+        rows = [int(name.split('_')[-2]) for name in file_name_list]
+        cols = [int(name.split('_')[-1]) for name in file_name_list]
+        tile = GRID.read_tile(os.path.join(file_path, file_name_list[0] + extension))
+        height, width = tile.shape[:2]
+        new_img = np.zeros(((max(rows) + 1) * height, (max(cols) + 1) * width) + tile.shape[2:], dtype=tile.dtype)
+        for name, i, j in zip(file_name_list, rows, cols):
+            with instrument.timer('merge_image', 'read'):
+                tile = GRID.read_tile(os.path.join(file_path, name + extension))
+            new_img[i * height: (i + 1) * height, j * width: (j + 1) * width] = tile
+            instrument.emit('merge_image', tile=name + extension)
+        with instrument.timer('merge_image', 'encode'):
+            GRID.save_tile(save_path, new_img)
+        print('Success merge image. save path is {}'.format(save_path))
+
+    # 由容器合并图片
+    @staticmethod
+    def merge_image_store(index_file, save_path):
+        with tile_store.TileStore(index_file) as store:
+            keys = store.keys()
+            if len(keys) == 0:
+                print('Error: No tile in {}'.format(index_file))
+                return
+            rows = [int(key.split('_')[-2]) for key in keys]
+            cols = [int(key.split('_')[-1]) for key in keys]
+            tile_shape = store.shape(keys[0])
+            height, width = tile_shape[:2]
+            new_img = np.zeros(((max(rows) + 1) * height, (max(cols) + 1) * width) + tuple(tile_shape[2:]), dtype=store.dtype(keys[0]))
+            for key, i, j in zip(keys, rows, cols):
+                with instrument.timer('merge_image', 'read'):
+                    tile = store.read(key)
+                new_img[i * height: (i + 1) * height, j * width: (j + 1) * width] = tile
+                instrument.emit('merge_image', tile=key)
+        with instrument.timer('merge_image', 'encode'):
+            GRID.save_tile(save_path, new_img)
         print('Success merge image. save path is {}'.format(save_path))
 
 
     # 合并tif
     @staticmethod
-    def merge_tif(file_path, save_path):
+    def merge_tif(file_path, save_path, empty_txt=None, harmonize=False, dst_srs=None, dst_res=None, overlap='last', workers=4):
         '''
-        :param file_path: 待合并tif所在文件夹
+        :param file_path: 待合并tif所在文件夹, tif文件列表(如 TileIndex.query_bbox 的结果), 或crop_tif生成的容器索引(原始文件名_index.txt)
         :param save_path: 合并后tif保存路径
+        :param empty_txt: crop_tif记录的空白窗口文件(原始文件名_empty.txt), 未写出的窗口用其中的填充值补齐
+        :param harmonize: 输入坐标系/分辨率/波段数不一致时使用, 按组并行预重投影到目标后再合并
+        :param dst_srs: harmonize模式的目标坐标系, 默认为像素最多的一组
+        :param dst_res: harmonize模式的目标分辨率
+        :param overlap: harmonize模式重叠区域处理方式: first, last, max, mean; first/last 按列表顺序(文件夹按文件名排序)
+        :param workers: harmonize模式预重投影线程数
         :return: merge tif
         '''
-        # 获取文件夹下所有tif文件
-        file_list = [os.path.join(file_path, file) for file in os.listdir(file_path) if file.endswith('.tif') or file.endswith('.tiff')]
+        if isinstance(file_path, (list, tuple)):
+            file_list = list(file_path)
+        elif tile_store.is_store(file_path):
+            GRID.merge_tif_store(file_path, save_path, empty_txt)
+            return
+        else:
+            # 获取文件夹下所有tif文件
+            # 文件夹输入按文件名排序, 列表输入保持调用方顺序(first/last 重叠策略依赖该顺序)
+            file_list = [os.path.join(file_path, file) for file in sorted(os.listdir(file_path)) if file.endswith('.tif') or file.endswith('.tiff')]
         # 文件路径下没有tif文件
         if len(file_list) == 0:
             print('Error: No tif file in {}'.format(file_path))
             return
+        if harmonize:
+            import mosaic
+            mosaic.merge(file_list, save_path, dst_srs, dst_res, overlap, workers)
+            return
         # 创建vrt(虚拟文件)
-        vrt = gdal.BuildVRT('temp.vrt', file_list)
+        with instrument.timer('merge_tif', 'read'):
+            vrt = gdal.BuildVRT('temp.vrt', file_list)
+            if empty_txt is not None:
+                vrt = GRID.fill_empty_windows(vrt, file_list, empty_txt)
         # vrt文件转为tif
-        gdal.Translate(save_path, vrt)
+        with instrument.timer('merge_tif', 'write'):
+            gdal.Translate(save_path, vrt)
+        instrument.emit('merge_tif', tiles=len(file_list), output=save_path)
         print('Success merge tif file. save path: {}'.format(save_path))
         vrt = None
     
+    # 由容器合并tif, 地理参考来自同目录的 原始文件名_info.txt
+    @staticmethod
+    def merge_tif_store(index_file, save_path, empty_txt=None):
+        info_file = index_file[:-len(tile_store.INDEX_SUFFIX)] + '_info.txt'
+        if not os.path.exists(info_file):
+            print('Error: {} not exist.'.format(info_file))
+            return
+        info = {}
+        with open(info_file, 'r') as f:
+            for line in f:
+                if line.strip():
+                    parts = line.strip().split('*_&')
+                    info[parts[0]] = (parts[1], [float(v) for v in parts[2:8]])
+        with tile_store.TileStore(index_file) as store:
+            keys = [key for key in store.keys() if key in info]
+            if len(keys) == 0:
+                print('Error: No tile in {}'.format(index_file))
+                return
+            # 合并范围
+            proj, geo = info[keys[0]]
+            windows = [(info[key][1], store.shape(key)) for key in keys]
+            fill = 0
+            if empty_txt is not None:
+                with open(empty_txt, 'r') as f:
+                    for line in f:
+                        if line.strip():
+                            parts = line.strip().split('*_&')
+                            windows.append(([float(v) for v in parts[2:8]], (0, int(parts[9]), int(parts[8]))))
+                            fill = float(parts[10])
+            xmin = min(g[0] for g, shape in windows)
+            ymax = max(g[3] for g, shape in windows)
+            xmax = max(g[0] + shape[-1] * g[1] for g, shape in windows)
+            ymin = min(g[3] + shape[-2] * g[5] for g, shape in windows)
+            out_width = int(round((xmax - xmin) / geo[1]))
+            out_height = int(round((ymin - ymax) / geo[5]))
+            bands = store.shape(keys[0])[0]
+            out_type = gdal_array.NumericTypeCodeToGDALTypeCode(store.dtype(keys[0]))
+            out_data = gdal.GetDriverByName('GTiff').Create(save_path, out_width, out_height, bands, out_type, options=['TILED=YES', 'BIGTIFF=IF_SAFER'])
+            out_data.SetGeoTransform((xmin, geo[1], geo[2], ymax, geo[4], geo[5]))
+            out_data.SetProjection(proj)
+            for k in range(bands):
+                out_data.GetRasterBand(k + 1).Fill(fill)
+            # 逐个切片写入对应位置
+            for key in keys:
+                g = info[key][1]
+                with instrument.timer('merge_tif', 'read'):
+                    tile = store.read(key)
+                x_off = int(round((g[0] - xmin) / geo[1]))
+                y_off = int(round((g[3] - ymax) / geo[5]))
+                with instrument.timer('merge_tif', 'write', tile.nbytes):
+                    for k in range(bands):
+                        out_data.GetRasterBand(k + 1).WriteArray(tile[k], x_off, y_off)
+            out_data.FlushCache()
+            out_data = None
+        instrument.emit('merge_tif', tiles=len(keys), output=save_path)
+        print('Success merge tif file. save path: {}'.format(save_path))
+
+    # 按空白窗口记录扩展vrt范围, 并以填充值作为背景
+    @staticmethod
+    def fill_empty_windows(vrt, file_list, empty_txt):
+        '''
+        :param vrt: 由切片构建的vrt
+        :param file_list: 切片列表
+        :param empty_txt: 空白窗口记录文件
+        :return: 覆盖全部窗口的vrt
+        '''
+        with open(empty_txt, 'r') as f:
+            lines = [line.strip().split('*_&') for line in f if line.strip()]
+        if len(lines) == 0:
+            return vrt
+        gt = vrt.GetGeoTransform()
+        xmin, ymax = gt[0], gt[3]
+        xmax = xmin + vrt.RasterXSize * gt[1]
+        ymin = ymax + vrt.RasterYSize * gt[5]
+        for line in lines:
+            geo = [float(v) for v in line[2:8]]
+            w, h = int(line[8]), int(line[9])
+            xmin = min(xmin, geo[0])
+            xmax = max(xmax, geo[0] + w * geo[1])
+            ymax = max(ymax, geo[3])
+            ymin = min(ymin, geo[3] + h * geo[5])
+        fill = float(lines[0][10])
+        vrt = None
+        # hideNodata: 用填充值初始化背景但不把它标记为nodata
+        return gdal.BuildVRT('temp.vrt', file_list, outputBounds=(xmin, ymin, xmax, ymax), VRTNodata=fill, hideNodata=True)
+
     # 合并tif(带投影信息和地理坐标)
     @staticmethod
     def merge_tif_with_proj(file_path, save_path, txt_path):
@@ -383,30 +1217,36 @@ class GRID:
             for j in range(len(info)):
                 # 预测结果文件名与原始tif文件名一致
                 if os.path.split(file_list[i])[-1] == os.path.split(info[j][0])[-1]:
-                    ds = gdal.Open(file_list[i])
-                    ds_with_coord = gdal.GetDriverByName('GTiff').CreateCopy(os.path.split(file_list[i])[0] + '/temp.tif', ds)
-                    ds_with_coord.SetProjection(info[j][1])
-                    ds_with_coord.SetGeoTransform([float(info[j][2]), float(info[j][3]), float(info[j][4]), float(info[j][5]), float(info[j][6]), float(info[j][7])])
-                    ds_with_coord = None
-                    ds = None
-                    os.remove(file_list[i])
-                    os.rename(os.path.split(file_list[i])[0] + '/temp.tif', file_list[i])
+                    with instrument.timer('merge_tif_with_proj', 'write'):
+                        ds = gdal.Open(file_list[i])
+                        ds_with_coord = gdal.GetDriverByName('GTiff').CreateCopy(os.path.split(file_list[i])[0] + '/temp.tif', ds)
+                        ds_with_coord.SetProjection(info[j][1])
+                        ds_with_coord.SetGeoTransform([float(info[j][2]), float(info[j][3]), float(info[j][4]), float(info[j][5]), float(info[j][6]), float(info[j][7])])
+                        ds_with_coord = None
+                        ds = None
+                        os.remove(file_list[i])
+                        os.rename(os.path.split(file_list[i])[0] + '/temp.tif', file_list[i])
+                    instrument.emit('merge_tif_with_proj', tile=file_list[i])
                     break
         
         # 创建vrt(虚拟文件)
-        vrt = gdal.BuildVRT('temp.vrt', file_list)
+        with instrument.timer('merge_tif_with_proj', 'read'):
+            vrt = gdal.BuildVRT('temp.vrt', file_list)
         # vrt文件转为tif
-        gdal.Translate(save_path, vrt)
+        with instrument.timer('merge_tif_with_proj', 'write'):
+            gdal.Translate(save_path, vrt)
         print('Success merge tif file. save path: {}'.format(save_path))
         vrt = None
 
     
     # 批量切割大杂烩
     @staticmethod
-    def batch_cut(file_path, save_path, crop_size, is_supplement=True):
+    def batch_cut(file_path, save_path, crop_size, is_supplement=True, workers=1, stats=False):
         '''
         :param file_path: 待切割文件夹
         :param save_path: 切割后文件保存路径
+        :param workers: 并行进程数, 每个进程切割一个文件
+        :param stats: 是否统计各波段信息, 每个文件的统计合并为 batch_stats.json(波段数不同时为 batch_stats_N波段.json)
         :return: batch cut
         '''
         # 获取文件夹下所有文件
@@ -419,17 +1259,50 @@ class GRID:
         if not os.path.exists(save_path):
             os.makedirs(save_path)
         # 遍历文件
+        jobs = []
         for file in file_list:
-            # 判断文件类型
-            if file.endswith('.jpg') or file.endswith('.jpeg') or file.endswith('.png'):
+            # 判断文件类型(后缀不区分大小写)
+            ext = os.path.splitext(file)[1].lower()
+            if ext in ('.jpg', '.jpeg', '.png'):
                 # 切割图片
-                GRID.crop_image(file, save_path, crop_size, is_supplement)
-            elif file.endswith('.tif') or file.endswith('.tiff'):
+                jobs.append((GRID.crop_image, file))
+            elif ext in ('.tif', '.tiff'):
                 # 切割tif
-                GRID.crop_tif(file, save_path, crop_size, is_supplement)
+                jobs.append((GRID.crop_tif, file))
             else:
                 print('Error: {} is not image or tif file.'.format(file))
                 continue
+        # 每个文件的统计文件名带后缀(a.tif与a.png不冲突), 不区分大小写重名时加序号
+        stats_names = [False] * len(jobs)
+        if stats:
+            used = set()
+            stats_names = []
+            for _, file in jobs:
+                name = os.path.basename(file) + band_stats.STATS_SUFFIX
+                k = 1
+                while name.lower() in used:
+                    name = '{}_{}{}'.format(os.path.basename(file), k, band_stats.STATS_SUFFIX)
+                    k += 1
+                used.add(name.lower())
+                stats_names.append(name)
+        if workers > 1:
+            from concurrent.futures import ProcessPoolExecutor
+            with ProcessPoolExecutor(max_workers=workers) as pool:
+                futures = [pool.submit(func, file, save_path, crop_size, is_supplement, stats=name)
+                           for (func, file), name in zip(jobs, stats_names)]
+                for future in futures:
+                    future.result()
+        else:
+            for (func, file), name in zip(jobs, stats_names):
+                func(file, save_path, crop_size, is_supplement, stats=name)
+        # 合并各文件的统计
+        if stats:
+            paths = [os.path.join(save_path, name) for name in stats_names]
+            groups = band_stats.merge_files([path for path in paths if os.path.exists(path)])
+            for bands, merged in groups.items():
+                name = 'batch_stats.json' if len(groups) == 1 else 'batch_stats_{}band.json'.format(bands)
+                merged.save(os.path.join(save_path, name))
+                print('Band stats ({} bands): mean {}, std {}'.format(bands, np.round(merged.mean, 4).tolist(), np.round(merged.std, 4).tolist()))
         print('Success batch cut image or tif file.')
     
     
@@ -454,14 +1327,11 @@ class GRID:
 
         # 如果有txt坐标文件，优先使用txt文件的投影信息和地理坐标
         if txt_path is not None:
-            with open(txt_path, 'r') as f:
-                lines = f.readlines()
-            # 查找对应文件名的投影信息和地理坐标
-            for line in lines:
-                if line.split('*_&')[0] == file_path:
-                    # 获取投影信息和地理坐标
-                    prj = line.split('*_&')[1]
-                    break
+            # 按文件名直接查找对应的投影信息和地理坐标
+            info = tile_index.read_info(txt_path)
+            if file_path in info:
+                prj = osr.SpatialReference()
+                prj.ImportFromWkt(info[file_path][0])
         # 获取tif文件的波段数据
         band_data = ds.GetRasterBand(1)
         # 保存为shp文件
@@ -476,7 +1346,9 @@ class GRID:
         # 创建属性表
         field_name = ogr.FieldDefn('value', ogr.OFTReal)
         layer.CreateField(field_name)
-        gdal.Polygonize(band_data, None, layer, 0)
+        with instrument.timer('raster_to_vector', 'compute'):
+            gdal.Polygonize(band_data, None, layer, 0)
+        instrument.emit('raster_to_vector', features=layer.GetFeatureCount(), output=save_path)
         # 释放资源
         ds_shp.SyncToDisk()
         ds_shp = None
@@ -494,13 +1366,16 @@ class GRID:
         print('Success raster to vector. save path: {}'.format(save_path.replace('.tif', '.shp')))
 
     @staticmethod
-    def raster2vector(raster_path, vecter_path, field_name="value", ignore_values=None):
+    def raster2vector(raster_path, vecter_path, field_name="value", ignore_values=None, simplify_tolerance=None, simplify_method='dp', workers=4):
         """
         栅格转化为矢量
         :param raster_path: 栅格图像路径
         :param vecter_path: 输出矢量文件路径
         :param field_name: 字段名
         :param ignore_values: 忽略的类别
+        :param simplify_tolerance: 简化容差(像元数), 为None时不简化; 相邻面的共享边只简化一次, 不产生缝隙和重叠
+        :param simplify_method: 简化方法, 'dp' 或 'visvalingam'
+        :param workers: 简化并行进程数
         """
         # 读取路径中的栅格数据
         raster = gdal.Open(raster_path)
@@ -525,25 +1400,261 @@ class GRID:
         field = ogr.FieldDefn(field_name, ogr.OFTReal)
         poly_layer.CreateField(field)
 
+        # 需要简化时先转到内存图层, 简化后再写入文件
+        target_layer = poly_layer
+        if simplify_tolerance:
+            mem_source = ogr.GetDriverByName('Memory').CreateDataSource('')
+            target_layer = mem_source.CreateLayer('polygonize', srs=prj, geom_type=ogr.wkbPolygon)
+            target_layer.CreateField(field)
+
         # FPolygonize将每个像元转成一个矩形，然后将相似的像元进行合并
         # 设置矢量图层中保存像元值的字段序号为0
-        gdal.FPolygonize(band, None, poly_layer, 0)
+        with instrument.timer('raster2vector', 'compute'):
+            gdal.FPolygonize(band, None, target_layer, 0)
 
         # 删除ignore_value链表中的类别要素
         if ignore_values is not None:
-            for feature in poly_layer:
-                class_value = feature.GetField('value')
-                for ignore_value in ignore_values:
-                    if class_value == ignore_value:
-                        # 通过FID删除要素
-                        poly_layer.DeleteFeature(feature.GetFID())
-                        break
+            with instrument.timer('raster2vector', 'write'):
+                for feature in target_layer:
+                    class_value = feature.GetField(field_name)
+                    for ignore_value in ignore_values:
+                        if class_value == ignore_value:
+                            # 通过FID删除要素
+                            target_layer.DeleteFeature(feature.GetFID())
+                            break
 
-        polygon.SyncToDisk()
+        # 保持拓扑的简化, 容差由像元数换算为地图单位
+        if simplify_tolerance:
+            import simplify
+            tolerance = simplify_tolerance * abs(raster.GetGeoTransform()[1])
+            with instrument.timer('raster2vector', 'compute'):
+                simplify.simplify_layer(target_layer, poly_layer, tolerance, simplify_method, workers)
+            mem_source = None
+
+        with instrument.timer('raster2vector', 'write'):
+            polygon.SyncToDisk()
+        instrument.emit('raster2vector', features=poly_layer.GetFeatureCount(), output=vecter_path)
         polygon = None
         
 
 
+    # 切片集直接转矢量: 每个切片按坐标文件中的地理参考并行转矢量, 跨切片的面按类别融合, 不生成镶嵌大图
+    @staticmethod
+    def tiles_to_vector(tile_dir, txt_path, save_path, field_name='value', ignore_values=None, workers=4):
+        '''
+        :param tile_dir: 切片所在文件夹, 或crop_tif生成的容器索引(原始文件名_index.txt)
+        :param txt_path: crop_tif生成的坐标文件(原始文件名_info.txt)
+        :param save_path: 输出shp路径
+        :param field_name: 字段名
+        :param ignore_values: 忽略的类别(如背景0), 这些像元不参与转矢量
+        :param workers: 并行线程数
+        '''
+        info = tile_index.read_info(txt_path)
+        if len(info) == 0:
+            print('Error: No tile in {}'.format(txt_path))
+            return
+        store = tile_store.TileStore(tile_dir) if tile_store.is_store(tile_dir) else None
+        proj = next(iter(info.values()))[0]
+        # 切片在整体格网中的像元偏移; 补全裁剪的最后一行/列切片与前一个切片重叠,
+        # 每个切片只转换到下一个切片起点为止的核心区域, 重叠区内的面只生成一次
+        left = min(geo[0] for _, geo in info.values())
+        top = max(geo[3] for _, geo in info.values())
+        offsets = {name: (int(round((geo[0] - left) / geo[1])), int(round((geo[3] - top) / geo[5]))) for name, (_, geo) in info.items()}
+        starts_x = sorted(set(x for x, _ in offsets.values()))
+        starts_y = sorted(set(y for _, y in offsets.values()))
+
+        def core_size(name, width, height):
+            ox, oy = offsets[name]
+            k = bisect_right(starts_x, ox)
+            core_w = width if k == len(starts_x) else min(width, starts_x[k] - ox)
+            k = bisect_right(starts_y, oy)
+            core_h = height if k == len(starts_y) else min(height, starts_y[k] - oy)
+            return core_w, core_h
+
+        def read_tile(name):
+            if store is not None:
+                return store.read(name)[0] if name in store else None
+            path = name if os.path.exists(name) else os.path.join(tile_dir, os.path.basename(name))
+            ds = gdal.Open(path)
+            if ds is None:
+                print('Error: {} not exist, skip.'.format(name))
+                return None
+            data = ds.GetRasterBand(1).ReadAsArray()
+            ds = None
+            return data
+
+        def polygonize_tile(job):
+            name, data = job
+            if data is None:
+                data = read_tile(name)
+            if data is None:
+                return []
+            geo = info[name][1]
+            core_w, core_h = core_size(name, data.shape[1], data.shape[0])
+            data = data[:core_h, :core_w]
+            with instrument.timer('tiles_to_vector', 'compute'):
+                features = GRID.polygonize_array(data, geo, proj, ignore_values)
+                result = GRID.mark_edge_features(features, geo, core_w, core_h)
+            instrument.emit('tiles_to_vector', tile=name, features=len(result))
+            return result
+
+        names = list(info.keys())
+        print('---------------------------------------------------------------------')
+        print('Start polygonize {} tiles, workers: {}'.format(len(names), workers))
+        print('---------------------------------------------------------------------')
+        # 容器中的切片在主线程读取(文件句柄不能跨线程共享), 文件夹中的切片由各线程读取;
+        # 同时提交的任务数有上限, 容器切片不会一次全部读入内存
+        results = []
+        pending = deque()
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            for name in names:
+                if len(pending) >= workers * 2:
+                    results.append(pending.popleft().result())
+                pending.append(pool.submit(polygonize_tile, (name, read_tile(name) if store is not None else None)))
+            while pending:
+                results.append(pending.popleft().result())
+        if store is not None:
+            store.close()
+
+        # 按类别融合接缝处的面, 再拆分为单面
+        with instrument.timer('tiles_to_vector', 'compute'):
+            features = GRID.dissolve_edge_features([feature for result in results for feature in result], workers)
+        with instrument.timer('tiles_to_vector', 'write'):
+            GRID.write_polygons(save_path, proj, features, field_name)
+        print('Success polygonize {} tiles, {} features. save path: {}'.format(len(names), len(features), save_path))
+
+    # 标记外包矩形到达窗口边界的面(需要与相邻窗口融合), 返回 [(像元值, wkb, 是否在边界)]
+    @staticmethod
+    def mark_edge_features(features, geo_transform, width, height):
+        xmin, ymin, xmax, ymax = tile_index.footprint(geo_transform, width, height)
+        eps = min(abs(geo_transform[1]), abs(geo_transform[5])) / 2
+        result = []
+        for value, wkb in features:
+            env = ogr.CreateGeometryFromWkb(wkb).GetEnvelope()
+            on_edge = env[0] - xmin < eps or xmax - env[1] < eps or env[2] - ymin < eps or ymax - env[3] < eps
+            result.append((value, wkb, on_edge))
+        return result
+
+    # 边界上的面按类别合并后拆分为单面, 内部的面保持不变, 返回 [(像元值, wkb)]
+    # 同类别中外包矩形相接的面归为一组(R树查询+并查集), 各组互不相交, 分组并行融合
+    @staticmethod
+    def dissolve_edge_features(features, workers=4):
+        interior = []
+        edges = {}
+        for value, wkb, on_edge in features:
+            if on_edge:
+                edges.setdefault(value, []).append(wkb)
+            else:
+                interior.append((value, wkb))
+        groups = []
+        for value, wkbs in edges.items():
+            geoms = [ogr.CreateGeometryFromWkb(wkb) for wkb in wkbs]
+            boxes = []
+            for geom in geoms:
+                xmin, xmax, ymin, ymax = geom.GetEnvelope()
+                boxes.append((xmin, ymin, xmax, ymax))
+            index = tile_index.TileIndex(range(len(boxes)), boxes, [[]] * len(boxes))
+            parent = list(range(len(boxes)))
+
+            def find(k):
+                while parent[k] != k:
+                    parent[k] = parent[parent[k]]
+                    k = parent[k]
+                return k
+
+            for k, box in enumerate(boxes):
+                for other in index.query_bbox(box):
+                    a, b = find(k), find(other)
+                    if a != b:
+                        parent[max(a, b)] = min(a, b)
+            members = {}
+            for k in range(len(boxes)):
+                members.setdefault(find(k), []).append(geoms[k])
+            groups.extend((value, group) for group in members.values())
+
+        def dissolve(job):
+            value, group = job
+            if len(group) == 1:
+                return [(value, group[0].ExportToWkb())]
+            multi = ogr.Geometry(ogr.wkbMultiPolygon)
+            for geom in group:
+                multi.AddGeometry(geom)
+            union = multi.UnionCascaded()
+            if ogr.GT_Flatten(union.GetGeometryType()) == ogr.wkbPolygon:
+                return [(value, union.ExportToWkb())]
+            return [(value, union.GetGeometryRef(k).ExportToWkb()) for k in range(union.GetGeometryCount())]
+
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            dissolved = [feature for result in pool.map(dissolve, groups) for feature in result]
+        return interior + dissolved
+
+    # 面要素 [(像元值, wkb)] 写入shp
+    @staticmethod
+    def write_polygons(save_path, proj, features, field_name='value'):
+        prj = osr.SpatialReference()
+        prj.ImportFromWkt(proj)
+        drv = ogr.GetDriverByName('ESRI Shapefile')
+        if os.path.exists(save_path):
+            drv.DeleteDataSource(save_path)
+        polygon = drv.CreateDataSource(save_path)
+        poly_layer = polygon.CreateLayer(os.path.splitext(os.path.basename(save_path))[0], srs=prj, geom_type=ogr.wkbPolygon)
+        poly_layer.CreateField(ogr.FieldDefn(field_name, ogr.OFTReal))
+        poly_layer.StartTransaction()
+        for value, wkb in features:
+            feature = ogr.Feature(poly_layer.GetLayerDefn())
+            feature.SetField(field_name, value)
+            feature.SetGeometry(ogr.CreateGeometryFromWkb(wkb))
+            poly_layer.CreateFeature(feature)
+        poly_layer.CommitTransaction()
+        polygon.SyncToDisk()
+        polygon = None
+
+    # 数组按地理参考转矢量, 返回 [(像元值, wkb)]
+    @staticmethod
+    def polygonize_array(data, geo_transform, proj, ignore_values=None):
+        height, width = data.shape
+        mem = gdal.GetDriverByName('MEM').Create('', width, height, 2, gdal_array.NumericTypeCodeToGDALTypeCode(data.dtype))
+        mem.SetGeoTransform(geo_transform)
+        mem.SetProjection(proj)
+        mem.GetRasterBand(1).WriteArray(data)
+        mask_band = None
+        if ignore_values is not None:
+            # 忽略的类别作为掩膜, 不生成面
+            mask_band = mem.GetRasterBand(2)
+            mask_band.WriteArray((~np.isin(data, ignore_values)).astype(data.dtype))
+        vector = ogr.GetDriverByName('Memory').CreateDataSource('')
+        layer = vector.CreateLayer('polygonize', None, ogr.wkbPolygon)
+        layer.CreateField(ogr.FieldDefn('value', ogr.OFTReal))
+        gdal.FPolygonize(mem.GetRasterBand(1), mask_band, layer, 0)
+        features = [(feature.GetField(0), feature.GetGeometryRef().ExportToWkb()) for feature in layer]
+        vector = None
+        mem = None
+        return features
+
+    # 分类结果按类别统计像元数、面积、对象数和外包矩形, 不生成矢量
+    @staticmethod
+    def zonal_stats(raster_path, save_path=None, connectivity=4, ignore_values=None, block_size=1024, workers=4):
+        '''
+        :param raster_path: 分类结果栅格
+        :param save_path: 统计表保存文件夹, 为None时不保存(原始文件名_class_stats.csv, 原始文件名_objects.csv)
+        :param connectivity: 连通方式, 4 或 8
+        :param ignore_values: 忽略的类别
+        :param block_size: 分块大小, 分块并行统计后在接缝处合并连通域
+        :param workers: 并行进程数
+        :return: (classes, objects), 见 zonal_stats.zonal_stats
+        '''
+        import zonal_stats
+        result = zonal_stats.zonal_stats(raster_path, connectivity, ignore_values, block_size, workers)
+        if result is None:
+            return None
+        classes, objects = result
+        for value, item in sorted(classes.items()):
+            print('class: {}, pixels: {}, area: {}, objects: {}'.format(value, item['pixels'], item['area'], item['objects']))
+        if save_path is not None:
+            name = os.path.splitext(os.path.basename(raster_path))[0]
+            zonal_stats.save_csv(classes, objects, save_path, name)
+        return classes, objects
+
     # 矢量转栅格
     @staticmethod
     def vector_to_raster(shp_file_path, save_path, tif_file_path, output_channel = 'single'):
@@ -555,8 +1666,14 @@ class GRID:
         :param output_channel: 输出通道数
         :return: vector to raster
         '''
+        import geopandas as gpd
+        import rasterio as rio
+        from rasterio import features
+        from affine import Affine
+        from PIL import Image
         # 读取shp文件
-        shapefile = gpd.read_file(shp_file_path)
+        with instrument.timer('vector_to_raster', 'read'):
+            shapefile = gpd.read_file(shp_file_path)
         if shapefile is None:
             raise Exception('Error: {} is not shp file.'.format(shp_file_path))
         # 读取tif文件
@@ -620,8 +1737,11 @@ class GRID:
                 out_arr = out.read(i + 1)
                 # 读取shp文件
                 shapes = ((geom, value) for geom, value in zip(shapefile.geometry, field_val))
-                burned = features.rasterize(shapes=shapes, fill=0, out=out_arr, transform=out.transform)
-                out.write_band(i + 1, burned)
+                with instrument.timer('vector_to_raster', 'compute'):
+                    burned = features.rasterize(shapes=shapes, fill=0, out=out_arr, transform=out.transform)
+                with instrument.timer('vector_to_raster', 'write', burned.nbytes):
+                    out.write_band(i + 1, burned)
+        instrument.emit('vector_to_raster', features=len(field_val), output=save_path)
         
         # 如果为多通道则直接保存
         if channel == 3:
@@ -636,12 +1756,13 @@ class GRID:
         
         # 单通道处理
         # 设置tif文件位深度为1位
-        # 先转灰度图
-        img_l = Image.open(save_temp_path).convert('L')
-        # 再转二值图
-        img_b = img_l.point(lambda x: 0 if x < 1 else 1, '1')
-        # 保存
-        img_b.save(save_temp_path)
+        with instrument.timer('vector_to_raster', 'encode'):
+            # 先转灰度图
+            img_l = Image.open(save_temp_path).convert('L')
+            # 再转二值图
+            img_b = img_l.point(lambda x: 0 if x < 1 else 1, '1')
+            # 保存
+            img_b.save(save_temp_path)
         
         # 如果为保存为tif，转位深会丢失投影信息和地理坐标，所以需要重新设置
         # 设置投影信息和地理坐标
@@ -707,15 +1828,10 @@ class GRID:
         pcs.ImportFromWkt(prj)
         # prj.ImportFromWkt(ds.GetProjection())  # 读取栅格数据的投影信息
         geo = ds.GetGeoTransform()
-        # 读取坐标文件
-        with open(txt_path, 'r', encoding='utf-8') as f:
-            lines = f.readlines()
-            for line in lines:
-                print(line.split('*_&')[0])
-                if line.split('*_&')[0] == tif_path:
-                    prj = line.split('*_&')[1]
-                    geo = [float(i) for i in line.split('*_&')[2:]]
-                    break
+        # 读取坐标文件, 按文件名直接查找
+        info = tile_index.read_info(txt_path)
+        if tif_path in info:
+            prj, geo = info[tif_path]
         # 设置投影信息和地理坐标
         ds.SetProjection(prj)
         ds.SetGeoTransform(geo)
@@ -723,69 +1839,112 @@ class GRID:
         ds = None
         print('Success set projection and geotransform.')
     
+    # 为文件夹下所有tif生成一个坐标文件, 多线程只读取元数据
+    @staticmethod
+    def generate_txt_dir(file_dir, save_path, workers=8, extensions=('.tif', '.tiff')):
+        '''
+        :param file_dir: tif文件所在文件夹
+        :param save_path: 生成坐标文件保存路径
+        :param workers: 并行线程数
+        :param extensions: 参与的文件后缀
+        :return: generate txt
+        '''
+        file_list = sorted(os.path.join(file_dir, file) for file in os.listdir(file_dir) if file.lower().endswith(extensions))
+
+        def read_geo(path):
+            ds = gdal.OpenEx(path, gdal.OF_RASTER)
+            if ds is None:
+                return None
+            # GetProjection为单行wkt, 保证坐标文件一行对应一个文件
+            line = '{}*_&{}*_&{}*_&{}*_&{}*_&{}*_&{}*_&{}'.format(path, ds.GetProjection(), *ds.GetGeoTransform())
+            ds = None
+            return line
+
+        with instrument.timer('generate_txt', 'read'):
+            with ThreadPoolExecutor(max_workers=workers) as pool:
+                lines = list(pool.map(read_geo, file_list))
+        failed = [path for path, line in zip(file_list, lines) if line is None]
+        with instrument.timer('generate_txt', 'write'):
+            with open(save_path, 'w') as f:
+                for line in lines:
+                    if line is not None:
+                        f.write(line)
+                        f.write('\n')
+        for path in failed:
+            print('Error: {} is not tif file.'.format(path))
+        print('Success generate txt for {} files ({} failed). save path: {}'.format(len(file_list) - len(failed), len(failed), save_path))
+
+    # 按一个坐标文件批量设置文件夹下tif的投影和地理参考
+    @staticmethod
+    def set_txt_dir(file_dir, txt_path, workers=8, extensions=('.tif', '.tiff')):
+        '''
+        :param file_dir: 待设置坐标的tif文件所在文件夹
+        :param txt_path: 坐标文件, 按完整路径匹配, 其次按文件名匹配(文件夹移动后仍可使用)
+        :param workers: 并行线程数
+        :param extensions: 参与的文件后缀
+        :return: set txt
+        '''
+        if txt_path is None or not os.path.exists(txt_path):
+            print('Error: {} is not txt file.'.format(txt_path))
+            return
+        # 坐标文件只解析一次
+        info = tile_index.read_info(txt_path)
+        by_name = {os.path.basename(name): value for name, value in info.items()}
+        file_list = sorted(os.path.join(file_dir, file) for file in os.listdir(file_dir) if file.lower().endswith(extensions))
+
+        def apply_geo(path):
+            value = info.get(path) or by_name.get(os.path.basename(path))
+            if value is None:
+                return 'missing'
+            ds = gdal.Open(path, gdal.GA_Update)
+            if ds is None:
+                return 'failed'
+            prj, geo = value
+            ds.SetProjection(prj)
+            ds.SetGeoTransform(geo)
+            ds = None
+            return 'set'
+
+        with instrument.timer('set_txt', 'write'):
+            with ThreadPoolExecutor(max_workers=workers) as pool:
+                status = list(pool.map(apply_geo, file_list))
+        for path, state in zip(file_list, status):
+            if state == 'failed':
+                print('Error: {} is not tif file.'.format(path))
+        print('Success set projection and geotransform: {} set, {} not in txt, {} failed.'.format(
+            status.count('set'), status.count('missing'), status.count('failed')))
+
     # 由小图（切割结果）坐标文件获取大图坐标和投影信息
     @staticmethod
-    def get_big_img_info(txt_path):
+    def get_big_img_info(txt_path, tile_size=None):
         '''
         :param txt_path: 小图（切割结果）坐标文件
-        :return: 大图坐标和投影信息
+        :param tile_size: 切片尺寸, 为None时读取切片元数据
+        :return: 大图投影信息, 大图地理参考六参数, 大图范围(xmin, ymin, xmax, ymax)
         '''
-        min_geo = [1e10, 1e10, 1e10, 1e10, 1e10, 1e10]
-        max_geo = [0, 0, 0, 0, 0, 0]
-
-        # 读取坐标文件
-        with open(txt_path, 'r') as f:
-            lines = f.readlines()
-            for line in lines:
-                prj = line.split('*_&')[1]
-                geo = [float(i) for i in line.split('*_&')[2:]]
-                min_geo[0] = min(min_geo[0], geo[0])
-                min_geo[1] = min(min_geo[1], geo[1])
-                min_geo[2] = min(min_geo[2], geo[2])
-                min_geo[3] = min(min_geo[3], geo[3])
-                min_geo[4] = min(min_geo[4], geo[4])
-                min_geo[5] = min(min_geo[5], geo[5])
-                max_geo[0] = max(max_geo[0], geo[0])
-                max_geo[1] = max(max_geo[1], geo[1])
-                max_geo[2] = max(max_geo[2], geo[2])
-                max_geo[3] = max(max_geo[3], geo[3])
-                max_geo[4] = max(max_geo[4], geo[4])
-                max_geo[5] = max(max_geo[5], geo[5])
+        # 由各切片的地理参考和宽高构建空间索引(保存在坐标文件同目录, 供按范围查询切片)
+        index = tile_index.load_or_build(txt_path, tile_size)
+        if len(index.names) == 0:
+            print('Error: No tile in {}'.format(txt_path))
+            return
+        prj = index.proj
+        extent = index.extent()
+        geo = index.geos[0]
+        big_geo = [extent[0], geo[1], geo[2], extent[3], geo[4], geo[5]]
         # 输出大图坐标和投影信息
         print('Success get big image info.')
         print('prj: {}'.format(prj))
-        print('min_geo: {}'.format(min_geo))
-        print('max_geo: {}'.format(max_geo))
+        print('geo: {}'.format(big_geo))
+        print('extent: {}'.format(extent))
+        return prj, big_geo, extent
         
                 
 
 if __name__ == '__main__':
-    file_path = r'E:\jsnu\#00_project\mon\11.3号之前\测试数据\newresult.tif'
-    save_path = r'E:\jsnu\#00_project\mon\11.3号之前/newresult.shp'
-    txt_path = r'E:\jsnu\#00_project\mon\11.3号之前\测试数据\coord.txt'
-
-    crop_size = 256
-
-    start = time.time()
-    # GRID.raster2vector(file_path, save_path, ignore_values=[0])
-    GRID.raster_to_vector(file_path, save_path)
-    # GRID.set_txt(file_path, txt_path)
-    end = time.time()
-    print('time: {}s'.format(end - start))
-
-    # GRID.fast_raster_to_vector(file_path, save_path)
-
-    # GRID.crop_tif(file_path, save_path, crop_size, is_supplement=True)
-    # GRID.crop_image(file_path, save_path, crop_size, is_supplement=True)
-    # GRID.merge_tif(file_path, save_path)
-    # GRID.merge_tif_with_proj(file_path, save_path, r'C:\Users\69452\Desktop\mon\10.7日任务\cut_2\band4_info.txt')
-    # GRID.batch_cut(file_path, save_path, crop_size, is_supplement=True)
-    # GRID.generate_txt(r'D:\jsnu\AI RS\WHU\image_label_croped\test\2_0_3.tif', r'D:\jsnu\AI RS\WHU\image_label_croped\test\2_0_3.txt')
-    # GRID.raster_to_vector(file_path, save_path, txt_path=r'D:\jsnu\AI RS\WHU\image_label_croped\test\2_0_3.txt')
-    # GRID.merge_tif_with_proj(file_path, save_path, r'C:\Users\69452\Desktop\mon\10.7日任务\band3_info.txt')
-    # GRID.raster_to_vector(save_path, save_path.replace('.tif', '.shp'))
-    
-    '''     两种模式：多通道和单通道    多波段 RGB分为（0,0,0）（255,255,255）  单波段，1bit，只含值0和1 (JPG无法调成1位深度，只能调成8位深度，其余可行)'''
-    '''     不同后缀名更改保存文件的后缀名即可    '''
-    # GRID.vector_to_raster(file_path, save_path, tif_path, 'multi')
-    # GRID.vector_to_raster(file_path, save_path, tif_path, 'single')
+    # 命令行入口见 crop_or_mosaic.py, 如:
+    # python crop_merge_image.py crop input.tif tiles --size 256 --supplement
+    # python crop_merge_image.py merge tiles merged.tif
+    # python crop_merge_image.py polygonize newresult.tif newresult.shp --ignore 0
+    # python crop_merge_image.py txt set tiles band4_info.txt
+    import crop_or_mosaic
+    crop_or_mosaic.main()
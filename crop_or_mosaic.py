@@ -0,0 +1,217 @@
+#!/usr/bin/env python
+# -*- encoding: utf-8 -*-
+'''
+@File    :   crop_or_mosaic.py
+@Time    :   2026/10/19 20:31:47
+@Author  :   StrideH
+@Desc    :   command line entry: crop, merge, polygonize, rasterize, txt; each subcommand imports only what it needs
+'''
+
+import os
+import sys
+import time
+import argparse
+
+TIF_EXTENSIONS = ('.tif', '.tiff')
+
+
+# 波段参数: 预设名称(all, RGB, R, G, B, NIR)或波段号/表达式列表
+def _parse_channel(values):
+    if len(values) == 1 and not values[0].isdigit():
+        return values[0]
+    return [int(v) if v.isdigit() else v for v in values]
+
+
+# 标签筛选规则: --min-foreground, --require, --class-weight 类别=权重, --background
+def _parse_class_rules(args):
+    rules = {}
+    if args.background is not None:
+        rules['background'] = args.background
+    if args.min_foreground:
+        rules['min_foreground'] = args.min_foreground
+    if args.require is not None:
+        rules['require_any'] = args.require
+    if args.class_weight is not None:
+        rules['class_weights'] = {int(c): float(w) for c, w in (item.split('=') for item in args.class_weight)}
+    return rules or None
+
+
+def cmd_crop(args):
+    if args.channel is not None or args.pyramid is not None:
+        import crop_different_channels
+        crop_different_channels.crop_tif(args.input, args.output, args.size, args.supplement,
+                                         crop_channel=_parse_channel(args.channel or ['all']),
+                                         out_dtype=args.dtype, pyramid_levels=args.pyramid)
+        return
+    from crop_merge_image import GRID
+    if args.shp is not None:
+        GRID.crop_by_vector(args.input, args.shp, args.output, buffer=args.buffer, crop_size=args.size,
+                            is_mask=args.mask, workers=args.workers)
+    elif os.path.isdir(args.input):
+        GRID.batch_cut(args.input, args.output, args.size, is_supplement=args.supplement, workers=args.workers, stats=args.stats)
+    elif args.input.lower().endswith(TIF_EXTENSIONS):
+        GRID.crop_tif(args.input, args.output, args.size, is_supplement=args.supplement, container=args.container,
+                      shard_size=args.shard_size, dst_srs=args.dst_srs, dst_res=args.dst_res, stats=args.stats,
+                      incremental=args.incremental, mask_path=args.mask_path,
+                      class_rules=_parse_class_rules(args) if args.mask_path else None)
+    else:
+        GRID.crop_image(args.input, args.output, args.size, is_supplement=args.supplement,
+                        container=args.container, shard_size=args.shard_size, stats=args.stats,
+                        fast_format=args.fast_format, png_compression=args.png_compression)
+
+
+def cmd_merge(args):
+    from crop_merge_image import GRID
+    if not args.output.lower().endswith(TIF_EXTENSIONS):
+        GRID.merge_image(args.input, args.output)
+    elif args.txt is not None:
+        GRID.merge_tif_with_proj(args.input, args.output, args.txt)
+    else:
+        GRID.merge_tif(args.input, args.output, empty_txt=args.empty_txt, harmonize=args.harmonize,
+                       dst_srs=args.dst_srs, dst_res=args.dst_res, overlap=args.overlap, workers=args.workers)
+
+
+def cmd_polygonize(args):
+    if args.chunks is not None:
+        import fast_polygonize
+        if not os.path.exists(args.output):
+            os.makedirs(args.output)
+        fast_polygonize.usage(args.method, args.chunks[0], args.chunks[1], args.output, args.input, args.simplify).get_opts()
+        return
+    from crop_merge_image import GRID
+    if args.txt is not None:
+        GRID.tiles_to_vector(args.input, args.txt, args.output, ignore_values=args.ignore, workers=args.workers)
+    else:
+        GRID.raster2vector(args.input, args.output, ignore_values=args.ignore, simplify_tolerance=args.simplify,
+                           simplify_method=args.simplify_method, workers=args.workers)
+
+
+def cmd_rasterize(args):
+    from crop_merge_image import GRID
+    GRID.vector_to_raster(args.input, args.output, args.like, args.channel)
+
+
+def cmd_txt(args):
+    from crop_merge_image import GRID
+    if args.action == 'generate':
+        if os.path.isdir(args.input):
+            GRID.generate_txt_dir(args.input, args.txt, workers=args.workers)
+        else:
+            GRID.generate_txt(args.input, args.txt)
+    else:
+        if os.path.isdir(args.input):
+            GRID.set_txt_dir(args.input, args.txt, workers=args.workers)
+        else:
+            GRID.set_txt(args.input, args.txt)
+
+
+# --channel/--pyramid 由 crop_different_channels 切割, 不支持的选项直接报错, 不静默忽略
+def _check_crop_args(parser, args):
+    if args.channel is None and args.pyramid is None:
+        return
+    options = (('--container', args.container), ('--stats', args.stats), ('--incremental', args.incremental),
+               ('--dst-srs', args.dst_srs), ('--dst-res', args.dst_res), ('--mask-path', args.mask_path),
+               ('--shp', args.shp), ('--fast-format', args.fast_format), ('--png-compression', args.png_compression))
+    unsupported = [name for name, value in options if value not in (None, False)]
+    if unsupported:
+        parser.error('{} cannot be used with --channel/--pyramid'.format(', '.join(unsupported)))
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog='crop-or-mosaic', description='Crop, merge, polygonize and rasterize remote sensing images.')
+    parser.add_argument('--events', default=None, help='write structured events to this jsonl file')
+    parser.add_argument('--report', action='store_true', help='print read/compute/encode/write timings at the end')
+    sub = parser.add_subparsers(dest='command')
+    sub.required = True
+
+    p = sub.add_parser('crop', help='crop tif/jpg/png (or every tif in a folder) into tiles')
+    p.add_argument('input', help='image file, or folder for batch crop')
+    p.add_argument('output', help='save folder')
+    p.add_argument('--size', type=int, required=True, help='tile size')
+    p.add_argument('--supplement', action='store_true', help='crop the right/bottom remainder backwards')
+    p.add_argument('--container', choices=['tar', 'h5'], default=None, help='pack tiles into tar shards or one HDF5 file')
+    p.add_argument('--shard-size', type=int, default=1000, help='tiles per tar shard')
+    p.add_argument('--incremental', action='store_true', help='only regenerate tif tiles whose source blocks changed since the last run')
+    p.add_argument('--stats', action='store_true', help='write per-band mean/std/min/max/histogram to <name>_stats.json')
+    p.add_argument('--mask-path', default=None, help='label raster aligned with the tif; mask tiles go to <output>/mask')
+    p.add_argument('--min-foreground', type=float, default=0, help='keep tiles with at least this fraction of non-background labels')
+    p.add_argument('--require', type=int, nargs='+', default=None, help='keep tiles containing at least one of these classes')
+    p.add_argument('--class-weight', nargs='+', default=None, metavar='CLASS=WEIGHT', help='sampling weight per class, recorded in <name>_hist.txt')
+    p.add_argument('--background', type=int, nargs='+', default=None, help='background classes for --min-foreground (default 0)')
+    p.add_argument('--fast-format', choices=['png', 'tif', 'npy'], default=None,
+                   help='lossless tile format for jpg/png input (default: same format as the source)')
+    p.add_argument('--png-compression', type=int, default=None, help='png compression level 0-9 (default: 1 with --fast-format png, else the encoder default)')
+    p.add_argument('--dst-srs', default=None, help='reproject on the fly, e.g. EPSG:32650')
+    p.add_argument('--dst-res', type=float, default=None, help='target resolution for --dst-srs')
+    p.add_argument('--channel', nargs='+', default=None, help='all, RGB, R, G, B, NIR, or band numbers / expressions like "(b4-b3)/(b4+b3)"')
+    p.add_argument('--dtype', default=None, help='output data type for --channel, e.g. uint8, float32')
+    p.add_argument('--pyramid', type=int, nargs='+', default=None, help='also crop overview levels, e.g. 1 2 4')
+    p.add_argument('--shp', default=None, help='crop one chip per feature of this vector file')
+    p.add_argument('--buffer', type=float, default=0, help='feature buffer for --shp (map units)')
+    p.add_argument('--mask', action='store_true', help='mask pixels outside the feature for --shp')
+    p.add_argument('--workers', type=int, default=4)
+    p.set_defaults(func=cmd_crop)
+
+    p = sub.add_parser('merge', help='merge tiles back into one image')
+    p.add_argument('input', help='tile folder or tile container index (<name>_index.txt)')
+    p.add_argument('output', help='output image; .tif merges georeferenced tiles, otherwise jpg/png tiles')
+    p.add_argument('--txt', default=None, help='coordinate file (<name>_info.txt) to restore georeference while merging')
+    p.add_argument('--empty-txt', default=None, help='empty window file (<name>_empty.txt) from crop')
+    p.add_argument('--harmonize', action='store_true', help='inputs differ in crs, resolution or band count')
+    p.add_argument('--dst-srs', default=None)
+    p.add_argument('--dst-res', type=float, default=None)
+    p.add_argument('--overlap', choices=['first', 'last', 'max', 'mean'], default='last')
+    p.add_argument('--workers', type=int, default=4)
+    p.set_defaults(func=cmd_merge)
+
+    p = sub.add_parser('polygonize', help='raster (or tile set) to polygons')
+    p.add_argument('input', help='classification raster, or tile folder with --txt')
+    p.add_argument('output', help='output shp (output folder with --chunks)')
+    p.add_argument('--txt', default=None, help='polygonize a tile set using this coordinate file, without mosaicking')
+    p.add_argument('--ignore', type=float, nargs='+', default=None, help='class values to drop, e.g. 0')
+    p.add_argument('--simplify', type=float, default=None, help='topology-preserving simplification tolerance in pixels')
+    p.add_argument('--simplify-method', choices=['dp', 'visvalingam'], default='dp')
+    p.add_argument('--chunks', type=int, nargs=2, default=None, metavar=('X', 'Y'), help='split into X*Y chunks (fast_polygonize)')
+    p.add_argument('--method', choices=['single', 'serial', 'parallel', 'queue'], default='parallel', help='chunk mode for --chunks')
+    p.add_argument('--workers', type=int, default=4)
+    p.set_defaults(func=cmd_polygonize)
+
+    p = sub.add_parser('rasterize', help='burn a vector file into a raster aligned with a tif')
+    p.add_argument('input', help='vector file')
+    p.add_argument('output', help='output raster')
+    p.add_argument('--like', required=True, help='tif providing size, extent and projection')
+    p.add_argument('--channel', choices=['single', 'multi'], default='single')
+    p.set_defaults(func=cmd_rasterize)
+
+    p = sub.add_parser('txt', help='generate or apply coordinate (georeference) files')
+    p.add_argument('action', choices=['generate', 'set'])
+    p.add_argument('input', help='tif file or folder')
+    p.add_argument('txt', help='coordinate file')
+    p.add_argument('--workers', type=int, default=8)
+    p.set_defaults(func=cmd_txt)
+    return parser
+
+
+def main(argv=None):
+    parser = build_parser()
+    args = parser.parse_args(argv)
+    if args.command == 'crop':
+        _check_crop_args(parser, args)
+    sink = None
+    if args.events or args.report:
+        import instrument
+        if args.events:
+            sink = instrument.JsonlSink(args.events)
+            instrument.set_sink(sink)
+    start = time.time()
+    args.func(args)
+    print('time: {:.2f}s'.format(time.time() - start))
+    if args.report:
+        instrument.report()
+    if sink is not None:
+        sink.close()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -9,15 +9,17 @@
 
 
 import os
-from osgeo import gdal
+import argparse
+from osgeo import gdal, ogr
 from multiprocessing import Pool
-import subprocess
 import time
 import shutil
 import re
+import instrument
+import simplify
 
 # 裁剪tif成xtiles * ytiles的小块
-def split_raster(raster, xtiles, ytiles):
+def split_raster(raster, xtiles, ytiles, out_dir='output'):
     # get raster bounds
     # 获取栅格边界
     ul = [float(i) for i in re.findall(r'\d+\.\d+', gdal.Info(raster).split('Upper Left')[1].split(')')[0])]    # 左上角坐标
@@ -34,7 +36,7 @@ def split_raster(raster, xtiles, ytiles):
             ymin = ymax - ydif
             # Create chunk of source raster
             gdal.Translate(
-                f'output/{x}_{y}.tif',
+                os.path.join(out_dir, f'{x}_{y}.tif'),
                 raster,
                 projWin=[xmin, ymax, xmax, ymin],
                 format='GTiff'
@@ -42,126 +44,178 @@ def split_raster(raster, xtiles, ytiles):
             ymax = ymin
         xmin = xmax
 
+# 进程内转矢量(等同 gdal_polygonize.py -nomask -8), 返回DN不为0的面 [(DN, wkb)]
+def polygonize_chunk(raster):
+    ds = gdal.Open(raster)
+    mem = ogr.GetDriverByName('Memory').CreateDataSource('')
+    layer = mem.CreateLayer('polygonize', None, ogr.wkbPolygon)
+    layer.CreateField(ogr.FieldDefn('DN', ogr.OFTInteger))
+    gdal.Polygonize(ds.GetRasterBand(1), None, layer, 0, ['8CONNECTED=8'])
+    features = [(feature.GetField(0), feature.GetGeometryRef().ExportToWkb()) for feature in layer if feature.GetField(0) != 0]
+    mem = None
+    ds = None
+    return raster, features
+
 # 栅格转矢量
 class usage():
-    def __init__(self, model, XCHUNKS, YCHUNKS, OUTPUT, RASTER):
+    def __init__(self, model, XCHUNKS, YCHUNKS, OUTPUT, RASTER, SIMPLIFY=None):
         self.model = model
         self.XCHUNKS = XCHUNKS
         self.YCHUNKS = YCHUNKS
         self.OUTPUT = OUTPUT
         self.RASTER = RASTER
+        self.SIMPLIFY = SIMPLIFY    # 简化容差(像元数), None为不简化
     
     # 选择转换模式
     def get_opts(self):
         if self.model == 'all' or self.model == 'single':
             print('Testing ' + self.RASTER + ' as a single file:')
-            self.single_file()
+            with instrument.timer('fast_polygonize', 'compute'):
+                self.single_file()
+            self.simplify_output('single')
         if self.model == 'all' or self.model == 'serial':
             print('Testing ' + self.RASTER + ' in serial:')
             self.in_serial()
+            self.simplify_output('serial')
         if self.model == 'all' or self.model == 'parallel':
             print('Testing ' + self.RASTER + ' in parallel:')
             self.in_parallel()
-    
+            self.simplify_output('parallel')
+        if self.model == 'all' or self.model == 'queue':
+            print('Testing ' + self.RASTER + ' with work queue:')
+            self.in_queue()
+            self.simplify_output('queue')
+
+    # 合并结果的保持拓扑简化, 分块接缝处的共享边同样只简化一次
+    def simplify_output(self, mode):
+        if not self.SIMPLIFY:
+            return
+        pixel_size = abs(gdal.Open(self.RASTER).GetGeoTransform()[1])
+        with instrument.timer('fast_polygonize', 'compute'):
+            simplify.simplify_file(os.path.join(self.OUTPUT, "out_" + mode + ".shp"), os.path.join(self.OUTPUT, "out_" + mode + "_simplified.shp"), self.SIMPLIFY * pixel_size)
+
+    # 创建输出shp, 字段与 gdal_polygonize.py 一致(DN)
+    def create_output(self, mode):
+        path = os.path.join(self.OUTPUT, "out_" + mode + ".shp")
+        driver = ogr.GetDriverByName('ESRI Shapefile')
+        if os.path.exists(path):
+            driver.DeleteDataSource(path)
+        source = driver.CreateDataSource(path)
+        layer = source.CreateLayer("out_" + mode, gdal.Open(self.RASTER).GetSpatialRef(), ogr.wkbPolygon)
+        layer.CreateField(ogr.FieldDefn('DN', ogr.OFTInteger))
+        return source, layer
+
+    # 追加面要素
+    def append_features(self, layer, features):
+        layer.StartTransaction()
+        for value, wkb in features:
+            feature = ogr.Feature(layer.GetLayerDefn())
+            feature.SetField(0, value)
+            feature.SetGeometry(ogr.CreateGeometryFromWkb(wkb))
+            layer.CreateFeature(feature)
+        layer.CommitTransaction()
+
     # 单个文件直接转矢量
     def single_file(self):
-        # 整栅格转矢量
-        subprocess.call(["python", "gdal_polygonize.py", self.RASTER, "-f", "ESRI Shapefile", self.OUTPUT + "/temp_single.shp", "-nomask", "-8"])
-        # 删除DN为0的面
-        subprocess.call(["ogr2ogr", "-f", "ESRI Shapefile", self.OUTPUT + "/out_single.shp", self.OUTPUT + "/temp_single.shp", "-where", "DN != 0"])
-        # 删除临时文件
-        os.remove(self.OUTPUT + "/temp_single.shp")
-        os.remove(self.OUTPUT + "/temp_single.shx")
-        os.remove(self.OUTPUT + "/temp_single.dbf")
-        os.remove(self.OUTPUT + "/temp_single.prj")
+        # 整栅格转矢量, 删除DN为0的面
+        _, features = polygonize_chunk(self.RASTER)
+        source, layer = self.create_output('single')
+        self.append_features(layer, features)
+        # 关闭数据源, 写入磁盘
+        del source
 
     # 分块转矢量
     def in_serial(self):
         # 切割栅格
-        split_raster(self.RASTER, self.XCHUNKS, self.YCHUNKS)
-        
+        with instrument.timer('fast_polygonize', 'read'):
+            split_raster(self.RASTER, self.XCHUNKS, self.YCHUNKS, self.OUTPUT)
+        source, layer = self.create_output('serial')
         for x in range(0, self.XCHUNKS):
             for y in range(0, self.YCHUNKS):
+                chunk_start = time.perf_counter()
+                chunk = os.path.join(self.OUTPUT, str(x) + "_" + str(y) + ".tif")
                 # 小块栅格转矢量
-                subprocess.call(["python", "gdal_polygonize.py", self.OUTPUT + str(x) + "_" + str(y) + ".tif", "-f", "ESRI Shapefile", self.OUTPUT + "/serial_" + str(x) + "_" + str(y) + ".shp", "-nomask", "-8"])
+                with instrument.timer('fast_polygonize', 'compute'):
+                    _, features = polygonize_chunk(chunk)
                 # 删除DN为0的面并合并
-                subprocess.call(["ogr2ogr", "-f", "ESRI Shapefile", self.OUTPUT + "/out_serial.shp", self.OUTPUT + "/serial_" + str(x) + "_" + str(y) + ".shp", "-update", "-append", "-where", "DN != 0"])
+                with instrument.timer('fast_polygonize', 'write'):
+                    self.append_features(layer, features)
+                instrument.emit('fast_polygonize', tile=str(x) + "_" + str(y), duration=time.perf_counter() - chunk_start)
                 # 删除临时文件
-                os.remove(self.OUTPUT + str(x) + "_" + str(y) + ".tif")
-                os.remove(self.OUTPUT + "/serial_" + str(x) + "_" + str(y) + ".shp")
-                os.remove(self.OUTPUT + "/serial_" + str(x) + "_" + str(y) + ".shx")
-                os.remove(self.OUTPUT + "/serial_" + str(x) + "_" + str(y) + ".dbf")
-                os.remove(self.OUTPUT + "/serial_" + str(x) + "_" + str(y) + ".prj")
-
-    # 分块并行转矢量，使用多进程
-    def polygonize_test(self, chunk):
-        # 小块栅格转矢量
-        subprocess.call(["python", "gdal_polygonize.py", "-q", self.OUTPUT + chunk + ".tif", "-f", "ESRI Shapefile", self.OUTPUT + "/parallel_" + chunk + ".shp", "-nomask", "-8"])
-        # 删除DN为0的面并合并
-        subprocess.call(["ogr2ogr", "-f", "ESRI Shapefile", self.OUTPUT + "/out_parallel.shp", self.OUTPUT + "/parallel_" + chunk + ".shp", "-update", "-append", "-where", "DN != 0"])
-        return chunk
+                os.remove(chunk)
+        del source
 
     # 分块并行转矢量
     def in_parallel(self):
         # 切割栅格
-        split_raster(self.RASTER, self.XCHUNKS, self.YCHUNKS)
-        # 多进程
-        pool = Pool(processes=4)
-        chunks = []
-        for x in range(0, self.XCHUNKS):
-            for y in range(0, self.YCHUNKS):
-                chunks.append(str(x) + "_" + str(y))
-                pool.apply_async(self.polygonize_test, (str(x) + "_" + str(y),))
-                time.sleep(0.1) # 防止进程太快，导致文件未生成
-                # print(k.get())
-        
-        # 关闭进程池
-        pool.close()
-        pool.join()
+        with instrument.timer('fast_polygonize', 'read'):
+            split_raster(self.RASTER, self.XCHUNKS, self.YCHUNKS, self.OUTPUT)
+        chunks = [os.path.join(self.OUTPUT, str(x) + "_" + str(y) + ".tif") for x in range(0, self.XCHUNKS) for y in range(0, self.YCHUNKS)]
+        # 多进程转矢量, 子进程只返回要素, 由主进程统一写入(shp不支持多进程同时写)
+        with instrument.timer('fast_polygonize', 'compute'):
+            with Pool(processes=4) as pool:
+                results = []
+                for chunk, features in pool.imap_unordered(polygonize_chunk, chunks):
+                    instrument.emit('fast_polygonize', tile=os.path.basename(chunk), features=len(features))
+                    results.append(features)
+        with instrument.timer('fast_polygonize', 'write'):
+            source, layer = self.create_output('parallel')
+            for features in results:
+                self.append_features(layer, features)
+            del source
 
         # 删除临时文件
         for chunk in chunks:
-            os.remove(self.OUTPUT + chunk + ".tif")
-            os.remove(self.OUTPUT + "/parallel_" + chunk + ".shp")
-            os.remove(self.OUTPUT + "/parallel_" + chunk + ".shx")
-            os.remove(self.OUTPUT + "/parallel_" + chunk + ".dbf")
-            os.remove(self.OUTPUT + "/parallel_" + chunk + ".prj")
+            os.remove(chunk)
 
-if __name__ == '__main__':
-    # 添加环境变量
-    # os.environ['GDAL_PATH_PY'] = r'C:\Users\YeZiyu\.conda\envs\geo\Lib\site-packages\osgeo_utils'
-    # os.environ['GDAL_PATH'] = r'C:\Users\YeZiyu\.conda\envs\geo\Scripts'
-    
-    if os.path.exists('input'):
-        shutil.rmtree('input')
-    if os.path.exists('output'):
-        shutil.rmtree('output')
-    
-    os.mkdir('input')
-    os.mkdir('output')
-    
-
-    INPUT = r'E:\jsnu\#00_project\mon\11.3号之前\测试数据\newresult.tif'    # 输入栅格
-    OUTPUT='./output/'  # 输出路径
-    RASTER='./input/temp.vrt'   # 临时虚拟栅格
-
-    XCHUNKS = 3 # 横向切割块数
-    YCHUNKS = 3 # 纵向切割块数
+    # 通过共享目录任务队列分块转矢量, 其他机器可对同一队列目录运行 work_queue.py work 加入
+    def in_queue(self, workers=4):
+        import work_queue
+        queue_dir = os.path.join(self.OUTPUT, 'queue')
+        # 只删除上次运行留下的队列目录
+        if os.path.exists(os.path.join(queue_dir, 'plan.json')):
+            shutil.rmtree(queue_dir)
+        elif os.path.exists(queue_dir):
+            print('Error: {} exists and is not a work queue.'.format(queue_dir))
+            return
+        work_queue.plan_polygonize(queue_dir, self.RASTER, os.path.join(self.OUTPUT, "out_queue.shp"),
+                                   self.XCHUNKS, self.YCHUNKS, ignore_values=[0], field_name='DN')
+        with instrument.timer('fast_polygonize', 'compute'):
+            work_queue.run_local(queue_dir, workers)
 
+if __name__ == '__main__':
     # 源代码 用时18.8s
     # single 用时26s
     # 测试了x,y均为2,3,4时的用时
     # serial (x, y) = (2, 2)时用时最短 用时15s
     # parallel (x, y) = (3, 3)时用时最短 用时8.6s
-    METHOD = 'single' # 转矢量方法，single为单进程，serial为分块串行，parallel为分块并行
+    parser = argparse.ArgumentParser(description='Polygonize a raster as a single file, in serial chunks or in parallel chunks.')
+    parser.add_argument('input', help='输入栅格')
+    parser.add_argument('--output', default='./output/', help='输出路径')
+    parser.add_argument('--method', default='parallel', choices=['single', 'serial', 'parallel', 'queue', 'all'],
+                        help='转矢量方法，single为单进程，serial为分块串行，parallel为分块并行')
+    parser.add_argument('--xchunks', type=int, default=3, help='横向切割块数')
+    parser.add_argument('--ychunks', type=int, default=3, help='纵向切割块数')
+    parser.add_argument('--nodata', type=float, default=255, help='虚拟栅格的nodata值')
+    parser.add_argument('--simplify', type=float, default=None, help='简化容差(像元数)，默认不简化')
+    parser.add_argument('--overwrite', action='store_true', help='输出路径非空时仍运行, 覆盖本脚本生成的文件')
+    args = parser.parse_args()
+
+    # 不删除用户目录, 非空时需显式指定 --overwrite
+    if os.path.exists(args.output) and os.listdir(args.output) and not args.overwrite:
+        print('Error: {} is not empty, use --overwrite to write into it.'.format(args.output))
+        raise SystemExit(1)
+    os.makedirs(args.output, exist_ok=True)
+    RASTER = os.path.join(args.output, 'temp.vrt')   # 临时虚拟栅格
 
     # make VRT, white=nodata
-    os.system('gdal_translate -q -a_nodata 255 -of VRT ' + INPUT + ' ' + RASTER)
+    gdal.Translate(RASTER, args.input, format='VRT', noData=args.nodata)
 
     # 实例化类
-    polygonize = usage(METHOD, XCHUNKS, YCHUNKS, OUTPUT, RASTER)
+    polygonize = usage(args.method, args.xchunks, args.ychunks, args.output, RASTER, args.simplify)
 
     # 转矢量
     start = time.time()
     polygonize.get_opts()
-    print('time: ', time.time() - start)
\ No newline at end of file
+    print('time: ', time.time() - start)
+    os.remove(RASTER)
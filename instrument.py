@@ -0,0 +1,124 @@
+#!/usr/bin/env python
+# -*- encoding: utf-8 -*-
+'''
+@File    :   instrument.py
+@Time    :   2026/10/19 11:03:17
+@Author  :   StrideH
+@Desc    :   structured progress events and per-stage read/compute/encode/write timing
+'''
+
+import json
+import time
+import logging
+import threading
+from collections import defaultdict
+from contextlib import contextmanager
+
+# 计时阶段
+PHASES = ('read', 'compute', 'encode', 'write')
+
+_lock = threading.Lock()
+_sink = None
+_seconds = defaultdict(float)   # (stage, phase) -> 累计耗时
+_calls = defaultdict(int)       # (stage, phase) -> 调用次数
+_bytes = defaultdict(int)       # (stage, phase) -> 处理字节数
+
+
+# 输出到logging
+class LoggingSink:
+    def __init__(self, logger=None, level=logging.INFO):
+        self.logger = logger or logging.getLogger('crop_or_mosaic')
+        self.level = level
+
+    def __call__(self, event):
+        self.logger.log(self.level, json.dumps(event, ensure_ascii=False))
+
+
+# 输出到jsonl文件, 每行一个事件
+class JsonlSink:
+    def __init__(self, path):
+        self.path = path
+        self.f = open(path, 'a', encoding='utf-8')
+
+    def __call__(self, event):
+        with _lock:
+            self.f.write(json.dumps(event, ensure_ascii=False))
+            self.f.write('\n')
+
+    def close(self):
+        self.f.close()
+
+
+def set_sink(sink):
+    '''
+    :param sink: 事件接收者, LoggingSink / JsonlSink / 任意 callable(event), None 为关闭(默认)
+    '''
+    global _sink
+    _sink = sink
+
+
+def enabled():
+    return _sink is not None
+
+
+# 发送一个结构化事件, 未设置sink时不做任何事
+def emit(stage, **fields):
+    if _sink is None:
+        return
+    event = {'time': time.time(), 'stage': stage}
+    event.update(fields)
+    _sink(event)
+
+
+# 累计某个阶段的耗时
+@contextmanager
+def timer(stage, phase, nbytes=0):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        duration = time.perf_counter() - start
+        with _lock:
+            _seconds[(stage, phase)] += duration
+            _calls[(stage, phase)] += 1
+            _bytes[(stage, phase)] += nbytes
+
+
+def add_bytes(stage, phase, nbytes):
+    with _lock:
+        _bytes[(stage, phase)] += nbytes
+
+
+def counters():
+    '''
+    :return: {stage: {phase: {'seconds', 'calls', 'bytes'}}}
+    '''
+    result = {}
+    with _lock:
+        for (stage, phase), seconds in _seconds.items():
+            result.setdefault(stage, {})[phase] = {
+                'seconds': seconds,
+                'calls': _calls[(stage, phase)],
+                'bytes': _bytes[(stage, phase)],
+            }
+    return result
+
+
+def reset():
+    with _lock:
+        _seconds.clear()
+        _calls.clear()
+        _bytes.clear()
+
+
+# 打印各阶段耗时占比
+def report():
+    stats = counters()
+    print('{:<24}{:<10}{:>10}{:>10}{:>8}'.format('stage', 'phase', 'seconds', 'calls', 'share'))
+    for stage in sorted(stats):
+        total = sum(v['seconds'] for v in stats[stage].values()) or 1
+        # 固定阶段在前, 其他阶段(如 crop_tif 的 binarize)按名称排在后面
+        for phase in PHASES + tuple(sorted(set(stats[stage]) - set(PHASES))):
+            if phase in stats[stage]:
+                v = stats[stage][phase]
+                print('{:<24}{:<10}{:>10.3f}{:>10}{:>8.1%}'.format(stage, phase, v['seconds'], v['calls'], v['seconds'] / total))
@@ -0,0 +1,240 @@
+#!/usr/bin/env python
+# -*- encoding: utf-8 -*-
+'''
+@File    :   mosaic.py
+@Time    :   2026/10/19 17:05:52
+@Author  :   StrideH
+@Desc    :   merge tifs with mixed crs, resolution and band count: group, pre-warp in parallel, then mosaic in one pass
+'''
+
+import math
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+from osgeo import gdal, osr, gdal_array
+import instrument
+
+# 重叠区域处理方式
+OVERLAP_POLICIES = ('first', 'last', 'max', 'mean')
+
+
+# 只读取元数据
+def describe(path):
+    ds = gdal.Open(path)
+    if ds is None:
+        return None
+    gt = ds.GetGeoTransform()
+    srs = osr.SpatialReference()
+    srs.ImportFromWkt(ds.GetProjection())
+    band = ds.GetRasterBand(1)
+    info = {
+        'path': path,
+        'wkt': ds.GetProjection(),
+        'srs': srs,
+        'res': (abs(gt[1]), abs(gt[5])),
+        'bands': ds.RasterCount,
+        'data_type': band.DataType,
+        'nodata': band.GetNoDataValue(),
+        'pixels': ds.RasterXSize * ds.RasterYSize,
+        'bounds': (gt[0], gt[3] + ds.RasterYSize * gt[5], gt[0] + ds.RasterXSize * gt[1], gt[3]),
+    }
+    ds = None
+    return info
+
+
+# 按坐标系、分辨率和波段数分组
+def group_inputs(file_list, workers=4):
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        infos = [info for info in pool.map(describe, file_list) if info is not None]
+    groups = []
+    for info in infos:
+        for group in groups:
+            head = group[0]
+            if head['srs'].IsSame(info['srs']) and head['bands'] == info['bands'] and \
+                    all(math.isclose(a, b, rel_tol=1e-6) for a, b in zip(head['res'], info['res'])):
+                group.append(info)
+                break
+        else:
+            groups.append([info])
+    return groups
+
+
+# 所有输入的公共数据类型(如Byte与UInt16提升为UInt16)
+def common_data_type(infos):
+    dtype = np.result_type(*[gdal_array.GDALTypeCodeToNumericTypeCode(info['data_type']) for info in infos])
+    return gdal_array.NumericTypeCodeToGDALTypeCode(dtype.type)
+
+
+# 将一个文件重投影/重采样到目标坐标系、分辨率和数据类型, 结果写入/vsimem/, 返回 (结果路径, 创建的临时文件)
+def _warp_one(args):
+    k, token, info, dst_wkt, res, bands, data_type, resampling = args
+    created = []
+    src = info['path']
+    if info['bands'] > bands:
+        # 多余的波段只保留前bands个
+        src = '/vsimem/mosaic_{}_bands_{}.vrt'.format(token, k)
+        gdal.Translate(src, info['path'], format='VRT', bandList=list(range(1, bands + 1)))
+        created.append(src)
+    out_path = '/vsimem/mosaic_{}_{}.tif'.format(token, k)
+    options = {'dstSRS': dst_wkt, 'xRes': res[0], 'yRes': res[1], 'targetAlignedPixels': True,
+               'resampleAlg': resampling, 'multithread': True, 'outputType': data_type}
+    if info['nodata'] is not None:
+        options.update(srcNodata=info['nodata'], dstNodata=info['nodata'])
+    gdal.Warp(out_path, src, **options)
+    created.append(out_path)
+    return out_path, created
+
+
+def merge(file_list, save_path, dst_srs=None, dst_res=None, overlap='last', workers=4, resampling='near', strip_rows=512):
+    '''
+    :param file_list: 待合并tif列表(坐标系、分辨率、波段数可不同)
+    :param save_path: 合并后tif保存路径
+    :param dst_srs: 目标坐标系, 默认使用像素总数最多的一组
+    :param dst_res: 目标分辨率, 默认使用目标组的分辨率(设置dst_srs时为目标组重投影后的分辨率)
+    :param overlap: 重叠区域处理方式, first/last为先/后输入的优先, max为最大值, mean为均值
+    :param workers: 预重投影线程数
+    :param resampling: 重采样方式
+    :param strip_rows: max/mean 模式每次处理的行数
+    :return: merge tif
+    '''
+    if overlap not in OVERLAP_POLICIES:
+        print('Error: overlap must be one of {}.'.format(OVERLAP_POLICIES))
+        return
+    with instrument.timer('mosaic', 'read'):
+        groups = group_inputs(file_list, workers)
+    if len(groups) == 0:
+        print('Error: No valid tif in input.')
+        return
+    # 目标: 像素总数最多的一组
+    target = max(groups, key=lambda g: sum(info['pixels'] for info in g))
+    if dst_srs is not None:
+        srs = osr.SpatialReference()
+        srs.SetFromUserInput(dst_srs)
+        dst_wkt = srs.ExportToWkt()
+    else:
+        srs = target[0]['srs']
+        dst_wkt = target[0]['wkt']
+    if dst_res is not None:
+        res = (dst_res, dst_res)
+    elif dst_srs is not None and not target[0]['srs'].IsSame(srs):
+        # 目标组原分辨率的单位是其自身坐标系的单位(如度), 取重投影后的分辨率
+        probe = gdal.Warp('', target[0]['path'], format='VRT', dstSRS=dst_wkt)
+        gt = probe.GetGeoTransform()
+        res = (abs(gt[1]), abs(gt[5]))
+        probe = None
+    else:
+        res = target[0]['res']
+    bands = target[0]['bands']
+    data_type = common_data_type([info for group in groups for info in group])
+    nodata = target[0]['nodata']
+    print('Merge {} files in {} groups, target bands: {}, resolution: {}, data type: {}'.format(
+        sum(len(g) for g in groups), len(groups), bands, res, gdal.GetDataTypeName(data_type)))
+
+    # 与目标不一致的文件并行预重投影, 保持输入顺序
+    # 临时文件名带唯一标识, 同一进程内并发合并互不覆盖
+    token = uuid.uuid4().hex
+    order = {path: k for k, path in enumerate(file_list)}
+    jobs = []
+    sources = {}
+    created = []
+    for group in groups:
+        head = group[0]
+        same = head['srs'].IsSame(srs) and head['bands'] == bands and \
+            all(math.isclose(a, b, rel_tol=1e-6) for a, b in zip(head['res'], res))
+        for info in group:
+            if same and info['data_type'] == data_type:
+                sources[order[info['path']]] = info['path']
+            elif info['bands'] < bands:
+                print('Error: {} has {} bands < {}, skip.'.format(info['path'], info['bands'], bands))
+            else:
+                jobs.append((order[info['path']], token, info, dst_wkt, res, bands, data_type, resampling))
+    try:
+        with instrument.timer('mosaic', 'compute'):
+            with ThreadPoolExecutor(max_workers=workers) as pool:
+                for (k, *_), (path, paths) in zip(jobs, pool.map(_warp_one, jobs)):
+                    sources[k] = path
+                    created.extend(paths)
+        inputs = [sources[k] for k in sorted(sources)]
+
+        if overlap in ('first', 'last'):
+            # vrt中后加入的数据覆盖先加入的
+            vrt_inputs = inputs[::-1] if overlap == 'first' else inputs
+            with instrument.timer('mosaic', 'write'):
+                vrt = gdal.BuildVRT('', vrt_inputs, xRes=res[0], yRes=res[1], targetAlignedPixels=True, resampleAlg=resampling)
+                gdal.Translate(save_path, vrt, outputType=data_type, creationOptions=['TILED=YES', 'BIGTIFF=IF_SAFER'])
+                vrt = None
+        else:
+            _merge_reduce(inputs, save_path, dst_wkt, res, bands, data_type, nodata, overlap, resampling, strip_rows)
+    finally:
+        # 只删除本次创建的临时文件
+        for path in created:
+            gdal.Unlink(path)
+    instrument.emit('mosaic', tiles=len(inputs), output=save_path, overlap=overlap)
+    print('Success merge tif file. save path: {}'.format(save_path))
+
+
+# max/mean: 按行条带流式处理, 每个条带只读取与其相交的输入
+def _merge_reduce(inputs, save_path, wkt, res, bands, data_type, nodata, overlap, resampling, strip_rows):
+    # 输入范围对齐到分辨率整数倍
+    infos = [describe(path) for path in inputs]
+    xmin = math.floor(min(i['bounds'][0] for i in infos) / res[0]) * res[0]
+    ymin = math.floor(min(i['bounds'][1] for i in infos) / res[1]) * res[1]
+    xmax = math.ceil(max(i['bounds'][2] for i in infos) / res[0]) * res[0]
+    ymax = math.ceil(max(i['bounds'][3] for i in infos) / res[1]) * res[1]
+    width = int(round((xmax - xmin) / res[0]))
+    height = int(round((ymax - ymin) / res[1]))
+    out_dtype = gdal_array.GDALTypeCodeToNumericTypeCode(data_type)
+    fill = 0 if nodata is None else nodata
+
+    out_data = gdal.GetDriverByName('GTiff').Create(save_path, width, height, bands, data_type, options=['TILED=YES', 'BIGTIFF=IF_SAFER'])
+    out_data.SetGeoTransform((xmin, res[0], 0, ymax, 0, -res[1]))
+    out_data.SetProjection(wkt)
+    if nodata is not None:
+        for k in range(bands):
+            out_data.GetRasterBand(k + 1).SetNoDataValue(nodata)
+
+    # 每个输入以vrt方式对齐到输出格网, 记录其在输出中的像素窗口
+    windows = []
+    for info in infos:
+        b = info['bounds']
+        x0 = int(math.floor((b[0] - xmin) / res[0] + 1e-6))
+        x1 = int(math.ceil((b[2] - xmin) / res[0] - 1e-6))
+        y0 = int(math.floor((ymax - b[3]) / res[1] + 1e-6))
+        y1 = int(math.ceil((ymax - b[1]) / res[1] - 1e-6))
+        bounds = (xmin + x0 * res[0], ymax - y1 * res[1], xmin + x1 * res[0], ymax - y0 * res[1])
+        vrt = gdal.BuildVRT('', [info['path']], outputBounds=bounds, xRes=res[0], yRes=res[1], resampleAlg=resampling)
+        windows.append((vrt, x0, y0, x1 - x0, y1 - y0, info['nodata']))
+
+    for row in range(0, height, strip_rows):
+        rows = min(strip_rows, height - row)
+        acc = np.zeros((bands, rows, width), dtype=np.float64)
+        count = np.zeros((rows, width), dtype=np.uint32)
+        for vrt, x0, y0, w, h, src_nodata in windows:
+            top, bottom = max(row, y0), min(row + rows, y0 + h)
+            if top >= bottom:
+                continue
+            with instrument.timer('mosaic', 'read'):
+                data = vrt.ReadAsArray(0, top - y0, w, bottom - top).reshape(bands, bottom - top, w).astype(np.float64)
+            with instrument.timer('mosaic', 'compute'):
+                valid = np.ones(data.shape[1:], dtype=bool) if src_nodata is None else np.all(data != src_nodata, axis=0)
+                dst = acc[:, top - row: bottom - row, x0: x0 + w]
+                cnt = count[top - row: bottom - row, x0: x0 + w]
+                if overlap == 'max':
+                    first = valid & (cnt == 0)
+                    dst[:, first] = data[:, first]
+                    both = valid & (cnt > 0)
+                    dst[:, both] = np.maximum(dst[:, both], data[:, both])
+                else:
+                    dst[:, valid] += data[:, valid]
+                cnt[valid] += 1
+        with instrument.timer('mosaic', 'compute'):
+            if overlap == 'mean':
+                np.divide(acc, count, out=acc, where=count > 0)
+            acc[:, count == 0] = fill
+        with instrument.timer('mosaic', 'write', acc.nbytes):
+            for k in range(bands):
+                band = np.rint(acc[k]) if np.issubdtype(out_dtype, np.integer) else acc[k]
+                out_data.GetRasterBand(k + 1).WriteArray(band.astype(out_dtype), 0, row)
+    out_data.FlushCache()
+    out_data = None
+    windows = None
@@ -0,0 +1,385 @@
+#!/usr/bin/env python
+# -*- encoding: utf-8 -*-
+'''
+@File    :   simplify.py
+@Time    :   2026/10/19 18:40:26
+@Author  :   StrideH
+@Desc    :   topology-preserving simplification of polygonize output: shared edges are simplified once as arcs
+'''
+
+import os
+import heapq
+from bisect import bisect_right, bisect_left
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor
+import tile_index
+
+# 简化方法
+METHODS = ('dp', 'visvalingam')
+
+
+def _seg_dist2(p, a, b):
+    dx = b[0] - a[0]
+    dy = b[1] - a[1]
+    if dx == 0 and dy == 0:
+        return (p[0] - a[0]) ** 2 + (p[1] - a[1]) ** 2
+    t = max(0.0, min(1.0, ((p[0] - a[0]) * dx + (p[1] - a[1]) * dy) / (dx * dx + dy * dy)))
+    return (p[0] - a[0] - t * dx) ** 2 + (p[1] - a[1] - t * dy) ** 2
+
+
+# Douglas-Peucker, 保留首尾点
+def douglas_peucker(points, tolerance):
+    if len(points) < 3:
+        return list(points)
+    tol2 = tolerance * tolerance
+    keep = [False] * len(points)
+    keep[0] = keep[-1] = True
+    stack = [(0, len(points) - 1)]
+    while stack:
+        first, last = stack.pop()
+        max_d, index = -1.0, first
+        for k in range(first + 1, last):
+            d = _seg_dist2(points[k], points[first], points[last])
+            if d > max_d:
+                max_d, index = d, k
+        if max_d > tol2:
+            keep[index] = True
+            stack.append((first, index))
+            stack.append((index, last))
+    return [p for p, k in zip(points, keep) if k]
+
+
+def _area(a, b, c):
+    return abs((b[0] - a[0]) * (c[1] - a[1]) - (c[0] - a[0]) * (b[1] - a[1])) / 2
+
+
+# Visvalingam-Whyatt, 删除三角形面积小于 tolerance^2 的点, 保留首尾点
+def visvalingam(points, tolerance):
+    n = len(points)
+    if n < 3:
+        return list(points)
+    threshold = tolerance * tolerance
+    prev = list(range(-1, n - 1))
+    nxt = list(range(1, n + 1))
+    removed = [False] * n
+    heap = [(_area(points[k - 1], points[k], points[k + 1]), k) for k in range(1, n - 1)]
+    heapq.heapify(heap)
+    current = {k: a for a, k in heap}
+    while heap:
+        area, k = heapq.heappop(heap)
+        if removed[k] or current.get(k) != area:
+            continue
+        if area >= threshold:
+            break
+        removed[k] = True
+        p, q = prev[k], nxt[k]
+        nxt[p] = q
+        prev[q] = p
+        for m in (p, q):
+            if 0 < m < n - 1:
+                current[m] = _area(points[prev[m]], points[m], points[nxt[m]])
+                heapq.heappush(heap, (current[m], m))
+    return [p for p, r in zip(points, removed) if not r]
+
+
+def simplify_arc(points, tolerance, method='dp'):
+    '''
+    :param points: 折线点列, 首尾点固定; 首尾相同时为闭合弧段
+    :return: 简化后的点列
+    '''
+    func = douglas_peucker if method == 'dp' else visvalingam
+    if len(points) > 3 and points[0] == points[-1]:
+        # 闭合弧段在距起点最远处拆成两段, 保证至少保留三个不同点
+        far = max(range(1, len(points) - 1), key=lambda k: _seg_dist2(points[k], points[0], points[0]))
+        return func(points[:far + 1], tolerance)[:-1] + func(points[far:], tolerance)
+    return func(points, tolerance)
+
+
+def _simplify_chunk(args):
+    arcs, tolerance, method = args
+    return [simplify_arc(arc, tolerance, method) for arc in arcs]
+
+
+# 在水平/竖直边上插入其他环落在该边上的顶点, 使共享边的顶点完全一致
+def _densify(rings):
+    by_x = defaultdict(set)
+    by_y = defaultdict(set)
+    for ring in rings:
+        for x, y in ring:
+            by_x[x].add(y)
+            by_y[y].add(x)
+    by_x = {k: sorted(v) for k, v in by_x.items()}
+    by_y = {k: sorted(v) for k, v in by_y.items()}
+    result = []
+    for ring in rings:
+        out = []
+        n = len(ring)
+        for k in range(n):
+            a, b = ring[k], ring[(k + 1) % n]
+            out.append(a)
+            if a[0] == b[0] and a[1] != b[1]:
+                ys = by_x[a[0]]
+                lo, hi = min(a[1], b[1]), max(a[1], b[1])
+                mid = ys[bisect_right(ys, lo): bisect_left(ys, hi)]
+                out.extend((a[0], y) for y in (mid if b[1] > a[1] else reversed(mid)))
+            elif a[1] == b[1] and a[0] != b[0]:
+                xs = by_y[a[1]]
+                lo, hi = min(a[0], b[0]), max(a[0], b[0])
+                mid = xs[bisect_right(xs, lo): bisect_left(xs, hi)]
+                out.extend((x, a[1]) for x in (mid if b[0] > a[0] else reversed(mid)))
+        result.append(out)
+    return result
+
+
+def _orient(a, b, c):
+    v = (b[0] - a[0]) * (c[1] - a[1]) - (b[1] - a[1]) * (c[0] - a[0])
+    return (v > 0) - (v < 0)
+
+
+def _on_segment(p, a, b):
+    return min(a[0], b[0]) <= p[0] <= max(a[0], b[0]) and min(a[1], b[1]) <= p[1] <= max(a[1], b[1])
+
+
+# 两线段是否相交(含接触和共线重叠), 仅在公共端点处相接不算相交
+def _segments_cross(a, b, c, d):
+    shared = set((a, b)) & set((c, d))
+    if len(shared) == 2:
+        return True
+    if shared:
+        # 共用端点时只有共线且同向(折返重叠)才算相交
+        p = shared.pop()
+        q1 = b if a == p else a
+        q2 = d if c == p else c
+        return _orient(p, q1, q2) == 0 and (q1[0] - p[0]) * (q2[0] - p[0]) + (q1[1] - p[1]) * (q2[1] - p[1]) > 0
+    o1, o2, o3, o4 = _orient(a, b, c), _orient(a, b, d), _orient(c, d, a), _orient(c, d, b)
+    if o1 != o2 and o3 != o4:
+        return True
+    return ((o1 == 0 and _on_segment(c, a, b)) or (o2 == 0 and _on_segment(d, a, b)) or
+            (o3 == 0 and _on_segment(a, c, d)) or (o4 == 0 and _on_segment(b, c, d)))
+
+
+def _bbox(points):
+    xs = [pt[0] for pt in points]
+    ys = [pt[1] for pt in points]
+    return (min(xs), min(ys), max(xs), max(ys))
+
+
+# 弧段与另一弧段(other为None时为自身)是否有线段相交
+def _arcs_cross(arc, other=None):
+    segs = list(zip(arc, arc[1:]))
+    if other is None:
+        return any(_segments_cross(*segs[i], *segs[j]) for i in range(len(segs)) for j in range(i + 1, len(segs)))
+    box = _bbox(other)
+    other_segs = list(zip(other, other[1:]))
+    for a, b in segs:
+        if not tile_index._intersects(_bbox((a, b)), box):
+            continue
+        for c, d in other_segs:
+            if _segments_cross(a, b, c, d):
+                return True
+    return False
+
+
+def _ring_area2(ring):
+    return sum(ring[k][0] * ring[k + 1][1] - ring[k + 1][0] * ring[k][1] for k in range(len(ring) - 1))
+
+
+def simplify_polygons(polygons, tolerance, method='dp', workers=4, chunk_size=5000):
+    '''
+    :param polygons: 多边形列表, 每个多边形为环列表(第一个为外环), 环为首尾相同的点列
+    :param tolerance: 简化容差(地图单位)
+    :param method: 'dp' Douglas-Peucker 或 'visvalingam'
+    :param workers: 并行进程数, 1为串行
+    :param chunk_size: 每个任务的弧段数
+    :return: 简化后的多边形列表, 相邻多边形的共享边保持一致
+    '''
+    if method not in METHODS:
+        raise ValueError('method must be one of {}'.format(METHODS))
+    # 所有环去掉重复的闭合点
+    rings = []
+    owners = []
+    for p, polygon in enumerate(polygons):
+        for r, ring in enumerate(polygon):
+            pts = [tuple(pt[:2]) for pt in ring]
+            if len(pts) > 1 and pts[0] == pts[-1]:
+                pts = pts[:-1]
+            rings.append(pts)
+            owners.append((p, r))
+    rings = _densify(rings)
+
+    # 节点: 与邻接点数不为2的顶点(多个多边形交汇处)
+    adjacency = defaultdict(set)
+    for ring in rings:
+        n = len(ring)
+        for k in range(n):
+            adjacency[ring[k]].add(ring[(k + 1) % n])
+            adjacency[ring[(k + 1) % n]].add(ring[k])
+    nodes = set(v for v, adj in adjacency.items() if len(adj) != 2)
+
+    # 在节点处将环拆为弧段, 同一弧段(含反向)只保留一份
+    arcs = {}
+    ring_arcs = []
+    for ring in rings:
+        n = len(ring)
+        starts = [k for k in range(n) if ring[k] in nodes]
+        parts = []
+        if not starts:
+            # 无节点的环: 旋转到最小点起始, 作为闭合弧段
+            k0 = ring.index(min(ring))
+            forward = ring[k0:] + ring[:k0]
+            forward = forward + [forward[0]]
+            parts.append(forward)
+        else:
+            for s, e in zip(starts, starts[1:] + [starts[0] + n]):
+                parts.append([ring[k % n] for k in range(s, e + 1)])
+        refs = []
+        for arc in parts:
+            reverse = arc[::-1]
+            key = min(tuple(arc), tuple(reverse))
+            arcs.setdefault(key, None)
+            refs.append((key, tuple(arc) != key))
+        ring_arcs.append(refs)
+
+    # 分块并行简化
+    keys = list(arcs.keys())
+    chunks = [(list(map(list, keys[k: k + chunk_size])), tolerance, method) for k in range(0, len(keys), chunk_size)]
+    if workers > 1 and len(chunks) > 1:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            results = list(pool.map(_simplify_chunk, chunks))
+    else:
+        results = [_simplify_chunk(chunk) for chunk in chunks]
+    for key, simplified in zip(keys, (arc for chunk in results for arc in chunk)):
+        arcs[key] = simplified
+
+    # 由弧段重建环
+    def build(refs):
+        pts = []
+        for key, reverse in refs:
+            arc = arcs[key][::-1] if reverse else arcs[key]
+            pts.extend(arc if not pts else arc[1:])
+        if pts[0] != pts[-1]:
+            pts.append(pts[0])
+        return pts
+
+    # 简化后与自身或相邻弧段相交的弧段恢复原始点列; 相邻弧段由原始弧段外包矩形的R树查询,
+    # 简化后的点是原始点的子集, 外包矩形不会变大
+    # 退化的环逐个恢复其弧段的原始点列(删点最多的弧段优先)
+    # 恢复的弧段对所有共用它的环生效, 相邻多边形的共享边保持一致; 只复查受影响的弧段和环
+    users = defaultdict(set)
+    for k, refs in enumerate(ring_arcs):
+        for key, _ in refs:
+            users[key].add(k)
+    boxes = [_bbox(key) for key in keys]
+    index = tile_index.TileIndex(range(len(keys)), boxes, [[]] * len(keys))
+    lookup = {key: k for k, key in enumerate(keys)}
+    check_arcs = set(range(len(keys)))
+    check_rings = set(range(len(rings)))
+    while check_arcs or check_rings:
+        reverted = set()
+        for k in sorted(check_arcs):
+            key = keys[k]
+            if len(arcs[key]) == len(key):
+                continue
+            if _arcs_cross(arcs[key]) or any(_arcs_cross(arcs[key], arcs[keys[m]]) for m in index.query_bbox(boxes[k]) if m != k):
+                arcs[key] = list(key)
+                reverted.add(k)
+        for k in sorted(check_rings):
+            pts = build(ring_arcs[k])
+            if len(set(pts)) >= 3 and _ring_area2(pts) != 0:
+                continue
+            candidates = [key for key, _ in ring_arcs[k] if len(arcs[key]) < len(key)]
+            if not candidates:
+                # 原始环本身退化
+                continue
+            key = max(candidates, key=lambda key: len(key) - len(arcs[key]))
+            arcs[key] = list(key)
+            reverted.add(lookup[key])
+        check_arcs = set(m for k in reverted for m in index.query_bbox(boxes[k]))
+        check_rings = set(r for k in reverted for r in users[keys[k]])
+
+    output = [[None] * len(polygon) for polygon in polygons]
+    for (p, r), refs in zip(owners, ring_arcs):
+        output[p][r] = build(refs)
+    return output
+
+
+# 简化ogr图层中的面要素, 写入目标图层(保留属性)
+def simplify_layer(src_layer, dst_layer, tolerance, method='dp', workers=4):
+    '''
+    :param src_layer: 源图层(面或多面)
+    :param dst_layer: 目标图层, 缺少的字段会自动创建
+    :param tolerance: 简化容差(地图单位)
+    :return: 写入的要素数
+    '''
+    from osgeo import ogr
+    src_defn = src_layer.GetLayerDefn()
+    dst_names = [dst_layer.GetLayerDefn().GetFieldDefn(k).GetName() for k in range(dst_layer.GetLayerDefn().GetFieldCount())]
+    for k in range(src_defn.GetFieldCount()):
+        if src_defn.GetFieldDefn(k).GetName() not in dst_names:
+            dst_layer.CreateField(src_defn.GetFieldDefn(k))
+    records = []
+    polygons = []
+    src_layer.ResetReading()
+    for feature in src_layer:
+        geom = feature.GetGeometryRef()
+        if geom is None:
+            continue
+        flat = ogr.GT_Flatten(geom.GetGeometryType())
+        parts = [geom] if flat == ogr.wkbPolygon else [geom.GetGeometryRef(k) for k in range(geom.GetGeometryCount())]
+        first = len(polygons)
+        for part in parts:
+            polygons.append([part.GetGeometryRef(k).GetPoints() for k in range(part.GetGeometryCount())])
+        fields = {src_defn.GetFieldDefn(k).GetName(): feature.GetField(k) for k in range(src_defn.GetFieldCount())}
+        records.append((flat, first, len(polygons), fields))
+
+    simplified = simplify_polygons(polygons, tolerance, method, workers)
+
+    dst_layer.StartTransaction()
+    for flat, first, last, fields in records:
+        parts = []
+        for polygon in simplified[first:last]:
+            poly = ogr.Geometry(ogr.wkbPolygon)
+            for ring_pts in polygon:
+                ring = ogr.Geometry(ogr.wkbLinearRing)
+                for x, y in ring_pts:
+                    ring.AddPoint_2D(x, y)
+                poly.AddGeometry(ring)
+            parts.append(poly)
+        if flat == ogr.wkbPolygon:
+            geom = parts[0]
+        else:
+            geom = ogr.Geometry(ogr.wkbMultiPolygon)
+            for part in parts:
+                geom.AddGeometry(part)
+        feature = ogr.Feature(dst_layer.GetLayerDefn())
+        for name, value in fields.items():
+            feature.SetField(name, value)
+        feature.SetGeometry(geom)
+        dst_layer.CreateFeature(feature)
+    dst_layer.CommitTransaction()
+    return len(records)
+
+
+# 简化shp文件
+def simplify_file(src_path, dst_path, tolerance, method='dp', workers=4):
+    '''
+    :param src_path: 源shp
+    :param dst_path: 输出shp(存在则覆盖)
+    :param tolerance: 简化容差(地图单位), 栅格转矢量结果一般取1个像元
+    '''
+    from osgeo import ogr
+    src = ogr.Open(src_path)
+    if src is None:
+        print('Error: {} is not shp file.'.format(src_path))
+        return
+    src_layer = src.GetLayer(0)
+    driver = ogr.GetDriverByName('ESRI Shapefile')
+    if os.path.exists(dst_path):
+        driver.DeleteDataSource(dst_path)
+    dst = driver.CreateDataSource(dst_path)
+    dst_layer = dst.CreateLayer(os.path.splitext(os.path.basename(dst_path))[0], src_layer.GetSpatialRef(), src_layer.GetGeomType())
+    count = simplify_layer(src_layer, dst_layer, tolerance, method, workers)
+    dst.SyncToDisk()
+    dst = None
+    src = None
+    print('Success simplify {} features. save path: {}'.format(count, dst_path))
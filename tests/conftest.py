@@ -0,0 +1,15 @@
+#!/usr/bin/env python
+# -*- encoding: utf-8 -*-
+'''
+@File    :   conftest.py
+@Time    :   2026/10/20 09:12:30
+@Author  :   StrideH
+@Desc    :   make the flat modules in the repo root importable from tests
+'''
+
+import os
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
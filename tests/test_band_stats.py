@@ -0,0 +1,101 @@
+#!/usr/bin/env python
+# -*- encoding: utf-8 -*-
+'''
+@File    :   test_band_stats.py
+@Time    :   2026/10/20 11:02:17
+@Author  :   StrideH
+@Desc    :   merged per-tile stats equal one-pass stats; NaN nodata; unique batch stats files
+'''
+
+import os
+import numpy as np
+import pytest
+
+import band_stats
+
+
+def one_pass(data):
+    return data.reshape(data.shape[0], -1).astype(np.float64)
+
+
+def test_merge_equals_one_pass():
+    rng = np.random.default_rng(0)
+    image = rng.integers(0, 256, size=(3, 100, 130), dtype=np.uint8)
+    # 按切片分别统计后跨“进程”合并
+    parts = []
+    for y in range(0, 100, 32):
+        stats = band_stats.BandStats()
+        for x in range(0, 130, 32):
+            stats.update(image[:, y: y + 32, x: x + 32])
+        parts.append(band_stats.BandStats.from_dict(stats.to_dict()))
+    merged = band_stats.BandStats()
+    for stats in parts:
+        merged.merge(stats)
+    flat = one_pass(image)
+    assert merged.count.tolist() == [flat.shape[1]] * 3
+    np.testing.assert_allclose(merged.mean, flat.mean(axis=1))
+    np.testing.assert_allclose(merged.std, flat.std(axis=1))
+    np.testing.assert_array_equal(merged.min, flat.min(axis=1))
+    np.testing.assert_array_equal(merged.max, flat.max(axis=1))
+    expected = np.stack([np.bincount(band, minlength=256) for band in image.reshape(3, -1)])
+    np.testing.assert_array_equal(merged.hist, expected)
+
+
+def test_merge_files_groups_by_bands(tmp_path):
+    paths = []
+    for k, bands in enumerate((1, 3, 3)):
+        stats = band_stats.BandStats()
+        stats.update(np.full((bands, 4, 4), k + 1, dtype=np.uint8))
+        path = str(tmp_path / '{}{}'.format(k, band_stats.STATS_SUFFIX))
+        stats.save(path)
+        paths.append(path)
+    groups = band_stats.merge_files(paths)
+    assert sorted(groups) == [1, 3]
+    assert groups[3].count.tolist() == [32] * 3
+    np.testing.assert_allclose(groups[3].mean, [2.5] * 3)
+
+
+def test_nan_nodata_and_non_finite_values():
+    data = np.array([[1.0, 2.0, np.nan], [3.0, np.inf, -np.inf]], dtype=np.float32)
+    for nodata in (np.nan, None):
+        stats = band_stats.BandStats(nodata=nodata)
+        stats.update(data)
+        assert stats.count.tolist() == [3]
+        np.testing.assert_allclose(stats.mean, [2.0])
+        assert stats.min.tolist() == [1.0] and stats.max.tolist() == [3.0]
+    stats = band_stats.BandStats(nodata=-9999)
+    stats.update(np.array([[-9999.0, 4.0, np.nan]]))
+    assert stats.count.tolist() == [1]
+
+
+def test_batch_cut_stats_per_file(tmp_path):
+    pytest.importorskip('osgeo.gdal')
+    from PIL import Image
+    from crop_merge_image import GRID
+    src = tmp_path / 'src'
+    src.mkdir()
+    Image.fromarray(np.full((64, 64), 10, dtype=np.uint8)).save(str(src / 'a.png'))
+    Image.fromarray(np.full((64, 64), 30, dtype=np.uint8)).save(str(src / 'b.PNG'))
+    out = tmp_path / 'out'
+    GRID.batch_cut(str(src), str(out), 32, is_supplement=False, stats=True)
+    # 后缀不区分大小写, 两个文件都被裁剪, 切片互不覆盖
+    assert len([name for name in os.listdir(str(out)) if name.lower().endswith('.png')]) == 8
+    assert os.path.exists(str(out / ('a.png' + band_stats.STATS_SUFFIX)))
+    assert os.path.exists(str(out / ('b.PNG' + band_stats.STATS_SUFFIX)))
+    merged = band_stats.BandStats.load(str(out / 'batch_stats.json'))
+    assert merged.count.tolist() == [2 * 64 * 64]
+    np.testing.assert_allclose(merged.mean, [20.0])
+
+
+def test_crop_image_supplement_counts_pixels_once(tmp_path):
+    pytest.importorskip('osgeo.gdal')
+    from PIL import Image
+    from crop_merge_image import GRID
+    image = np.random.default_rng(2).integers(0, 256, size=(50, 70, 3), dtype=np.uint8)
+    Image.fromarray(image).save(str(tmp_path / 'img.png'))
+    GRID.crop_image(str(tmp_path / 'img.png'), str(tmp_path / 'out'), 32, is_supplement=True, stats=True)
+    stats = band_stats.BandStats.load(str(tmp_path / 'out' / ('img' + band_stats.STATS_SUFFIX)))
+    flat = one_pass(np.moveaxis(image, -1, 0))
+    assert stats.count.tolist() == [50 * 70] * 3
+    np.testing.assert_allclose(stats.mean, flat.mean(axis=1))
+    np.testing.assert_allclose(stats.std, flat.std(axis=1))
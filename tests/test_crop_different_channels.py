@@ -0,0 +1,56 @@
+#!/usr/bin/env python
+# -*- encoding: utf-8 -*-
+'''
+@File    :   test_crop_different_channels.py
+@Time    :   2026/10/20 13:47:30
+@Author  :   StrideH
+@Desc    :   band expression parser and crop_channel parsing
+'''
+
+import numpy as np
+import pytest
+
+pytest.importorskip('osgeo.gdal')
+import crop_different_channels as cdc
+
+
+def bands():
+    return {n: np.array([[float(n), 2.0 * n], [0.0, -1.0]]) for n in range(1, 6)}
+
+
+def test_expression_values():
+    b = bands()
+    read, func = cdc.compile_expression('(b4-b3)/(b4+b3)')
+    assert read == [3, 4]
+    with np.errstate(divide='ignore', invalid='ignore'):
+        np.testing.assert_allclose(func(b), (b[4] - b[3]) / (b[4] + b[3]))
+    read, func = cdc.compile_expression('where(b1 > 0, sqrt(abs(b2)) * 2 ** 2, -b5)')
+    assert read == [1, 2, 5]
+    np.testing.assert_allclose(func(b), np.where(b[1] > 0, np.sqrt(np.abs(b[2])) * 4, -b[5]))
+    _, func = cdc.compile_expression('clip(b1, 0, 1.5)')
+    np.testing.assert_allclose(func(b), np.clip(b[1], 0, 1.5))
+
+
+@pytest.mark.parametrize('expr', ['__import__("os")', 'b1.real', 'x1 + b2', 'b1 if b2 else b3', 'b1[0]',
+                                  'open("f")', 'abs(b1, out=b2)', 'b1 < b2 < b3', 'lambda: b1', '"s"'])
+def test_rejects_unsupported_syntax(expr):
+    with pytest.raises(ValueError):
+        cdc.compile_expression(expr)
+
+
+def test_parse_channels():
+    assert cdc.parse_channels('all', 3) == ([1, 2, 3], [('band', 1), ('band', 2), ('band', 3)])
+    assert cdc.parse_channels('RGB', 4)[0] == [1, 2, 3]
+    assert cdc.parse_channels('NIR', 4) == ([4], [('band', 4)])
+    assert cdc.parse_channels(2, 3) == ([2], [('band', 2)])
+    assert cdc.parse_channels(['4', 3, 2], 4) == ([2, 3, 4], [('band', 4), ('band', 3), ('band', 2)])
+    read, outputs = cdc.parse_channels([1, '(b4-b3)/(b4+b3)'], 4)
+    assert read == [1, 3, 4]
+    assert outputs[0] == ('band', 1) and outputs[1][0] == 'expr'
+
+
+def test_parse_channels_out_of_range():
+    with pytest.raises(ValueError):
+        cdc.parse_channels('NIR', 3)
+    with pytest.raises(ValueError):
+        cdc.parse_channels('b0 + b1', 3)
@@ -0,0 +1,68 @@
+#!/usr/bin/env python
+# -*- encoding: utf-8 -*-
+'''
+@File    :   test_crop_empty.py
+@Time    :   2026/10/20 17:02:36
+@Author  :   StrideH
+@Desc    :   empty tile detection on sparse GeoTIFFs: partly written windows are kept, NaN nodata is background
+'''
+
+import os
+import numpy as np
+import pytest
+
+gdal = pytest.importorskip('osgeo.gdal')
+pytest.importorskip('PIL')
+
+
+# 稀疏tif, 只写入 blocks 中的16x16块
+def _write_sparse(path, bands, size, blocks, value, data_type=gdal.GDT_Byte, nodata=None):
+    ds = gdal.GetDriverByName('GTiff').Create(path, size, size, bands, data_type,
+                                               ['TILED=YES', 'BLOCKXSIZE=16', 'BLOCKYSIZE=16', 'SPARSE_OK=TRUE'])
+    ds.SetGeoTransform((500000.0, 1.0, 0.0, 4000000.0, 0.0, -1.0))
+    for k in range(bands):
+        band = ds.GetRasterBand(k + 1)
+        if nodata is not None:
+            band.SetNoDataValue(nodata)
+        for bx, by in blocks:
+            band.WriteArray(np.full((16, 16), value, dtype=np.float32), bx * 16, by * 16)
+    ds = None
+
+
+def _empty_names(save_path, name):
+    path = os.path.join(save_path, name + '_empty.txt')
+    if not os.path.exists(path):
+        return []
+    with open(path) as f:
+        return sorted(os.path.basename(line.split('*_&')[0]) for line in f if line.strip())
+
+
+def _tiles(save_path):
+    return sorted(f for f in os.listdir(save_path) if f.endswith('.tif'))
+
+
+@pytest.mark.parametrize('empty_tiles', ['skip', 'record'])
+def test_partly_written_window_is_not_empty(tmp_path, empty_tiles):
+    from crop_merge_image import GRID
+    src = str(tmp_path / 'sparse.tif')
+    out = str(tmp_path / 'tiles')
+    # 64x64, 只写入左上角窗口(32x32)中的一个块, 该窗口同时包含已写入和未写入的块
+    _write_sparse(src, 3, 64, [(1, 1)], 9)
+    flags, _ = gdal.Open(src).GetRasterBand(1).GetDataCoverageStatus(0, 0, 32, 32)
+    assert flags & gdal.GDAL_DATA_COVERAGE_STATUS_DATA
+    GRID.crop_tif(src, out, 32, empty_tiles=empty_tiles)
+    empty = _empty_names(out, 'sparse')
+    assert len(empty) == 3
+    assert 'sparse_0_0.tif' not in empty
+    assert len(_tiles(out)) == (1 if empty_tiles == 'skip' else 4)
+
+
+def test_nan_nodata_background(tmp_path):
+    from crop_merge_image import GRID
+    src = str(tmp_path / 'nan.tif')
+    out = str(tmp_path / 'tiles')
+    # 右上角窗口写入NaN(需读取像素判定), 其余窗口未写入(按稀疏块判定)
+    _write_sparse(src, 2, 64, [(2, 0), (3, 0), (2, 1), (3, 1)], np.nan, gdal.GDT_Float32, nodata=float('nan'))
+    GRID.crop_tif(src, out, 32, empty_tiles='skip')
+    assert _empty_names(out, 'nan') == ['nan_{}_{}.tif'.format(j, i) for j in range(2) for i in range(2)]
+    assert _tiles(out) == []
@@ -0,0 +1,87 @@
+#!/usr/bin/env python
+# -*- encoding: utf-8 -*-
+'''
+@File    :   test_crop_incremental.py
+@Time    :   2026/10/20 09:20:14
+@Author  :   StrideH
+@Desc    :   incremental crop_tif after part of the scene becomes background
+'''
+
+import os
+import numpy as np
+import pytest
+
+gdal = pytest.importorskip('osgeo.gdal')
+pytest.importorskip('PIL')
+
+
+def _write_tif(path, data):
+    ds = gdal.GetDriverByName('GTiff').Create(path, data.shape[2], data.shape[1], data.shape[0], gdal.GDT_Byte,
+                                               ['TILED=YES', 'BLOCKXSIZE=16', 'BLOCKYSIZE=16'])
+    ds.SetGeoTransform((500000.0, 1.0, 0.0, 4000000.0, 0.0, -1.0))
+    for k in range(data.shape[0]):
+        ds.GetRasterBand(k + 1).WriteArray(data[k])
+    ds = None
+
+
+def _hash_states(path):
+    with open(path) as f:
+        return dict((line.strip().split('*_&')[0], line.strip().split('*_&')[2]) for line in f if line.strip())
+
+
+def _tiles(save_path):
+    return sorted(f for f in os.listdir(save_path) if f.endswith('.tif'))
+
+
+def test_recrop_after_region_becomes_background(tmp_path):
+    from crop_merge_image import GRID
+    src = str(tmp_path / 'scene.tif')
+    out = str(tmp_path / 'tiles')
+    data = np.random.default_rng(0).integers(1, 255, (3, 64, 64), dtype=np.uint8)
+    _write_tif(src, data)
+
+    GRID.crop_tif(src, out, 32, empty_tiles='skip', incremental=True)
+    assert len(_tiles(out)) == 4
+    states = _hash_states(os.path.join(out, 'scene_hash.txt'))
+    assert sorted(states.values()) == ['tile'] * 4
+    mtimes = {f: os.path.getmtime(os.path.join(out, f)) for f in _tiles(out)}
+
+    # 左上角窗口变为背景
+    data[:, :32, :32] = 0
+    _write_tif(src, data)
+    GRID.crop_tif(src, out, 32, empty_tiles='skip', incremental=True)
+
+    states = _hash_states(os.path.join(out, 'scene_hash.txt'))
+    skipped = [name for name, state in states.items() if state == 'skipped']
+    assert len(skipped) == 1
+    # 旧切片被删除, 合并时不会覆盖填充值
+    assert not os.path.exists(skipped[0])
+    assert len(_tiles(out)) == 3
+    with open(os.path.join(out, 'scene_empty.txt')) as f:
+        assert f.read().split('*_&')[0] == skipped[0]
+    # 其余切片未改动
+    for f in _tiles(out):
+        assert os.path.getmtime(os.path.join(out, f)) == mtimes[f]
+
+
+def test_sharded_incremental_reads_merged_hashes(tmp_path):
+    from crop_merge_image import GRID
+    src = str(tmp_path / 'scene.tif')
+    out = str(tmp_path / 'tiles')
+    _write_tif(src, np.random.default_rng(1).integers(1, 255, (3, 64, 64), dtype=np.uint8))
+
+    for start in (0, 2):
+        GRID.crop_tif(src, out, 32, incremental=True, tile_range=(start, start + 2))
+    # 模拟 work_queue 合并: 分片哈希文件拼接后删除
+    with open(os.path.join(out, 'scene_hash.txt'), 'w') as merged:
+        for start in (0, 2):
+            part = os.path.join(out, 'scene_part{:08d}_hash.txt'.format(start))
+            with open(part) as f:
+                merged.write(f.read())
+            os.remove(part)
+    mtimes = {f: os.path.getmtime(os.path.join(out, f)) for f in _tiles(out)}
+
+    for start in (0, 2):
+        GRID.crop_tif(src, out, 32, incremental=True, tile_range=(start, start + 2))
+    for f in _tiles(out):
+        assert os.path.getmtime(os.path.join(out, f)) == mtimes[f]
@@ -0,0 +1,21 @@
+#!/usr/bin/env python
+# -*- encoding: utf-8 -*-
+'''
+@File    :   test_crop_or_mosaic.py
+@Time    :   2026/10/20 14:12:35
+@Author  :   StrideH
+@Desc    :   crop options that --channel/--pyramid cannot honour are rejected, not ignored
+'''
+
+import pytest
+
+import crop_or_mosaic
+
+
+@pytest.mark.parametrize('option', [['--container', 'tar'], ['--stats'], ['--incremental'], ['--dst-srs', 'EPSG:32650'], ['--mask-path', 'label.tif']])
+def test_channel_rejects_unsupported_options(option, capsys):
+    for mode in (['--channel', 'RGB'], ['--pyramid', '1', '2']):
+        with pytest.raises(SystemExit) as exc:
+            crop_or_mosaic.main(['crop', 'scene.tif', 'out', '--size', '256'] + mode + option)
+        assert exc.value.code == 2
+        assert option[0] in capsys.readouterr().err
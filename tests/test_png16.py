@@ -0,0 +1,142 @@
+#!/usr/bin/env python
+# -*- encoding: utf-8 -*-
+'''
+@File    :   test_png16.py
+@Time    :   2026/10/20 16:20:44
+@Author  :   StrideH
+@Desc    :   16-bit png decoder against an independent encoder and pypng; crop_image keeps dtype and bands
+'''
+
+import os
+import zlib
+import struct
+import numpy as np
+import pytest
+
+pytest.importorskip('osgeo.gdal')
+from crop_merge_image import GRID
+
+
+# 独立实现的png过滤, 每行使用 kinds 中的过滤类型
+def _filtered(tile, kinds):
+    tile = tile if tile.ndim == 3 else tile[..., np.newaxis]
+    height, width, channel = tile.shape
+    bpp = channel * 2
+    rows = np.ascontiguousarray(tile, dtype='>u2').view(np.uint8).reshape(height, width * bpp).astype(np.int32)
+    prev = np.zeros(width * bpp, dtype=np.int32)
+    raw = b''
+    for r in range(height):
+        kind = kinds[r % len(kinds)]
+        x = rows[r]
+        a = np.concatenate([np.zeros(bpp, dtype=np.int32), x[:-bpp]])
+        c = np.concatenate([np.zeros(bpp, dtype=np.int32), prev[:-bpp]])
+        b = prev
+        if kind == 0:
+            pred = 0
+        elif kind == 1:
+            pred = a
+        elif kind == 2:
+            pred = b
+        elif kind == 3:
+            pred = (a + b) // 2
+        else:
+            pa, pb, pc = np.abs(b - c), np.abs(a - c), np.abs(a + b - 2 * c)
+            pred = np.where((pa <= pb) & (pa <= pc), a, np.where(pb <= pc, b, c))
+        raw += bytes([kind]) + ((x - pred) % 256).astype(np.uint8).tobytes()
+        prev = x
+    return raw
+
+
+def _write_png(path, tile, kinds):
+    height, width = tile.shape[:2]
+    channel = 1 if tile.ndim == 2 else tile.shape[2]
+    color_type = {1: 0, 2: 4, 3: 2, 4: 6}[channel]
+    data = zlib.compress(_filtered(tile, kinds))
+
+    def chunk(kind, body):
+        return struct.pack('>I', len(body)) + kind + body + struct.pack('>I', zlib.crc32(kind + body) & 0xffffffff)
+
+    with open(path, 'wb') as f:
+        f.write(b'\x89PNG\r\n\x1a\n')
+        f.write(chunk(b'IHDR', struct.pack('>IIBBBBB', width, height, 16, color_type, 0, 0, 0)))
+        # 数据拆成多个IDAT块
+        half = len(data) // 2
+        f.write(chunk(b'IDAT', data[:half]))
+        f.write(chunk(b'IDAT', data[half:]))
+        f.write(chunk(b'IEND', b''))
+
+
+def _random(shape, seed=0):
+    rng = np.random.default_rng(seed)
+    # 平滑渐变加噪声, 各过滤类型的预测值都会用到
+    base = np.add.outer(np.arange(shape[0]) * 300, np.arange(shape[1]) * 200)
+    if len(shape) == 3:
+        base = base[..., np.newaxis] + np.arange(shape[2]) * 5000
+    return ((base + rng.integers(0, 2000, size=shape)) % 65536).astype(np.uint16)
+
+
+@pytest.mark.parametrize('channel', [1, 2, 3, 4])
+@pytest.mark.parametrize('kinds', [[0], [1], [2], [3], [4], [0, 1, 2, 3, 4]])
+def test_read_png16_all_filters(tmp_path, channel, kinds):
+    tile = _random((9, 13) if channel == 1 else (9, 13, channel), seed=channel)
+    path = str(tmp_path / 'f.png')
+    _write_png(path, tile, kinds)
+    decoded = GRID.read_png16(path)
+    assert decoded.dtype == np.uint16
+    np.testing.assert_array_equal(decoded, tile)
+
+
+def test_against_pypng(tmp_path):
+    png = pytest.importorskip('png')
+    tile = _random((20, 17, 3))
+    # pypng写, read_png16读
+    path = str(tmp_path / 'ref.png')
+    with open(path, 'wb') as f:
+        png.Writer(17, 20, greyscale=False, bitdepth=16).write(f, tile.reshape(20, -1).tolist())
+    np.testing.assert_array_equal(GRID.read_png16(path), tile)
+    # write_png16写, pypng读
+    path = str(tmp_path / 'ours.png')
+    GRID.write_png16(path, tile, 9)
+    _, _, rows, info = png.Reader(filename=path).asDirect()
+    assert info['bitdepth'] == 16 and info['planes'] == 3
+    np.testing.assert_array_equal(np.array(list(rows), dtype=np.uint16).reshape(20, 17, 3), tile)
+
+
+def test_read_png16_skips_8bit(tmp_path):
+    from PIL import Image
+    path = str(tmp_path / 'gray8.png')
+    Image.fromarray(np.zeros((4, 4), dtype=np.uint8)).save(path)
+    assert GRID.read_png16(path) is None
+    assert GRID.read_tile(path).dtype == np.uint8
+
+
+def _crop_round_trip(tmp_path, name, image):
+    out = str(tmp_path / 'out')
+    GRID.crop_image(str(tmp_path / name), out, 32)
+    stem, extension = os.path.splitext(name)
+    tiles = sorted(n for n in os.listdir(out) if n.endswith(extension))
+    assert len(tiles) == (image.shape[0] // 32) * (image.shape[1] // 32)
+    for i in range(image.shape[0] // 32):
+        for j in range(image.shape[1] // 32):
+            tile = GRID.read_tile(os.path.join(out, '{}_{}_{}{}'.format(stem, i, j, extension)))
+            yield tile, image[i * 32: (i + 1) * 32, j * 32: (j + 1) * 32]
+
+
+@pytest.mark.parametrize('shape', [(64, 96, 4), (70, 64)])
+def test_crop_image_png16_round_trip(tmp_path, shape):
+    image = _random(shape)
+    GRID.write_png16(str(tmp_path / 'src.png'), image)
+    for tile, expected in _crop_round_trip(tmp_path, 'src.png', image):
+        assert tile.dtype == np.uint16 and tile.shape == expected.shape
+        np.testing.assert_array_equal(tile, expected)
+
+
+def test_crop_image_jpeg_round_trip(tmp_path):
+    from PIL import Image
+    image = (_random((64, 64, 3)) >> 8).astype(np.uint8)
+    Image.fromarray(image).save(str(tmp_path / 'src.jpg'), quality=95)
+    source = GRID.read_tile(str(tmp_path / 'src.jpg'))
+    for tile, expected in _crop_round_trip(tmp_path, 'src.jpg', source):
+        assert tile.dtype == np.uint8 and tile.shape == (32, 32, 3)
+        # jpg切片重新编码, 只比较近似值
+        assert np.abs(tile.astype(np.int16) - expected).mean() < 4
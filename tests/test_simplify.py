@@ -0,0 +1,92 @@
+#!/usr/bin/env python
+# -*- encoding: utf-8 -*-
+'''
+@File    :   test_simplify.py
+@Time    :   2026/10/20 11:36:40
+@Author  :   StrideH
+@Desc    :   shared arcs stay identical, partitions keep their area, collapsed rings fall back per arc
+'''
+
+from collections import Counter
+
+import simplify
+
+
+def area(ring):
+    return abs(simplify._ring_area2(ring)) / 2
+
+
+def segments(polygons):
+    result = Counter()
+    for polygon in polygons:
+        for ring in polygon:
+            for a, b in zip(ring, ring[1:]):
+                result[(a, b)] += 1
+    return result
+
+
+# 4x4 方块被阶梯状边界分成左右两块
+def staircase():
+    left = [(0, 0), (1, 0), (1, 1), (2, 1), (2, 2), (3, 2), (3, 3), (3, 4), (0, 4), (0, 0)]
+    right = [(1, 0), (4, 0), (4, 4), (3, 4), (3, 3), (3, 2), (2, 2), (2, 1), (1, 1), (1, 0)]
+    return [[left], [right]]
+
+
+def test_shared_arc_identical_and_area_conserved():
+    for method in simplify.METHODS:
+        out = simplify.simplify_polygons(staircase(), 0.75, method, workers=1)
+        left, right = out[0][0], out[1][0]
+        assert len(left) < 10
+        # 每条内部边在两个面中各出现一次且方向相反
+        segs = segments(out)
+        inner = [(a, b) for a, b in segs if not (a[0] == b[0] in (0, 4) or a[1] == b[1] in (0, 4))]
+        assert inner
+        for a, b in inner:
+            assert segs[(b, a)] == 1
+        assert area(left) + area(right) == 16
+
+
+def test_parallel_matches_serial():
+    polygons = staircase() * 3
+    serial = simplify.simplify_polygons(polygons, 1.0, workers=1, chunk_size=1)
+    parallel = simplify.simplify_polygons(polygons, 1.0, workers=2, chunk_size=1)
+    assert serial == parallel
+
+
+def test_collapsed_ring_reverts_shared_arc():
+    # 小方块 c 的三条边与 b 共用, 简化后会塌缩为一条线
+    a = [(0, 0), (5, 0), (5, 10), (0, 10), (0, 0)]
+    b = [(5, 0), (10, 0), (10, 10), (5, 10), (5, 5), (6, 5), (6, 4), (5, 4), (5, 0)]
+    c = [(5, 4), (6, 4), (6, 5), (5, 5), (5, 4)]
+    out = simplify.simplify_polygons([[a], [b], [c]], 2.0, workers=1)
+    assert area(out[2][0]) == 1
+    # 恢复的弧段对 b 同样生效, 不产生重叠
+    assert (6, 5) in out[1][0] and (6, 4) in out[1][0]
+    assert sum(area(polygon[0]) for polygon in out) == 100
+
+
+def test_hole_keeps_three_points():
+    outer = [(0, 0), (10, 0), (10, 10), (0, 10), (0, 0)]
+    hole = [(4, 4), (4, 5), (5, 5), (5, 4), (4, 4)]
+    out = simplify.simplify_polygons([[outer, hole], [hole[::-1]]], 5.0, workers=1)
+    assert len(set(out[0][1])) >= 3
+    assert out[0][1][0] == out[0][1][-1]
+
+
+def test_close_parallel_boundaries_do_not_cross():
+    # 上下两条相近的平行边界: 上边界的尖角被简化掉, 下边界的尖角保留, 简化后会相交
+    upper = [(0, 6), (4, 6), (5, 9), (6, 6), (10, 6)]
+    lower = [(0, 4), (4, 4), (5, 7.5), (6, 4), (10, 4)]
+    a = upper + [(10, 10), (0, 10), (0, 6)]
+    b = lower + upper[::-1] + [(0, 4)]
+    c = [(0, 0), (10, 0)] + lower[::-1] + [(0, 0)]
+    for method in simplify.METHODS:
+        out = simplify.simplify_polygons([[a], [b], [c]], 3.2, method, workers=1)
+        rings = [polygon[0] for polygon in out]
+        for k, ring in enumerate(rings):
+            segs = list(zip(ring, ring[1:]))
+            for i in range(len(segs)):
+                for j in range(i + 2, len(segs) - (i == 0)):
+                    assert not simplify._segments_cross(*segs[i], *segs[j]), (method, k)
+        assert area(rings[1]) > 0
+        assert sum(area(ring) for ring in rings) == 100
@@ -0,0 +1,85 @@
+#!/usr/bin/env python
+# -*- encoding: utf-8 -*-
+'''
+@File    :   test_tile_index.py
+@Time    :   2026/10/20 13:24:09
+@Author  :   StrideH
+@Desc    :   R-tree bbox and point queries match a brute-force scan; save/load and info file builds
+'''
+
+import os
+import numpy as np
+
+import tile_index
+
+
+def brute(boxes, box):
+    return [k for k, b in enumerate(boxes) if tile_index._intersects(b, box)]
+
+
+def random_index(n, seed=0, node_size=4):
+    rng = np.random.default_rng(seed)
+    x0 = rng.uniform(0, 1000, n)
+    y0 = rng.uniform(0, 1000, n)
+    boxes = [(x, y, x + w, y + h) for x, y, w, h in zip(x0, y0, rng.uniform(1, 50, n), rng.uniform(1, 50, n))]
+    names = ['t{}'.format(k) for k in range(n)]
+    geos = [[b[0], 1, 0, b[3], 0, -1] for b in boxes]
+    return tile_index.TileIndex(names, boxes, geos, 'proj', node_size)
+
+
+def test_queries_match_brute_force():
+    rng = np.random.default_rng(1)
+    for n in (0, 1, 5, 300):
+        index = random_index(n)
+        for _ in range(50):
+            x, y = rng.uniform(-50, 1050, 2)
+            box = (x, y, x + rng.uniform(0, 200), y + rng.uniform(0, 200))
+            assert index.query_bbox(box) == [index.names[k] for k in brute(index.boxes, box)]
+            assert index.query_point(x, y) == [index.names[k] for k in brute(index.boxes, (x, y, x, y))]
+
+
+def test_extent_and_save_load(tmp_path):
+    index = random_index(100)
+    assert index.extent() == tile_index._union(index.boxes)
+    path = str(tmp_path / 'img') + tile_index.FOOTPRINT_SUFFIX
+    index.save(path)
+    loaded = tile_index.TileIndex.load(path)
+    assert loaded.levels == index.levels and loaded.proj == 'proj'
+    box = (200, 200, 400, 400)
+    assert loaded.query_bbox(box) == index.query_bbox(box)
+    assert loaded.get('t7') == index.get('t7')
+
+
+def test_build_from_info(tmp_path):
+    # 2x3 个 256 像元切片, 分辨率 0.5, 北向上
+    txt = str(tmp_path / 'img_info.txt')
+    with open(txt, 'w', encoding='utf-8') as f:
+        for i in range(2):
+            for j in range(3):
+                geo = [1000 + j * 128, 0.5, 0, 5000 - i * 128, 0, -0.5]
+                f.write('img_{}_{}*_&proj*_&{}\n'.format(i, j, '*_&'.join(str(v) for v in geo)))
+    index = tile_index.load_or_build(txt, tile_size=256)
+    assert os.path.exists(str(tmp_path / 'img') + tile_index.FOOTPRINT_SUFFIX)
+    assert index.extent() == (1000, 5000 - 256, 1000 + 384, 5000)
+    assert index.query_point(1130, 4990) == ['img_0_1']
+    # 切片共享的角点同时属于四个切片
+    assert index.query_point(1128, 4872) == ['img_0_0', 'img_0_1', 'img_1_0', 'img_1_1']
+    assert index.get('img_1_2')[1] == (1256, 4744, 1384, 4872)
+    footprint = str(tmp_path / 'img') + tile_index.FOOTPRINT_SUFFIX
+    mtime = os.stat(footprint).st_mtime_ns
+    assert tile_index.load_or_build(txt, tile_size=256).levels == index.levels
+    assert os.stat(footprint).st_mtime_ns == mtime
+
+
+def test_cache_key(tmp_path):
+    txt = str(tmp_path / 'img_info.txt')
+    with open(txt, 'w', encoding='utf-8') as f:
+        f.write('img_0_0*_&proj*_&0*_&1*_&0*_&100*_&0*_&-1\n')
+    assert tile_index.load_or_build(txt, tile_size=10).extent() == (0, 90, 10, 100)
+    # 切片尺寸改变
+    assert tile_index.load_or_build(txt, tile_size=20).extent() == (0, 80, 20, 100)
+    # 坐标文件改变(修改时间不同)
+    with open(txt, 'a', encoding='utf-8') as f:
+        f.write('img_0_1*_&proj*_&20*_&1*_&0*_&100*_&0*_&-1\n')
+    os.utime(txt, ns=(os.stat(txt).st_atime_ns, os.stat(txt).st_mtime_ns + 1000))
+    assert tile_index.load_or_build(txt, tile_size=20).extent() == (0, 80, 40, 100)
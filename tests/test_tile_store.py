@@ -0,0 +1,89 @@
+#!/usr/bin/env python
+# -*- encoding: utf-8 -*-
+'''
+@File    :   test_tile_store.py
+@Time    :   2026/10/20 13:05:51
+@Author  :   StrideH
+@Desc    :   tar shards and hdf5 containers round-trip tiles by name through the index file
+'''
+
+import io
+import os
+import tarfile
+import numpy as np
+import pytest
+
+import tile_store
+
+
+def make_tiles(n, shape=(3, 16, 16), dtype=np.uint16):
+    rng = np.random.default_rng(n)
+    return {'img_{}_{}'.format(k // 4, k % 4): rng.integers(0, 1000, size=shape).astype(dtype) for k in range(n)}
+
+
+def write(container, path, name, tiles, shard_size=1000):
+    writer = tile_store.create_writer(container, str(path), name, shard_size)
+    for key, tile in tiles.items():
+        writer.add(key, tile)
+    writer.close()
+    return tile_store.index_path(str(path), name)
+
+
+def test_tar_round_trip_across_shards(tmp_path):
+    tiles = make_tiles(10)
+    index = write('tar', tmp_path, 'img', tiles, shard_size=4)
+    assert tile_store.is_store(index)
+    assert sorted(name for name in os.listdir(str(tmp_path)) if name.endswith('.tar')) == \
+        ['img_00000.tar', 'img_00001.tar', 'img_00002.tar']
+    with tile_store.TileStore(index) as store:
+        assert len(store) == 10 and sorted(store.keys()) == sorted(tiles)
+        # 随机顺序读取
+        for key in sorted(tiles, reverse=True):
+            assert store.shape(key) == (3, 16, 16) and store.dtype(key) == np.uint16
+            np.testing.assert_array_equal(store.read(key), tiles[key])
+
+
+def test_tar_members_are_plain_npy(tmp_path):
+    tiles = make_tiles(3, shape=(8, 8), dtype=np.float32)
+    write('tar', tmp_path, 'img', tiles)
+    with tarfile.open(str(tmp_path / 'img_00000.tar')) as tar:
+        names = tar.getnames()
+        assert names == [key + '.npy' for key in tiles]
+        for key in tiles:
+            member = tar.extractfile(key + '.npy')
+            np.testing.assert_array_equal(np.load(io.BytesIO(member.read())), tiles[key])
+
+
+def test_concatenated_indexes(tmp_path):
+    # 多机分片的索引直接拼接即可读取
+    first = {'a_0_0': np.zeros((4, 4), np.uint8), 'a_0_1': np.ones((4, 4), np.uint8)}
+    second = {'a_1_0': np.full((4, 4), 2, np.uint8)}
+    parts = [write('tar', tmp_path, 'a_part{:08d}'.format(k), tiles) for k, tiles in enumerate((first, second))]
+    merged = tile_store.index_path(str(tmp_path), 'a')
+    with open(merged, 'w') as out:
+        for part in parts:
+            with open(part) as f:
+                out.write(f.read())
+    with tile_store.TileStore(merged) as store:
+        assert len(store) == 3
+        np.testing.assert_array_equal(store.read('a_1_0'), second['a_1_0'])
+
+
+def test_unknown_container(tmp_path):
+    with pytest.raises(ValueError):
+        tile_store.create_writer('zip', str(tmp_path), 'img')
+    assert not tile_store.is_store(str(tmp_path / 'img_info.txt'))
+
+
+def test_h5_round_trip(tmp_path):
+    pytest.importorskip('h5py')
+    tiles = make_tiles(6, dtype=np.uint8)
+    index = write('h5', tmp_path, 'img', tiles)
+    with tile_store.TileStore(index) as store:
+        for key, tile in tiles.items():
+            np.testing.assert_array_equal(store.read(key), tile)
+    writer = tile_store.create_writer('h5', str(tmp_path), 'bad')
+    writer.add('x', np.zeros((2, 2), np.uint8))
+    with pytest.raises(ValueError):
+        writer.add('y', np.zeros((3, 3), np.uint8))
+    writer.close()
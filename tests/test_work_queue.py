@@ -0,0 +1,172 @@
+#!/usr/bin/env python
+# -*- encoding: utf-8 -*-
+'''
+@File    :   test_work_queue.py
+@Time    :   2026/10/20 09:48:02
+@Author  :   StrideH
+@Desc    :   several local workers on a numpy-only plan: exactly-once, retries, expired leases, reduce
+'''
+
+import os
+import json
+import time
+import numpy as np
+
+import work_queue
+
+MODULE = __name__
+
+
+# 窗口求和, 每次执行记录一个标记文件, 用于检查任务只执行一次
+def sum_window(task):
+    with open(os.path.join(task['runs'], '{}.{}.{}'.format(task['id'], os.getpid(), time.time_ns())), 'w'):
+        pass
+    data = np.load(task['array'], mmap_mode='r')
+    y0, x0, h, w = task['window']
+    total = int(np.asarray(data[y0: y0 + h, x0: x0 + w]).sum())
+    with open(os.path.join(task['parts'], task['id'] + '.json'), 'w') as f:
+        json.dump(total, f)
+    return {'sum': total}
+
+
+def always_fail(task):
+    raise RuntimeError('broken task')
+
+
+# 模拟GDAL段错误/内存溢出: 直接结束工作进程, 不经过fail()
+def kill_worker(task):
+    os._exit(1)
+
+
+def reduce_sum(queue, plan):
+    total = 0
+    for name in os.listdir(plan['parts']):
+        with open(os.path.join(plan['parts'], name)) as f:
+            total += json.load(f)
+    with open(plan['result'], 'w') as f:
+        json.dump(total, f)
+
+
+def _plan(tmp_path, chunks=4):
+    data = np.arange(64 * 48, dtype=np.int64).reshape(64, 48)
+    np.save(str(tmp_path / 'data.npy'), data)
+    queue_dir = str(tmp_path / 'queue')
+    runs = tmp_path / 'runs'
+    parts = tmp_path / 'parts'
+    runs.mkdir()
+    parts.mkdir()
+    queue = work_queue.WorkQueue(queue_dir, max_attempts=2)
+    queue.write_plan({'kind': MODULE + ':reduce_sum', 'parts': str(parts), 'result': str(tmp_path / 'result.json')})
+    for y in range(chunks):
+        for x in range(chunks):
+            queue.put('sum_{}_{}'.format(y, x), MODULE + ':sum_window', array=str(tmp_path / 'data.npy'), runs=str(runs), parts=str(parts),
+                      window=[y * 64 // chunks, x * 48 // chunks, 64 // chunks, 48 // chunks])
+    return queue, data
+
+
+def _runs(tmp_path):
+    counts = {}
+    for name in os.listdir(str(tmp_path / 'runs')):
+        task_id = name.split('.')[0]
+        counts[task_id] = counts.get(task_id, 0) + 1
+    return counts
+
+
+def test_local_workers_run_each_task_once(tmp_path):
+    queue, data = _plan(tmp_path)
+    counts = work_queue.run_local(queue.queue_dir, 4, lease_timeout=30, heartbeat=0.5, poll=0.05)
+    assert counts == {'todo': 0, 'leased': 0, 'done': 16, 'failed': 0}
+    assert sorted(_runs(tmp_path).values()) == [1] * 16
+    assert queue.reduced()
+    assert not os.path.exists(os.path.join(queue.queue_dir, 'reduce.lock'))
+    with open(str(tmp_path / 'result.json')) as f:
+        assert json.load(f) == int(data.sum())
+
+
+def test_failing_task_ends_in_failed(tmp_path):
+    queue, _ = _plan(tmp_path, chunks=2)
+    queue.put('broken', MODULE + ':always_fail')
+    counts = work_queue.run_local(queue.queue_dir, 3, lease_timeout=30, heartbeat=0.5, poll=0.05, max_attempts=2)
+    assert counts == {'todo': 0, 'leased': 0, 'done': 4, 'failed': 1}
+    with open(os.path.join(queue.queue_dir, 'failed', 'broken.json')) as f:
+        assert json.load(f)['attempts'] == 2
+    # 有失败任务时不执行合并
+    assert not queue.reduced()
+
+
+def test_expired_lease_is_requeued(tmp_path):
+    queue, data = _plan(tmp_path, chunks=2)
+    # 模拟已宕机节点持有的租约
+    task = queue.claim('dead-node')
+    os.utime(queue.lease_path(task), (0, 0))
+    counts = work_queue.run_local(queue.queue_dir, 2, lease_timeout=5, heartbeat=0.5, poll=0.05)
+    assert counts == {'todo': 0, 'leased': 0, 'done': 4, 'failed': 0}
+    with open(os.path.join(queue.queue_dir, 'done', task['id'] + '.json')) as f:
+        assert json.load(f)['attempts'] == 1
+    assert sorted(_runs(tmp_path).values()) == [1] * 4
+    with open(str(tmp_path / 'result.json')) as f:
+        assert json.load(f) == int(data.sum())
+
+
+def test_task_killing_its_worker_is_not_retried_forever(tmp_path):
+    queue, _ = _plan(tmp_path, chunks=2)
+    queue.put('crash', MODULE + ':kill_worker')
+    counts = work_queue.run_local(queue.queue_dir, 3, lease_timeout=1, heartbeat=0.2, poll=0.05, max_attempts=2)
+    assert counts == {'todo': 0, 'leased': 0, 'done': 4, 'failed': 1}
+    with open(os.path.join(queue.queue_dir, 'failed', 'crash.json')) as f:
+        assert json.load(f)['attempts'] == 2
+
+
+def test_stale_reduce_lock_is_taken_over(tmp_path):
+    queue, data = _plan(tmp_path, chunks=2)
+    # 合并节点宕机后留下的锁
+    lock = os.path.join(queue.queue_dir, 'reduce.lock')
+    os.mkdir(lock)
+    os.utime(lock, (0, 0))
+    counts = work_queue.run_local(queue.queue_dir, 2, lease_timeout=5, heartbeat=0.5, poll=0.05)
+    assert counts['done'] == 4
+    assert queue.reduced()
+    with open(str(tmp_path / 'result.json')) as f:
+        assert json.load(f) == int(data.sum())
+
+
+def test_claim_refreshes_lease_before_rename(tmp_path):
+    queue = work_queue.WorkQueue(str(tmp_path / 'queue'))
+    queue.put('old', 'noop')
+    # 规划时间很早的任务, 领取后不能立即被判为过期
+    os.utime(os.path.join(queue.queue_dir, 'todo', 'old.json'), (0, 0))
+    task = queue.claim('w1')
+    assert queue.requeue_expired(5) == 0
+    assert queue.counts()['leased'] == 1
+    assert queue.complete(task)
+    assert queue.counts() == {'todo': 0, 'leased': 0, 'done': 1, 'failed': 0}
+
+
+def test_late_complete_after_requeue_is_discarded(tmp_path):
+    queue = work_queue.WorkQueue(str(tmp_path / 'queue'), max_attempts=3)
+    queue.put('slow', 'noop')
+    task = queue.claim('w1')
+    os.utime(queue.lease_path(task), (0, 0))
+    assert queue.requeue_expired(5) == 1
+    # 另一个节点领取了重新放回的任务
+    second = queue.claim('w2')
+    assert second['attempts'] == 1
+    # 原持有者迟到的完成/失败不生效, 不影响新租约
+    assert not queue.complete(task)
+    assert not queue.fail(task, 'late')
+    assert queue.counts() == {'todo': 0, 'leased': 1, 'done': 0, 'failed': 0}
+    assert queue.complete(second)
+    assert queue.counts() == {'todo': 0, 'leased': 0, 'done': 1, 'failed': 0}
+
+
+def test_crop_reduce_merges_part_manifests(tmp_path):
+    save_path = tmp_path / 'tiles'
+    (save_path / 'mask').mkdir(parents=True)
+    for start in (0, 500):
+        for folder, suffix in ((save_path, '_info.txt'), (save_path, '_hist.txt'), (save_path, '_index.txt'), (save_path / 'mask', '_index.txt')):
+            (folder / 'scene_part{:08d}{}'.format(start, suffix)).write_text('line {}\n'.format(start))
+    queue = work_queue.WorkQueue(str(tmp_path / 'queue'))
+    work_queue._reduce_crop(queue, {'save_path': str(save_path), 'files': ['/data/scene.tif']})
+    for folder, suffix in ((save_path, '_info.txt'), (save_path, '_hist.txt'), (save_path, '_index.txt'), (save_path / 'mask', '_index.txt')):
+        assert (folder / ('scene' + suffix)).read_text() == 'line 0\nline 500\n'
+    assert sorted(os.listdir(str(save_path / 'mask'))) == ['scene_index.txt']
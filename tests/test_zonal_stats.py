@@ -0,0 +1,91 @@
+#!/usr/bin/env python
+# -*- encoding: utf-8 -*-
+'''
+@File    :   test_zonal_stats.py
+@Time    :   2026/10/20 14:12:55
+@Author  :   StrideH
+@Desc    :   block-parallel zonal statistics equal whole-image labelling, objects spanning block seams merge
+'''
+
+import numpy as np
+import pytest
+
+gdal = pytest.importorskip('osgeo.gdal')
+from scipy import ndimage
+import zonal_stats
+
+GEO = (100.0, 2.0, 0.0, 500.0, 0.0, -2.0)
+
+
+def _write_tif(path, data, nodata=None):
+    ds = gdal.GetDriverByName('GTiff').Create(path, data.shape[1], data.shape[0], 1, gdal.GDT_Byte)
+    ds.SetGeoTransform(GEO)
+    band = ds.GetRasterBand(1)
+    band.WriteArray(data)
+    if nodata is not None:
+        band.SetNoDataValue(nodata)
+    ds = None
+
+
+# 低分辨率随机类别放大后加噪声, 图斑跨越多个分块
+def _classes(seed=0, shape=(45, 61)):
+    rng = np.random.default_rng(seed)
+    coarse = rng.integers(0, 4, size=(shape[0] // 5 + 1, shape[1] // 5 + 1), dtype=np.uint8)
+    data = np.kron(coarse, np.ones((5, 5), dtype=np.uint8))[:shape[0], :shape[1]]
+    noise = rng.random(shape) < 0.05
+    data[noise] = rng.integers(0, 4, size=noise.sum())
+    return data
+
+
+# 整幅影像一次标记的结果
+def _expected(data, connectivity, ignore=()):
+    structure = ndimage.generate_binary_structure(2, 1 if connectivity == 4 else 2)
+    objects = []
+    for value in np.unique(data):
+        if value in ignore:
+            continue
+        lab, num = ndimage.label(data == value, structure=structure)
+        pixels = np.bincount(lab.ravel())[1:]
+        for n, sl in zip(pixels, ndimage.find_objects(lab)):
+            r0, r1, c0, c1 = sl[0].start, sl[0].stop, sl[1].start, sl[1].stop
+            bbox = (GEO[0] + c0 * GEO[1], GEO[3] + r1 * GEO[5], GEO[0] + c1 * GEO[1], GEO[3] + r0 * GEO[5])
+            objects.append((int(value), int(n), bbox))
+    return sorted(objects)
+
+
+@pytest.mark.parametrize('connectivity', [4, 8])
+@pytest.mark.parametrize('block_size,workers', [(7, 1), (16, 2), (1024, 1)])
+def test_matches_whole_image(tmp_path, connectivity, block_size, workers):
+    data = _classes()
+    path = str(tmp_path / 'classes.tif')
+    _write_tif(path, data)
+    classes, objects = zonal_stats.zonal_stats(path, connectivity, None, block_size, workers)
+    expected = _expected(data, connectivity)
+    assert sorted((obj['class'], obj['pixels'], obj['bbox']) for obj in objects) == expected
+    for value in np.unique(data):
+        item = classes[int(value)]
+        assert item['pixels'] == int((data == value).sum())
+        assert item['area'] == item['pixels'] * 4.0
+        assert item['objects'] == sum(1 for obj in expected if obj[0] == value)
+
+
+def test_ignore_values_and_nodata(tmp_path):
+    data = _classes(1)
+    data[:, :3] = 255
+    path = str(tmp_path / 'classes.tif')
+    _write_tif(path, data, nodata=255)
+    classes, objects = zonal_stats.zonal_stats(path, 4, [0], block_size=10, workers=1)
+    assert 0 not in classes and 255 not in classes
+    assert sorted((obj['class'], obj['pixels'], obj['bbox']) for obj in objects) == _expected(data, 4, (0, 255))
+
+
+def test_diagonal_seam_at_block_corner(tmp_path):
+    # 两个像元只在四个分块交汇处对角相接
+    data = np.zeros((8, 8), dtype=np.uint8)
+    data[3, 3] = data[4, 4] = 1
+    data[3, 4] = data[4, 3] = 2
+    path = str(tmp_path / 'corner.tif')
+    _write_tif(path, data)
+    for connectivity, count in ((4, 2), (8, 1)):
+        classes, _ = zonal_stats.zonal_stats(path, connectivity, [0], block_size=4, workers=1)
+        assert classes[1]['objects'] == count and classes[2]['objects'] == count
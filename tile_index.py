@@ -0,0 +1,207 @@
+#!/usr/bin/env python
+# -*- encoding: utf-8 -*-
+'''
+@File    :   tile_index.py
+@Time    :   2026/10/19 15:32:08
+@Author  :   StrideH
+@Desc    :   R-tree footprint index over tile coordinate files for extent, bbox, polygon and point queries
+'''
+
+import os
+import json
+import math
+
+# 索引文件后缀, 与坐标文件同目录
+FOOTPRINT_SUFFIX = '_footprint.json'
+
+
+# 读取坐标文件, 返回 {文件名: (投影信息, 地理参考六参数)}
+def read_info(txt_path):
+    info = {}
+    with open(txt_path, 'r', encoding='utf-8') as f:
+        for line in f:
+            if not line.strip():
+                continue
+            parts = line.rstrip('\n').split('*_&')
+            info[parts[0]] = (parts[1], [float(v) for v in parts[2:8]])
+    return info
+
+
+# 由地理参考和宽高计算外包矩形(支持旋转参数)
+def footprint(geo, width, height):
+    xs = []
+    ys = []
+    for px, py in ((0, 0), (width, 0), (0, height), (width, height)):
+        xs.append(geo[0] + px * geo[1] + py * geo[2])
+        ys.append(geo[3] + px * geo[4] + py * geo[5])
+    return (min(xs), min(ys), max(xs), max(ys))
+
+
+def _intersects(a, b):
+    return a[0] <= b[2] and a[2] >= b[0] and a[1] <= b[3] and a[3] >= b[1]
+
+
+def _union(boxes):
+    return (min(b[0] for b in boxes), min(b[1] for b in boxes), max(b[2] for b in boxes), max(b[3] for b in boxes))
+
+
+# 获取切片宽高: 优先容器索引, 其次只读取tif元数据
+def _tile_sizes(txt_path, names, tile_size=None):
+    if tile_size is not None:
+        return {name: (tile_size, tile_size) for name in names}
+    import tile_store
+    index_file = txt_path[:-len('_info.txt')] + tile_store.INDEX_SUFFIX if txt_path.endswith('_info.txt') else None
+    if index_file is not None and tile_store.is_store(index_file):
+        store = tile_store.TileStore(index_file)
+        return {name: (store.shape(name)[-1], store.shape(name)[-2]) for name in names if name in store}
+    from osgeo import gdal
+    sizes = {}
+    for name in names:
+        path = name if os.path.exists(name) else os.path.join(os.path.dirname(txt_path), os.path.basename(name))
+        ds = gdal.Open(path)
+        if ds is None:
+            print('Error: {} not exist, skip.'.format(name))
+            continue
+        sizes[name] = (ds.RasterXSize, ds.RasterYSize)
+        ds = None
+    return sizes
+
+
+# 静态R树(STR批量构建), 查询复杂度为对数级
+class TileIndex:
+    def __init__(self, names, boxes, geos, proj='', node_size=16, levels=None, key=None):
+        '''
+        :param names: 切片名列表
+        :param boxes: 对应的外包矩形 (xmin, ymin, xmax, ymax)
+        :param geos: 对应的地理参考六参数
+        :param proj: 投影信息
+        :param node_size: R树节点容量
+        :param levels: 已构建的树(从文件加载时使用)
+        :param key: 构建参数(切片尺寸和坐标文件修改时间), 用于判断缓存的索引是否可用
+        '''
+        self.names = list(names)
+        self.boxes = [tuple(b) for b in boxes]
+        self.geos = [list(g) for g in geos]
+        self.proj = proj
+        self.node_size = node_size
+        self.lookup = {name: k for k, name in enumerate(self.names)}
+        self.key = key
+        self.levels = levels if levels is not None else self._build()
+
+    # STR: 按x排序分为若干竖条, 竖条内按y排序后每node_size个打包为一个节点, 逐层向上
+    def _build(self):
+        levels = []
+        entries = [(box, [k]) for k, box in enumerate(self.boxes)]
+        while True:
+            n = len(entries)
+            if n == 0:
+                return [[((0, 0, 0, 0), [])]]
+            num_nodes = math.ceil(n / self.node_size)
+            num_slices = math.ceil(math.sqrt(num_nodes))
+            slice_len = num_slices * self.node_size
+            order = sorted(range(n), key=lambda k: entries[k][0][0] + entries[k][0][2])
+            nodes = []
+            for s in range(0, n, slice_len):
+                part = sorted(order[s: s + slice_len], key=lambda k: entries[k][0][1] + entries[k][0][3])
+                for g in range(0, len(part), self.node_size):
+                    group = part[g: g + self.node_size]
+                    nodes.append((_union([entries[k][0] for k in group]), group))
+            if not levels:
+                # 叶子层的子节点为切片序号
+                nodes = [(box, [entries[k][1][0] for k in group]) for box, group in nodes]
+            levels.append(nodes)
+            if len(nodes) == 1:
+                return levels
+            entries = [(box, [k]) for k, (box, _) in enumerate(nodes)]
+
+    @classmethod
+    def build(cls, txt_path, tile_size=None, node_size=16):
+        '''
+        :param txt_path: crop_tif生成的坐标文件(原始文件名_info.txt)
+        :param tile_size: 切片尺寸, 为None时读取容器索引或tif元数据
+        :return: TileIndex
+        '''
+        info = read_info(txt_path)
+        sizes = _tile_sizes(txt_path, list(info.keys()), tile_size)
+        names = [name for name in info if name in sizes]
+        geos = [info[name][1] for name in names]
+        boxes = [footprint(info[name][1], *sizes[name]) for name in names]
+        proj = info[names[0]][0] if names else ''
+        return cls(names, boxes, geos, proj, node_size)
+
+    def save(self, path):
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump({'proj': self.proj, 'node_size': self.node_size, 'names': self.names,
+                       'boxes': self.boxes, 'geos': self.geos, 'levels': self.levels, 'key': self.key}, f)
+
+    @classmethod
+    def load(cls, path):
+        with open(path, 'r', encoding='utf-8') as f:
+            d = json.load(f)
+        levels = [[(tuple(box), children) for box, children in level] for level in d['levels']]
+        return cls(d['names'], d['boxes'], d['geos'], d['proj'], d['node_size'], levels, d.get('key'))
+
+    # 整个镶嵌的范围
+    def extent(self):
+        return self.levels[-1][0][0]
+
+    def _search(self, box):
+        result = []
+        stack = [(len(self.levels) - 1, 0)]
+        while stack:
+            depth, k = stack.pop()
+            node_box, children = self.levels[depth][k]
+            if not _intersects(node_box, box):
+                continue
+            if depth == 0:
+                result.extend(c for c in children if _intersects(self.boxes[c], box))
+            else:
+                stack.extend((depth - 1, c) for c in children)
+        return sorted(result)
+
+    # 与矩形相交的切片
+    def query_bbox(self, bbox):
+        return [self.names[k] for k in self._search(tuple(bbox))]
+
+    # 与多边形相交的切片, polygon 为wkt或ogr几何
+    def query_polygon(self, polygon):
+        from osgeo import ogr
+        geom = ogr.CreateGeometryFromWkt(polygon) if isinstance(polygon, str) else polygon
+        xmin, xmax, ymin, ymax = geom.GetEnvelope()
+        result = []
+        for k in self._search((xmin, ymin, xmax, ymax)):
+            b = self.boxes[k]
+            ring = ogr.Geometry(ogr.wkbLinearRing)
+            for x, y in ((b[0], b[1]), (b[2], b[1]), (b[2], b[3]), (b[0], b[3]), (b[0], b[1])):
+                ring.AddPoint_2D(x, y)
+            tile = ogr.Geometry(ogr.wkbPolygon)
+            tile.AddGeometry(ring)
+            if tile.Intersects(geom):
+                result.append(self.names[k])
+        return result
+
+    # 包含某坐标的切片
+    def query_point(self, x, y):
+        return [self.names[k] for k in self._search((x, y, x, y))]
+
+    def get(self, name):
+        '''
+        :return: (地理参考六参数, 外包矩形)
+        '''
+        k = self.lookup[name]
+        return self.geos[k], self.boxes[k]
+
+
+# 构建(或加载已有的)切片索引, 保存为 原始文件名_footprint.json
+# 切片尺寸或坐标文件修改时间与缓存不一致时重新构建
+def load_or_build(txt_path, tile_size=None, rebuild=False):
+    path = txt_path[:-len('_info.txt')] + FOOTPRINT_SUFFIX if txt_path.endswith('_info.txt') else txt_path + FOOTPRINT_SUFFIX
+    key = {'tile_size': tile_size, 'mtime_ns': os.stat(txt_path).st_mtime_ns}
+    if not rebuild and os.path.exists(path):
+        index = TileIndex.load(path)
+        if index.key == key:
+            return index
+    index = TileIndex.build(txt_path, tile_size)
+    index.key = key
+    index.save(path)
+    return index
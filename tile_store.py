@@ -0,0 +1,168 @@
+#!/usr/bin/env python
+# -*- encoding: utf-8 -*-
+'''
+@File    :   tile_store.py
+@Time    :   2026/10/19 14:20:41
+@Author  :   StrideH
+@Desc    :   pack tiles into tar shards or one HDF5 array instead of one file per tile
+'''
+
+import io
+import os
+import tarfile
+import numpy as np
+
+# 索引文件后缀, 每行格式为“切片名_容器文件_偏移_字节数_数据类型_形状”
+INDEX_SUFFIX = '_index.txt'
+
+
+def index_path(save_path, name):
+    return os.path.join(save_path, name + INDEX_SUFFIX)
+
+
+# 判断路径是否为切片容器索引
+def is_store(path):
+    return str(path).endswith(INDEX_SUFFIX) and os.path.isfile(path)
+
+
+def _index_line(key, file_name, offset, size, array):
+    return '{}*_&{}*_&{}*_&{}*_&{}*_&{}\n'.format(key, file_name, offset, size, array.dtype.str, ','.join(str(n) for n in array.shape))
+
+
+# 定长tar分片(与WebDataset兼容, 成员名为 切片名.npy)
+class TarShardWriter:
+    def __init__(self, save_path, name, shard_size=1000):
+        '''
+        :param save_path: 保存路径
+        :param name: 原始文件名, 分片命名为 原始文件名_00000.tar
+        :param shard_size: 每个分片的切片数
+        '''
+        self.save_path = save_path
+        self.name = name
+        self.shard_size = shard_size
+        self.count = 0
+        self.tar = None
+        self.shard_name = None
+        self.index = open(index_path(save_path, name), 'w')
+
+    def add(self, key, array):
+        if self.count % self.shard_size == 0:
+            if self.tar is not None:
+                self.tar.close()
+            self.shard_name = '{}_{:05d}.tar'.format(self.name, self.count // self.shard_size)
+            self.tar = tarfile.open(os.path.join(self.save_path, self.shard_name), 'w')
+        buf = io.BytesIO()
+        np.save(buf, np.ascontiguousarray(array))
+        size = buf.tell()
+        buf.seek(0)
+        info = tarfile.TarInfo(key + '.npy')
+        info.size = size
+        self.tar.addfile(info, buf)
+        # 数据写完后按512字节块对齐, 由此反推数据在分片中的偏移
+        offset = self.tar.offset - (size + tarfile.BLOCKSIZE - 1) // tarfile.BLOCKSIZE * tarfile.BLOCKSIZE
+        self.index.write(_index_line(key, self.shard_name, offset, size, array))
+        self.count += 1
+
+    def close(self):
+        if self.tar is not None:
+            self.tar.close()
+        self.index.close()
+
+
+# HDF5: 所有切片存为一个按切片分块的四维数组
+class H5Writer:
+    def __init__(self, save_path, name, compression=None):
+        '''
+        :param save_path: 保存路径
+        :param name: 原始文件名, 文件命名为 原始文件名.h5
+        :param compression: h5py压缩方式, 如'gzip', 'lzf', 默认不压缩
+        '''
+        import h5py
+        self.file_name = name + '.h5'
+        self.h5 = h5py.File(os.path.join(save_path, self.file_name), 'w')
+        self.compression = compression
+        self.dataset = None
+        self.count = 0
+        self.index = open(index_path(save_path, name), 'w')
+
+    def add(self, key, array):
+        if self.dataset is None:
+            self.dataset = self.h5.create_dataset('tiles', shape=(0,) + array.shape, maxshape=(None,) + array.shape,
+                                                  chunks=(1,) + array.shape, dtype=array.dtype, compression=self.compression)
+        if array.shape != self.dataset.shape[1:]:
+            raise ValueError('tile {} shape {} != {}'.format(key, array.shape, self.dataset.shape[1:]))
+        self.dataset.resize(self.count + 1, axis=0)
+        self.dataset[self.count] = array
+        self.index.write(_index_line(key, self.file_name, self.count, 0, array))
+        self.count += 1
+
+    def close(self):
+        self.h5.close()
+        self.index.close()
+
+
+def create_writer(container, save_path, name, shard_size=1000):
+    '''
+    :param container: 'tar' 或 'h5'
+    :return: writer, 使用 add(key, array) 写入, close() 结束
+    '''
+    if container == 'tar':
+        return TarShardWriter(save_path, name, shard_size)
+    if container == 'h5':
+        return H5Writer(save_path, name)
+    raise ValueError('container must be tar or h5, got {}'.format(container))
+
+
+# 按切片名读取容器中的切片, 无需遍历目录
+class TileStore:
+    def __init__(self, index_file):
+        self.root = os.path.dirname(index_file)
+        self.entries = {}
+        with open(index_file, 'r') as f:
+            for line in f:
+                if not line.strip():
+                    continue
+                key, file_name, offset, size, dtype, shape = line.strip().split('*_&')
+                self.entries[key] = (file_name, int(offset), int(size), np.dtype(dtype), tuple(int(n) for n in shape.split(',')))
+        self._files = {}
+
+    def keys(self):
+        return list(self.entries.keys())
+
+    def __contains__(self, key):
+        return key in self.entries
+
+    def __len__(self):
+        return len(self.entries)
+
+    def shape(self, key):
+        return self.entries[key][4]
+
+    def dtype(self, key):
+        return self.entries[key][3]
+
+    def read(self, key):
+        file_name, offset, size, dtype, shape = self.entries[key]
+        if file_name not in self._files:
+            path = os.path.join(self.root, file_name)
+            if file_name.endswith('.h5'):
+                import h5py
+                self._files[file_name] = h5py.File(path, 'r')
+            else:
+                self._files[file_name] = open(path, 'rb')
+        handle = self._files[file_name]
+        if file_name.endswith('.h5'):
+            return handle['tiles'][offset]
+        handle.seek(offset)
+        return np.load(io.BytesIO(handle.read(size)))
+
+    def close(self):
+        for handle in self._files.values():
+            handle.close()
+        self._files = {}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
@@ -0,0 +1,516 @@
+#!/usr/bin/env python
+# -*- encoding: utf-8 -*-
+'''
+@File    :   work_queue.py
+@Time    :   2026/10/19 22:05:40
+@Author  :   StrideH
+@Desc    :   lease-based work queue on a shared directory: sharded crop/polygonize across processes and hosts
+'''
+
+import os
+import json
+import time
+import glob
+import uuid
+import shutil
+import socket
+import inspect
+import importlib
+import argparse
+import threading
+import multiprocessing
+
+# 队列目录结构:
+#   plan.json       任务类型及合并参数
+#   todo/           待领取任务
+#   leased/         已领取任务, 文件名为 任务名@租约标识.json, 文件修改时间为心跳
+#   done/           已完成任务
+#   failed/         超过重试次数的任务
+#   tmp/            临时文件, 写完后原子重命名到目标目录
+#   reduce.lock/    合并步骤锁(原子mkdir), 目录修改时间为心跳, 超时可被其他节点接管; reduce.done 为合并完成标记
+STATES = ('todo', 'leased', 'done', 'failed')
+
+
+# 任务类型/合并类型: 内置名称, 或 '模块:函数' 形式的自定义处理函数
+def _resolve(table, name):
+    if name in table:
+        return table[name]
+    module, _, func = name.partition(':')
+    return getattr(importlib.import_module(module), func)
+
+
+# 后台线程定期刷新文件(目录)修改时间, 作为租约心跳
+class _Heartbeat:
+    def __init__(self, path, interval):
+        self.path = path
+        self.interval = interval
+        self.stop = threading.Event()
+        self.thread = threading.Thread(target=self.run, daemon=True)
+
+    def run(self):
+        while not self.stop.wait(self.interval):
+            try:
+                os.utime(self.path)
+            except OSError:
+                break
+
+    def __enter__(self):
+        self.thread.start()
+        return self
+
+    def __exit__(self, *args):
+        self.stop.set()
+        self.thread.join()
+
+
+def _num_windows(size, crop_size, is_supplement):
+    num = size // crop_size
+    return num + 1 if is_supplement and size % crop_size != 0 else num
+
+
+class WorkQueue:
+    def __init__(self, queue_dir, max_attempts=3):
+        '''
+        :param queue_dir: 共享目录(所有节点可见, 同一文件系统内rename为原子操作)
+        :param max_attempts: 单个任务最多尝试次数
+        '''
+        self.queue_dir = queue_dir
+        self.max_attempts = max_attempts
+        for state in STATES + ('tmp',):
+            os.makedirs(os.path.join(queue_dir, state), exist_ok=True)
+
+    def _path(self, state, task_id):
+        return os.path.join(self.queue_dir, state, task_id + '.json')
+
+    # 租约文件名带领取时生成的标识, 租约过期被收回后原持有者无法再操作该文件
+    def _lease(self, task_id, lease):
+        return os.path.join(self.queue_dir, 'leased', '{}@{}.json'.format(task_id, lease))
+
+    # 先写临时文件再原子重命名, 其他节点不会读到写了一半的文件
+    def _write(self, state, task):
+        tmp = os.path.join(self.queue_dir, 'tmp', '{}.{}.{}'.format(task['id'], socket.gethostname(), os.getpid()))
+        with open(tmp, 'w', encoding='utf-8') as f:
+            json.dump(task, f)
+        os.replace(tmp, self._path(state, task['id']))
+
+    def _read(self, path):
+        with open(path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+
+    def write_plan(self, plan):
+        with open(os.path.join(self.queue_dir, 'plan.json'), 'w', encoding='utf-8') as f:
+            json.dump(plan, f, indent=2)
+
+    def plan(self):
+        with open(os.path.join(self.queue_dir, 'plan.json'), 'r', encoding='utf-8') as f:
+            return json.load(f)
+
+    def put(self, task_id, kind, **payload):
+        task = dict(payload, id=task_id, kind=kind, attempts=0)
+        self._write('todo', task)
+
+    def ids(self, state):
+        return [task_id for task_id, _ in self._entries(state)]
+
+    # (任务名, 文件名), 租约文件名中的租约标识去掉
+    def _entries(self, state):
+        entries = []
+        for name in os.listdir(os.path.join(self.queue_dir, state)):
+            if name.endswith('.json'):
+                task_id = os.path.splitext(name)[0]
+                entries.append((task_id.rsplit('@', 1)[0] if state == 'leased' else task_id, name))
+        return sorted(entries)
+
+    def counts(self):
+        return {state: len(self.ids(state)) for state in STATES}
+
+    def pending(self):
+        counts = self.counts()
+        return counts['todo'] + counts['leased']
+
+    def claim(self, worker_id):
+        '''
+        :return: 领取到的任务, 没有待领取任务时返回None
+        '''
+        for task_id in self.ids('todo'):
+            lease = uuid.uuid4().hex
+            path = self._lease(task_id, lease)
+            try:
+                # rename保留规划时的修改时间, 先刷新再重命名, 租约文件出现时心跳已是当前时间
+                os.utime(self._path('todo', task_id))
+                # 原子重命名, 只有一个节点能成功
+                os.rename(self._path('todo', task_id), path)
+                task = self._read(path)
+            except (OSError, ValueError):
+                continue
+            task.update(worker=worker_id, leased_at=time.time(), lease=lease)
+            # 重写租约文件(写临时文件后原子替换)
+            tmp = os.path.join(self.queue_dir, 'tmp', '{}@{}'.format(task_id, lease))
+            with open(tmp, 'w', encoding='utf-8') as f:
+                json.dump(task, f)
+            os.replace(tmp, path)
+            return task
+        return None
+
+    def lease_path(self, task):
+        return self._lease(task['id'], task['lease'])
+
+    # 收回自己持有的租约: 重命名到临时文件, 租约已过期被收回时返回None
+    def _release(self, task):
+        held = os.path.join(self.queue_dir, 'tmp', '{}.release.{}'.format(task['id'], uuid.uuid4().hex))
+        try:
+            os.rename(self.lease_path(task), held)
+        except OSError:
+            print('Error: lease of task {} expired and the task was requeued, result discarded.'.format(task['id']))
+            return None
+        return held
+
+    def complete(self, task, result=None):
+        '''
+        :return: 是否仍持有租约并完成, 租约过期时任务已被放回队列, 不重复记录
+        '''
+        held = self._release(task)
+        if held is None:
+            return False
+        self._write('done', dict(task, result=result, finished_at=time.time()))
+        os.remove(held)
+        return True
+
+    def fail(self, task, error):
+        held = self._release(task)
+        if held is None:
+            return False
+        task = dict(task, attempts=task.get('attempts', 0) + 1, error=error)
+        self._write('todo' if task['attempts'] < self.max_attempts else 'failed', task)
+        os.remove(held)
+        return True
+
+    # 心跳超时的任务(节点宕机或进程被杀)计一次失败, 未超过重试次数时放回待领取队列
+    def requeue_expired(self, lease_timeout):
+        now = time.time()
+        count = 0
+        for task_id, name in self._entries('leased'):
+            path = os.path.join(self.queue_dir, 'leased', name)
+            # 先原子重命名到临时文件, 多个节点同时检查时只有一个处理
+            stale = os.path.join(self.queue_dir, 'tmp', '{}.expired.{}'.format(task_id, uuid.uuid4().hex))
+            try:
+                if now - os.path.getmtime(path) < lease_timeout:
+                    continue
+                os.rename(path, stale)
+            except OSError:
+                continue
+            try:
+                task = self._read(stale)
+            except (OSError, ValueError):
+                os.rename(stale, self._path('todo', task_id))
+                count += 1
+                continue
+            task = dict(task, attempts=task.get('attempts', 0) + 1, error='lease expired on {}'.format(task.get('worker')))
+            self._write('todo' if task['attempts'] < self.max_attempts else 'failed', task)
+            os.remove(stale)
+            count += 1
+        return count
+
+    def reduced(self):
+        return os.path.exists(os.path.join(self.queue_dir, 'reduce.done'))
+
+    # 合并步骤只执行一次: 抢到锁的节点执行, 执行期间刷新锁心跳; 持锁节点宕机时锁超时后由其他节点接管
+    def try_reduce(self, lease_timeout=300, heartbeat=30):
+        if self.reduced():
+            return False
+        lock = os.path.join(self.queue_dir, 'reduce.lock')
+        try:
+            os.mkdir(lock)
+        except OSError:
+            try:
+                if time.time() - os.path.getmtime(lock) < lease_timeout:
+                    return False
+                # 接管过期的锁: 原子重命名, 只有一个节点成功
+                stale = os.path.join(self.queue_dir, 'tmp', 'reduce.lock.{}'.format(uuid.uuid4().hex))
+                os.rename(lock, stale)
+                shutil.rmtree(stale, ignore_errors=True)
+                os.mkdir(lock)
+            except OSError:
+                return False
+        with open(os.path.join(lock, 'owner'), 'w') as f:
+            f.write('{}:{}'.format(socket.gethostname(), os.getpid()))
+        with _Heartbeat(lock, heartbeat):
+            plan = self.plan()
+            _resolve(REDUCERS, plan['kind'])(self, plan)
+        with open(os.path.join(self.queue_dir, 'reduce.done'), 'w') as f:
+            f.write(str(time.time()))
+        shutil.rmtree(lock, ignore_errors=True)
+        return True
+
+
+# ---------------------------------------------------------------- 任务规划
+
+def plan_crop(queue_dir, file_list, save_path, crop_size, is_supplement=True, tiles_per_task=500, **crop_kwargs):
+    '''
+    :param file_list: 待切割文件列表; tif按窗口序号分片, jpg/png每个文件一个任务
+    :param tiles_per_task: 每个任务的切片数
+    :param crop_kwargs: 其他裁剪参数(如 empty_tiles, stats, container), tif任务传给 GRID.crop_tif 支持的参数,
+                        jpg/png任务传给 GRID.crop_image 支持的参数
+    :return: WorkQueue
+    '''
+    from osgeo import gdal
+    from crop_merge_image import GRID
+    tif_params = inspect.signature(GRID.crop_tif).parameters
+    image_params = inspect.signature(GRID.crop_image).parameters
+    unknown = [key for key in crop_kwargs if key not in tif_params and key not in image_params]
+    if unknown:
+        print('Error: unknown crop options: {}'.format(', '.join(unknown)))
+        return None
+    tif_kwargs = {key: value for key, value in crop_kwargs.items() if key in tif_params}
+    image_kwargs = {key: value for key, value in crop_kwargs.items() if key in image_params}
+    queue = WorkQueue(queue_dir)
+    queue.write_plan({'kind': 'crop', 'save_path': save_path, 'files': file_list})
+    for k, file in enumerate(file_list):
+        if file.lower().endswith(('.tif', '.tiff')):
+            ds = gdal.Open(file)
+            if ds is None:
+                print('Error: {} not exist or image format is wrong.'.format(file))
+                continue
+            total = _num_windows(ds.RasterXSize, crop_size, is_supplement) * _num_windows(ds.RasterYSize, crop_size, is_supplement)
+            ds = None
+            for start in range(0, total, tiles_per_task):
+                queue.put('crop_{:05d}_{:08d}'.format(k, start), 'crop_tif', file=file, save_path=save_path, crop_size=crop_size,
+                          is_supplement=is_supplement, tile_range=[start, min(start + tiles_per_task, total)], kwargs=tif_kwargs)
+        else:
+            queue.put('crop_{:05d}_{:08d}'.format(k, 0), 'crop_image', file=file, save_path=save_path, crop_size=crop_size,
+                      is_supplement=is_supplement, kwargs=image_kwargs)
+    print('Planned {} crop tasks in {}'.format(queue.counts()['todo'], queue_dir))
+    return queue
+
+
+def plan_polygonize(queue_dir, raster_path, save_path, xchunks, ychunks, ignore_values=None, field_name='value'):
+    '''
+    :param raster_path: 分类结果栅格
+    :param save_path: 输出shp, 合并步骤融合分块接缝处的面后写出
+    :param xchunks: 横向分块数
+    :param ychunks: 纵向分块数
+    :return: WorkQueue
+    '''
+    from osgeo import gdal
+    ds = gdal.Open(raster_path)
+    if ds is None:
+        print('Error: {} not exist or image format is wrong.'.format(raster_path))
+        return None
+    width, height = ds.RasterXSize, ds.RasterYSize
+    ds = None
+    queue = WorkQueue(queue_dir)
+    parts_dir = os.path.join(queue_dir, 'parts')
+    os.makedirs(parts_dir, exist_ok=True)
+    queue.write_plan({'kind': 'polygonize', 'raster': raster_path, 'save_path': save_path, 'parts_dir': parts_dir, 'field_name': field_name})
+    xs = [width * k // xchunks for k in range(xchunks + 1)]
+    ys = [height * k // ychunks for k in range(ychunks + 1)]
+    for x in range(xchunks):
+        for y in range(ychunks):
+            window = [xs[x], ys[y], xs[x + 1] - xs[x], ys[y + 1] - ys[y]]
+            if window[2] > 0 and window[3] > 0:
+                queue.put('polygonize_{}_{}'.format(x, y), 'polygonize', raster=raster_path, window=window,
+                          ignore_values=ignore_values, parts_dir=parts_dir)
+    print('Planned {} polygonize tasks in {}'.format(queue.counts()['todo'], queue_dir))
+    return queue
+
+
+# ---------------------------------------------------------------- 任务执行
+
+def _run_crop_tif(task):
+    from crop_merge_image import GRID
+    GRID.crop_tif(task['file'], task['save_path'], task['crop_size'], task['is_supplement'],
+                  tile_range=tuple(task['tile_range']), **task['kwargs'])
+
+
+def _run_crop_image(task):
+    from crop_merge_image import GRID
+    GRID.crop_image(task['file'], task['save_path'], task['crop_size'], task['is_supplement'], **task['kwargs'])
+
+
+# 分块转矢量, 结果(含是否在分块边界)写入 parts/任务名.json
+def _run_polygonize(task):
+    from osgeo import gdal
+    from crop_merge_image import GRID
+    ds = gdal.Open(task['raster'])
+    x0, y0, w, h = task['window']
+    data = ds.GetRasterBand(1).ReadAsArray(x0, y0, w, h)
+    gt = ds.GetGeoTransform()
+    proj = ds.GetProjection()
+    ds = None
+    geo = (gt[0] + x0 * gt[1] + y0 * gt[2], gt[1], gt[2], gt[3] + x0 * gt[4] + y0 * gt[5], gt[4], gt[5])
+    features = GRID.polygonize_array(data, geo, proj, task.get('ignore_values'))
+    features = GRID.mark_edge_features(features, geo, w, h)
+    part = os.path.join(task['parts_dir'], task['id'] + '.json')
+    with open(part + '.tmp', 'w', encoding='utf-8') as f:
+        json.dump({'proj': proj, 'features': [[value, bytes(wkb).hex(), on_edge] for value, wkb, on_edge in features]}, f)
+    os.replace(part + '.tmp', part)
+    return {'features': len(features)}
+
+
+HANDLERS = {
+    'crop_tif': _run_crop_tif,
+    'crop_image': _run_crop_image,
+    'polygonize': _run_polygonize,
+}
+
+
+# ---------------------------------------------------------------- 合并
+
+# 各分片的坐标、空白窗口、哈希、直方图、容器索引文件(含 mask/ 下的标签容器索引)按序拼接, 统计文件合并
+def _reduce_crop(queue, plan):
+    import band_stats
+    save_path = plan['save_path']
+    for file in plan['files']:
+        name = os.path.splitext(os.path.basename(file))[0]
+        for folder in (save_path, os.path.join(save_path, 'mask')):
+            for suffix in ('_info.txt', '_empty.txt', '_hash.txt', '_hist.txt', '_index.txt'):
+                parts = sorted(glob.glob(os.path.join(glob.escape(folder), glob.escape(name) + '_part' + '[0-9]' * 8 + suffix)))
+                if not parts:
+                    continue
+                with open(os.path.join(folder, name + suffix), 'w') as out:
+                    for part in parts:
+                        with open(part, 'r') as f:
+                            out.write(f.read())
+                for part in parts:
+                    os.remove(part)
+        parts = sorted(glob.glob(os.path.join(glob.escape(save_path), glob.escape(name) + '_part' + '[0-9]' * 8 + band_stats.STATS_SUFFIX)))
+        if parts:
+            for merged in band_stats.merge_files(parts).values():
+                merged.save(os.path.join(save_path, name + band_stats.STATS_SUFFIX))
+            for part in parts:
+                os.remove(part)
+    print('Success reduce crop of {} files. save path: {}'.format(len(plan['files']), save_path))
+
+
+# 读取各分块的面, 融合接缝处的面后写出
+def _reduce_polygonize(queue, plan):
+    from crop_merge_image import GRID
+    features = []
+    proj = ''
+    for part in sorted(glob.glob(os.path.join(glob.escape(plan['parts_dir']), '*.json'))):
+        with open(part, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+        proj = data['proj']
+        features.extend((value, bytes.fromhex(wkb), on_edge) for value, wkb, on_edge in data['features'])
+    features = GRID.dissolve_edge_features(features)
+    GRID.write_polygons(plan['save_path'], proj, features, plan.get('field_name', 'value'))
+    print('Success reduce polygonize, {} features. save path: {}'.format(len(features), plan['save_path']))
+
+
+REDUCERS = {
+    'crop': _reduce_crop,
+    'polygonize': _reduce_polygonize,
+}
+
+
+# ---------------------------------------------------------------- 工作进程
+
+def run_worker(queue_dir, worker_id=None, lease_timeout=300, heartbeat=30, poll=2, reduce=True, max_attempts=3):
+    '''
+    :param queue_dir: 队列目录
+    :param worker_id: 工作进程标识, 默认 主机名:进程号
+    :param lease_timeout: 心跳超时时间(秒), 超时的任务放回队列
+    :param heartbeat: 心跳间隔(秒)
+    :param poll: 没有可领取任务时的等待间隔(秒)
+    :param reduce: 全部任务完成后是否尝试执行合并步骤
+    :param max_attempts: 单个任务最多尝试次数, 超过后移入failed
+    :return: 本进程完成的任务数
+    '''
+    queue = WorkQueue(queue_dir, max_attempts)
+    worker_id = worker_id or '{}:{}'.format(socket.gethostname(), os.getpid())
+    finished = 0
+    idle = False
+    while True:
+        task = queue.claim(worker_id)
+        if task is None:
+            queue.requeue_expired(lease_timeout)
+            # 任务在目录间移动时单次计数可能漏掉, 间隔poll连续两次为空才退出
+            if queue.pending() == 0:
+                if idle:
+                    break
+                idle = True
+            else:
+                idle = False
+            time.sleep(poll)
+            continue
+        idle = False
+        start = time.perf_counter()
+        # 后台线程定期刷新租约
+        with _Heartbeat(queue.lease_path(task), heartbeat):
+            try:
+                result = _resolve(HANDLERS, task['kind'])(task)
+            except Exception as e:
+                queue.fail(task, repr(e))
+                print('Error: task {} failed on {}: {!r}'.format(task['id'], worker_id, e))
+                continue
+        if queue.complete(task, dict(result or {}, seconds=time.perf_counter() - start, worker=worker_id)):
+            finished += 1
+    counts = queue.counts()
+    if reduce and counts['failed'] == 0 and counts['done'] > 0:
+        # 其他节点正在合并时等待, 持锁节点宕机则锁超时后接管
+        while not queue.try_reduce(lease_timeout, heartbeat) and not queue.reduced():
+            time.sleep(poll)
+    elif counts['failed']:
+        print('Error: {} tasks failed, see {}'.format(counts['failed'], os.path.join(queue_dir, 'failed')))
+    return finished
+
+
+# 本机多进程运行(与多机运行相同的队列协议)
+def run_local(queue_dir, workers=4, **kwargs):
+    ctx = multiprocessing.get_context('spawn')
+    processes = [ctx.Process(target=run_worker, args=(queue_dir, 'local-{}'.format(k)), kwargs=kwargs) for k in range(workers)]
+    for process in processes:
+        process.start()
+    for process in processes:
+        process.join()
+    counts = WorkQueue(queue_dir).counts()
+    print('Queue {}: {} done, {} failed.'.format(queue_dir, counts['done'], counts['failed']))
+    return counts
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Shared-directory work queue for sharded crop and polygonize.')
+    sub = parser.add_subparsers(dest='command')
+    sub.required = True
+    p = sub.add_parser('plan-crop', help='write crop tasks for every image in a folder')
+    p.add_argument('queue_dir')
+    p.add_argument('input', help='image folder')
+    p.add_argument('output', help='tile save folder')
+    p.add_argument('--size', type=int, required=True)
+    p.add_argument('--no-supplement', action='store_true')
+    p.add_argument('--tiles-per-task', type=int, default=500)
+    p.add_argument('--stats', action='store_true')
+    p = sub.add_parser('plan-polygonize', help='write polygonize tasks for the chunks of a raster')
+    p.add_argument('queue_dir')
+    p.add_argument('input', help='classification raster')
+    p.add_argument('output', help='output shp')
+    p.add_argument('--chunks', type=int, nargs=2, default=[4, 4], metavar=('X', 'Y'))
+    p.add_argument('--ignore', type=float, nargs='+', default=None)
+    for name, help_text in (('work', 'run one worker until the queue is drained'), ('local', 'run several local workers')):
+        p = sub.add_parser(name, help=help_text)
+        p.add_argument('queue_dir')
+        p.add_argument('--lease-timeout', type=float, default=300)
+        p.add_argument('--heartbeat', type=float, default=30)
+        if name == 'local':
+            p.add_argument('--workers', type=int, default=4)
+    p = sub.add_parser('status', help='print task counts')
+    p.add_argument('queue_dir')
+    args = parser.parse_args(argv)
+
+    if args.command == 'plan-crop':
+        files = sorted(os.path.join(args.input, f) for f in os.listdir(args.input)
+                       if f.lower().endswith(('.tif', '.tiff', '.jpg', '.jpeg', '.png')))
+        kwargs = {'stats': True} if args.stats else {}
+        plan_crop(args.queue_dir, files, args.output, args.size, not args.no_supplement, args.tiles_per_task, **kwargs)
+    elif args.command == 'plan-polygonize':
+        plan_polygonize(args.queue_dir, args.input, args.output, args.chunks[0], args.chunks[1], args.ignore)
+    elif args.command == 'work':
+        run_worker(args.queue_dir, lease_timeout=args.lease_timeout, heartbeat=args.heartbeat)
+    elif args.command == 'local':
+        run_local(args.queue_dir, args.workers, lease_timeout=args.lease_timeout, heartbeat=args.heartbeat)
+    else:
+        print(WorkQueue(args.queue_dir).counts())
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,226 @@
+#!/usr/bin/env python
+# -*- encoding: utf-8 -*-
+'''
+@File    :   zonal_stats.py
+@Time    :   2026/10/19 19:36:12
+@Author  :   StrideH
+@Desc    :   per-class pixel counts, object counts, areas and bboxes from a classification raster without polygonizing
+'''
+
+import os
+import csv
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+from osgeo import gdal
+from scipy import ndimage
+import instrument
+
+
+# 单个分块: 类别直方图 + 连通域(数量、像元数、外包矩形) + 四条边上的标签
+def _block_stats(args):
+    path, x0, y0, w, h, connectivity, ignore_values = args
+    ds = gdal.Open(path)
+    band = ds.GetRasterBand(1)
+    data = band.ReadAsArray(x0, y0, w, h)
+    nodata = band.GetNoDataValue()
+    ds = None
+
+    valid = np.ones(data.shape, dtype=bool)
+    if nodata is not None:
+        valid &= data != nodata
+    if ignore_values is not None:
+        valid &= ~np.isin(data, ignore_values)
+
+    # 类别像元数
+    if np.issubdtype(data.dtype, np.integer) and (data.size == 0 or data.min() >= 0):
+        counts = np.bincount(data[valid].ravel())
+        classes = np.nonzero(counts)[0]
+        hist = {c.item(): counts[c].item() for c in classes}
+    else:
+        classes, counts = np.unique(data[valid], return_counts=True)
+        hist = {c.item(): n.item() for c, n in zip(classes, counts)}
+
+    # 每个类别分别标记连通域, 合成一张分块内唯一编号的标签图
+    structure = ndimage.generate_binary_structure(2, 1 if connectivity == 4 else 2)
+    labels = np.zeros(data.shape, dtype=np.int32)
+    comp_class = []
+    comp_pixels = []
+    comp_boxes = []
+    offset = 0
+    for value in hist:
+        lab, num = ndimage.label(valid & (data == value), structure=structure)
+        if num == 0:
+            continue
+        labels[lab > 0] = lab[lab > 0] + offset
+        comp_pixels.append(np.bincount(lab.ravel(), minlength=num + 1)[1:])
+        for sl in ndimage.find_objects(lab):
+            comp_boxes.append((y0 + sl[0].start, x0 + sl[1].start, y0 + sl[0].stop, x0 + sl[1].stop))
+        comp_class.extend([value] * num)
+        offset += num
+    pixels = np.concatenate(comp_pixels) if comp_pixels else np.zeros(0, dtype=np.int64)
+    boxes = np.array(comp_boxes, dtype=np.int64).reshape(-1, 4)
+    edges = (labels[0].copy(), labels[-1].copy(), labels[:, 0].copy(), labels[:, -1].copy())
+    return hist, comp_class, pixels, boxes, edges
+
+
+class _UnionFind:
+    def __init__(self, n):
+        self.parent = np.arange(n)
+
+    def find(self, a):
+        root = a
+        while self.parent[root] != root:
+            root = self.parent[root]
+        while self.parent[a] != root:
+            self.parent[a], a = root, self.parent[a]
+        return root
+
+    def union(self, a, b):
+        ra, rb = self.find(a), self.find(b)
+        if ra != rb:
+            self.parent[max(ra, rb)] = min(ra, rb)
+
+    # 所有元素的根节点: 指针跳跃 parent[parent] 直到不再变化
+    def roots(self):
+        parent = self.parent
+        while True:
+            grand = parent[parent]
+            if np.array_equal(grand, parent):
+                return grand
+            parent = grand
+
+
+def zonal_stats(raster_path, connectivity=4, ignore_values=None, block_size=1024, workers=4):
+    '''
+    :param raster_path: 分类结果栅格(单波段, 使用第一个波段)
+    :param connectivity: 连通方式, 4 或 8
+    :param ignore_values: 忽略的类别(如背景0), nodata自动忽略
+    :param block_size: 分块大小
+    :param workers: 并行进程数
+    :return: (classes, objects)
+             classes: {类别: {'pixels', 'area', 'objects', 'bbox'}}
+             objects: [{'class', 'pixels', 'area', 'bbox'}], bbox为地图坐标 (xmin, ymin, xmax, ymax)
+    '''
+    if connectivity not in (4, 8):
+        raise ValueError('connectivity must be 4 or 8')
+    ds = gdal.Open(raster_path)
+    if ds is None:
+        print('Error: {} not exist or image format is wrong.'.format(raster_path))
+        return None
+    width, height = ds.RasterXSize, ds.RasterYSize
+    geo = ds.GetGeoTransform()
+    ds = None
+
+    xs = list(range(0, width, block_size))
+    ys = list(range(0, height, block_size))
+    jobs = [(raster_path, x0, y0, min(block_size, width - x0), min(block_size, height - y0), connectivity, ignore_values)
+            for y0 in ys for x0 in xs]
+    with instrument.timer('zonal_stats', 'compute'):
+        if workers > 1 and len(jobs) > 1:
+            with ProcessPoolExecutor(max_workers=workers) as pool:
+                results = list(pool.map(_block_stats, jobs))
+        else:
+            results = [_block_stats(job) for job in jobs]
+
+    # 分块内编号转为全局编号(0为背景)
+    hist = {}
+    comp_class = [None]
+    pixels = [np.zeros(1, dtype=np.int64)]
+    boxes = [np.zeros((1, 4), dtype=np.int64)]
+    offsets = []
+    for block_hist, block_class, block_pixels, block_boxes, _ in results:
+        for value, n in block_hist.items():
+            hist[value] = hist.get(value, 0) + n
+        offsets.append(len(comp_class) - 1)
+        comp_class.extend(block_class)
+        pixels.append(block_pixels)
+        boxes.append(block_boxes)
+    pixels = np.concatenate(pixels)
+    boxes = np.concatenate(boxes)
+    class_ids = {value: k for k, value in enumerate(hist)}
+    class_index = np.array([-1] + [class_ids[value] for value in comp_class[1:]], dtype=np.int64)
+
+    def global_labels(block, k):
+        edge = results[block][4][k].astype(np.int64)
+        return np.where(edge > 0, edge + offsets[block], 0)
+
+    # 接缝两侧相邻像元类别相同则合并连通域
+    uf = _UnionFind(len(comp_class))
+
+    def join(a, b):
+        keep = (a > 0) & (b > 0)
+        a, b = a[keep], b[keep]
+        keep = class_index[a] == class_index[b]
+        for pair in np.unique(np.stack([a[keep], b[keep]], axis=1), axis=0):
+            uf.union(pair[0], pair[1])
+
+    with instrument.timer('zonal_stats', 'compute'):
+        nx = len(xs)
+        for bi in range(len(ys)):
+            for bj in range(nx):
+                block = bi * nx + bj
+                if bj + 1 < nx:
+                    left, right = global_labels(block, 3), global_labels(block + 1, 2)
+                    join(left, right)
+                    if connectivity == 8:
+                        join(left[1:], right[:-1])
+                        join(left[:-1], right[1:])
+                if bi + 1 < len(ys):
+                    top, bottom = global_labels(block, 1), global_labels(block + nx, 0)
+                    join(top, bottom)
+                    if connectivity == 8:
+                        join(top[1:], bottom[:-1])
+                        join(top[:-1], bottom[1:])
+                        # 四个分块交汇处的对角像元
+                        if bj + 1 < nx:
+                            join(top[-1:], global_labels(block + nx + 1, 0)[:1])
+                            join(global_labels(block + 1, 1)[:1], bottom[-1:])
+
+    # 按根节点汇总
+    roots = uf.roots()
+    unique_roots, inverse = np.unique(roots[1:], return_inverse=True)
+    merged_pixels = np.bincount(inverse, weights=pixels[1:], minlength=len(unique_roots)).astype(np.int64)
+    merged_boxes = np.zeros((len(unique_roots), 4), dtype=np.int64)
+    merged_boxes[:, :2] = np.iinfo(np.int64).max
+    np.minimum.at(merged_boxes[:, 0], inverse, boxes[1:, 0])
+    np.minimum.at(merged_boxes[:, 1], inverse, boxes[1:, 1])
+    np.maximum.at(merged_boxes[:, 2], inverse, boxes[1:, 2])
+    np.maximum.at(merged_boxes[:, 3], inverse, boxes[1:, 3])
+
+    pixel_area = abs(geo[1] * geo[5] - geo[2] * geo[4])
+
+    def to_map(box):
+        r0, c0, r1, c1 = box
+        x = (geo[0] + c0 * geo[1] + r0 * geo[2], geo[0] + c1 * geo[1] + r1 * geo[2])
+        y = (geo[3] + c0 * geo[4] + r0 * geo[5], geo[3] + c1 * geo[4] + r1 * geo[5])
+        return (min(x), min(y), max(x), max(y))
+
+    objects = []
+    for root, n, box in zip(unique_roots, merged_pixels, merged_boxes):
+        objects.append({'class': comp_class[root], 'pixels': int(n), 'area': int(n) * pixel_area, 'bbox': to_map(box)})
+    classes = {}
+    for value, n in hist.items():
+        classes[value] = {'pixels': n, 'area': n * pixel_area, 'objects': 0, 'bbox': None}
+    for obj in objects:
+        item = classes[obj['class']]
+        item['objects'] += 1
+        b = obj['bbox'] if item['bbox'] is None else item['bbox']
+        item['bbox'] = (min(b[0], obj['bbox'][0]), min(b[1], obj['bbox'][1]), max(b[2], obj['bbox'][2]), max(b[3], obj['bbox'][3]))
+    instrument.emit('zonal_stats', blocks=len(jobs), classes=len(classes), objects=len(objects))
+    return classes, objects
+
+
+# 统计结果保存为csv: 原始文件名_class_stats.csv, 原始文件名_objects.csv
+def save_csv(classes, objects, save_path, name):
+    if not os.path.exists(save_path):
+        os.makedirs(save_path)
+    with open(os.path.join(save_path, name + '_class_stats.csv'), 'w', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(['class', 'pixels', 'area', 'objects', 'xmin', 'ymin', 'xmax', 'ymax'])
+        for value, item in sorted(classes.items()):
+            writer.writerow([value, item['pixels'], item['area'], item['objects']] + list(item['bbox'] or ('', '', '', '')))
+    with open(os.path.join(save_path, name + '_objects.csv'), 'w', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(['id', 'class', 'pixels', 'area', 'xmin', 'ymin', 'xmax', 'ymax'])
+        for k, obj in enumerate(objects):
+            writer.writerow([k, obj['class'], obj['pixels'], obj['area']] + list(obj['bbox']))